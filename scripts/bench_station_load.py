@@ -0,0 +1,98 @@
+"""车站数据冷启动基准：对比解析 station_name.js 与读取预编译快照，
+并测量解析耗时随车站文件大小的变化，以及加载期间事件循环的最长停顿
+
+用法: uv run python scripts/bench_station_load.py
+"""
+
+import asyncio
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "src")))
+
+from mcp_12306.services.station_service import StationService, parse_station_js
+
+STATION_JS = os.path.join(os.path.dirname(__file__), "..", "src", "mcp_12306", "resources", "station_name.js")
+ROUNDS = 5
+SCALES = [1, 2, 4, 8, 16]
+
+
+def scaled_content(content, factor):
+    """把车站JS中的车站记录复制 factor 倍，模拟更大的车站文件"""
+    prefix, data, suffix = content.split("'", 2)
+    return "'".join([prefix, data * factor, suffix])
+
+
+def bench_parse_scaling(content):
+    print(f"{'倍数':>4} {'文件(KiB)':>10} {'车站数':>8} {'解析(ms)':>10} {'us/站':>7}")
+    for factor in SCALES:
+        scaled = scaled_content(content, factor)
+        best = float("inf")
+        for _ in range(ROUNDS):
+            start = time.perf_counter()
+            stations = parse_station_js(scaled)
+            best = min(best, time.perf_counter() - start)
+        size = len(scaled.encode("utf-8")) / 1024
+        print(f"{factor:>4} {size:>10.0f} {len(stations):>8} {best * 1000:>10.1f} {best / len(stations) * 1e6:>7.2f}")
+
+
+async def max_loop_stall(coro):
+    """执行 coro 期间事件循环的最长停顿（毫秒）"""
+    stall = 0.0
+    done = False
+
+    async def ticker():
+        nonlocal stall
+        last = time.perf_counter()
+        while not done:
+            await asyncio.sleep(0.001)
+            now = time.perf_counter()
+            stall = max(stall, now - last)
+            last = now
+
+    task = asyncio.create_task(ticker())
+    await asyncio.sleep(0)
+    await coro
+    done = True
+    await task
+    return stall * 1000
+
+
+async def timed_load(js_path, use_snapshot):
+    best = float("inf")
+    for _ in range(ROUNDS):
+        service = StationService()
+        start = time.perf_counter()
+        await service.load_stations(path=js_path, use_snapshot=use_snapshot)
+        best = min(best, time.perf_counter() - start)
+    return best, len(service.stations)
+
+
+async def main():
+    logging.disable(logging.WARNING)
+    with tempfile.TemporaryDirectory() as tmp:
+        js_path = os.path.join(tmp, "station_name.js")
+        shutil.copy(STATION_JS, js_path)
+        service = StationService()
+        await service.load_stations(path=js_path, use_snapshot=False)
+        snapshot_path = service.save_snapshot(js_path=js_path)
+
+        parse_time, n = await timed_load(js_path, use_snapshot=False)
+        snapshot_time, _ = await timed_load(js_path, use_snapshot=True)
+        print(f"车站数: {n}，快照大小: {os.path.getsize(snapshot_path) / 1024:.0f} KiB")
+        print(f"解析JS并建索引: {parse_time * 1000:8.1f} ms")
+        print(f"读取预编译快照: {snapshot_time * 1000:8.1f} ms")
+        print(f"加速比:         {parse_time / snapshot_time:8.1f} x")
+        stall = await max_loop_stall(StationService().load_stations(path=js_path, use_snapshot=False))
+        print(f"解析期间事件循环最长停顿: {stall:6.1f} ms")
+        print()
+        with open(js_path, encoding="utf-8") as f:
+            bench_parse_scaling(f.read())
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,63 @@
+"""车站查询微基准：验证索引查找与模糊搜索耗时不随车站表规模线性增长
+
+用法: uv run python scripts/bench_station_lookup.py
+"""
+
+import asyncio
+import os
+import random
+import string
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "src")))
+
+from mcp_12306.services.station_service import Station, StationService
+
+SIZES = [1_000, 3_300, 10_000, 50_000, 100_000]
+LOOKUPS = 20_000
+
+
+def make_stations(n):
+    """生成 n 个互不重复的合成车站"""
+    rnd = random.Random(n)
+    stations = []
+    seen = set()
+    while len(stations) < n:
+        code = "".join(rnd.choices(string.ascii_uppercase, k=3)) + str(len(stations))
+        if code in seen:
+            continue
+        seen.add(code)
+        pinyin = "".join(rnd.choices(string.ascii_lowercase, k=8)) + str(len(stations))
+        name = f"站{len(stations)}"
+        stations.append(Station(name, code, pinyin, pinyin[:3], str(len(stations)), city=f"城{len(stations) % 500}"))
+    return stations
+
+
+async def bench(fn, keys):
+    start = time.perf_counter()
+    for key in keys:
+        await fn(key)
+    return (time.perf_counter() - start) / len(keys) * 1e9
+
+
+async def main():
+    print(f"{'stations':>10} {'by_name(ns)':>12} {'by_code(ns)':>12} {'get_code(ns)':>13} {'search(us)':>11}")
+    for n in SIZES:
+        service = StationService()
+        service.set_stations(make_stations(n))
+        rnd = random.Random(0)
+        sample = [service.stations[rnd.randrange(n)] for _ in range(LOOKUPS)]
+        names = [s.name for s in sample]
+        codes = [s.code for s in sample]
+        t_name = await bench(service.get_station_by_name, names)
+        t_code = await bench(service.get_station_by_code, codes)
+        t_get_code = await bench(service.get_station_code, names)
+        # 模糊搜索：拼音中段子串，模拟输入联想
+        fragments = [s.pinyin[2:6] for s in sample[:2_000]]
+        t_search = await bench(service.search_stations, fragments) / 1000
+        print(f"{n:>10} {t_name:>12.0f} {t_code:>12.0f} {t_get_code:>13.0f} {t_search:>11.1f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
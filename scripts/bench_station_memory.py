@@ -0,0 +1,75 @@
+"""车站表内存基准：对比 __dict__ 车站对象与 __slots__ 紧凑车站对象
+
+用法: uv run python scripts/bench_station_memory.py
+"""
+
+import asyncio
+import gc
+import logging
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "src")))
+
+from mcp_12306.services.station_service import Station, StationService
+
+STATION_JS = os.path.join(os.path.dirname(__file__), "..", "src", "mcp_12306", "resources", "station_name.js")
+
+
+class DictStation:
+    """优化前的车站对象（带实例 __dict__，字符串不驻留）"""
+
+    def __init__(self, name, code, pinyin, py_short, num, city=None):
+        self.name = name
+        self.code = code
+        self.pinyin = pinyin
+        self.py_short = py_short
+        self.num = num
+        self.city = city
+
+
+def measure(build):
+    """返回 build() 结果常驻占用的字节数"""
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = build()
+    gc.collect()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, after - before
+
+
+def main():
+    logging.disable(logging.WARNING)
+    service = StationService()
+    asyncio.run(service.load_stations(path=STATION_JS))
+    # 与解析结果相互独立的字段副本，模拟逐行解析时新建的字符串
+    rows = [
+        tuple("".join(v) if v else v for v in (s.name, s.code, s.pinyin, s.py_short, s.num, s.city))
+        for s in service.stations
+    ]
+    n = len(rows)
+
+    def copies():
+        return [tuple("".join(v) if v else v for v in row) for row in rows]
+
+    before, before_bytes = measure(lambda: [DictStation(*row) for row in copies()])
+    after, after_bytes = measure(lambda: [Station(*row) for row in copies()])
+    def indexed():
+        svc = StationService()
+        svc.set_stations(after)
+        return svc
+
+    _, index_bytes = measure(indexed)
+
+    print(f"车站数: {n}")
+    print(f"{'__dict__ 对象':<16} {before_bytes / 1024:>10.1f} KiB  ({before_bytes / n:>6.0f} B/站)")
+    print(f"{'__slots__ 对象':<16} {after_bytes / 1024:>10.1f} KiB  ({after_bytes / n:>6.0f} B/站)")
+    print(f"{'节省':<18} {(1 - after_bytes / before_bytes) * 100:>9.1f} %")
+    print(f"{'索引(查找+搜索)':<14} {index_bytes / 1024:>10.1f} KiB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""车票模型构造基准：对比逐行 pydantic 校验构造 Ticket、逐行 model_construct、整批 TypeAdapter 校验
+与只解码为轻量记录的每行耗时
+
+用法: uv run python scripts/bench_ticket_models.py
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "src")))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_ticket_rows import make_rows
+from mcp_12306.models.ticket import Ticket, TicketQuery, TicketSearchResult
+from mcp_12306.services.ticket_rows import decode_rows
+from mcp_12306.services.ticket_service import TicketService
+
+SIZES = [1_000, 10_000, 50_000]
+ROUNDS = 3
+QUERY = TicketQuery(from_station="北京", to_station="上海", train_date="2025-01-01")
+
+
+def validated(rows):
+    """旧实现：每行构造并校验完整的 Ticket，再校验一遍 TicketSearchResult"""
+    tickets = []
+    for row in decode_rows(rows):
+        tickets.append(Ticket(
+            train_no=row.train_code, from_station_name=row.from_telecode, to_station_name=row.to_telecode,
+            start_time=row.start_time, arrive_time=row.arrive_time, duration=row.duration,
+            can_web_buy=row.can_web_buy,
+            business_seat_price=None, first_class_price=None, second_class_price=None,
+            soft_sleeper_price=None, hard_sleeper_price=None, soft_seat_price=None,
+            hard_seat_price=None, no_seat_price=None,
+            business_seat_num=row.business_seat_num or None, first_class_num=row.first_class_num or None,
+            second_class_num=row.second_class_num or None, soft_sleeper_num=row.soft_sleeper_num or None,
+            hard_sleeper_num=row.hard_sleeper_num or None, soft_seat_num=row.soft_seat_num or None,
+            hard_seat_num=row.hard_seat_num or None, no_seat_num=row.no_seat_num or None,
+        ))
+    return TicketSearchResult(tickets=tickets, query_info=QUERY, total=len(tickets))
+
+
+def constructed(rows):
+    """逐行 model_construct（pydantic 2 中为纯 Python 实现，反而更慢）"""
+    tickets = [
+        Ticket.model_construct(
+            train_no=row.train_code, from_station_name=row.from_telecode, to_station_name=row.to_telecode,
+            start_time=row.start_time, arrive_time=row.arrive_time, duration=row.duration,
+            can_web_buy=row.can_web_buy,
+            business_seat_num=row.business_seat_num or None, first_class_num=row.first_class_num or None,
+            second_class_num=row.second_class_num or None, soft_sleeper_num=row.soft_sleeper_num or None,
+            hard_sleeper_num=row.hard_sleeper_num or None, soft_seat_num=row.soft_seat_num or None,
+            hard_seat_num=row.hard_seat_num or None, no_seat_num=row.no_seat_num or None,
+        )
+        for row in decode_rows(rows)
+    ]
+    return TicketSearchResult.model_construct(tickets=tickets, query_info=QUERY, total=len(tickets))
+
+
+def batched(rows):
+    """新的对外模型路径（TicketService.query_tickets）：整批 TypeAdapter 校验"""
+    tickets = TicketService._to_tickets(decode_rows(rows))
+    return TicketSearchResult.model_construct(tickets=tickets, query_info=QUERY, total=len(tickets))
+
+
+def bench(fn, rows):
+    best = float("inf")
+    for _ in range(ROUNDS):
+        start = time.perf_counter()
+        fn(rows)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    print("每行耗时（us），含解码")
+    print(f"{'行数':>7} {'逐行校验(旧)':>12} {'model_construct':>16} {'整批校验(新)':>12} {'轻量记录':>10}")
+    for size in SIZES:
+        rows = make_rows(size)
+        costs = [bench(fn, rows) / size * 1e6 for fn in (validated, constructed, batched, decode_rows)]
+        print(f"{size:>7} {costs[0]:>12.2f} {costs[1]:>16.2f} {costs[2]:>12.2f} {costs[3]:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""余票行解码基准：对比各处分别 split 解析与共享单次解码 decode_rows 的耗时
+
+用法: uv run python scripts/bench_ticket_rows.py
+"""
+
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "src")))
+
+from mcp_12306.services.ticket_rows import decode_rows
+
+ROWS = 10_000
+ROUNDS = 5
+# 真实 queryG 行约 56 个字段
+FIELDS = 56
+
+
+def make_rows(n):
+    """生成 n 行合成余票数据"""
+    rnd = random.Random(n)
+    rows = []
+    for i in range(n):
+        parts = [""] * FIELDS
+        parts[0] = "x" * 200  # secretStr
+        parts[1] = "预订"
+        parts[2] = f"24000G{i:06d}"
+        parts[3] = f"G{i}"
+        parts[4:8] = ["VNP", "AOH", "VNP", "AOH"]
+        parts[8:12] = [f"{rnd.randrange(24):02d}:00", "12:00", "04:00", "Y"]
+        for index in (21, 23, 24, 26, 28, 29, 30, 31, 32, 33):
+            parts[index] = rnd.choice(["", "有", "无", str(rnd.randrange(20))])
+        rows.append("|".join(parts))
+    return rows
+
+
+def legacy_parse(rows):
+    """旧实现：渲染时按字典解析一次，再为站码 split 一次，记录车次编号时再 split 一次"""
+    tickets = []
+    for row in rows:
+        parts = row.split("|")
+        if len(parts) < 35:
+            continue
+        tickets.append({
+            "train_no": parts[3], "start_time": parts[8], "arrive_time": parts[9], "duration": parts[10],
+            "business_seat_num": parts[32] or "", "first_class_num": parts[31] or "",
+            "second_class_num": parts[30] or "", "advanced_soft_sleeper_num": parts[21] or "",
+            "soft_sleeper_num": parts[23] or "", "dongwo_num": parts[33] or "",
+            "hard_sleeper_num": parts[28] or "", "soft_seat_num": parts[24] or "",
+            "hard_seat_num": parts[29] or "", "no_seat_num": parts[26] or "",
+        })
+    codes = []
+    for row in rows:
+        parts = row.split("|")
+        codes.append((parts[6], parts[7]))
+    train_nos = []
+    for row in rows:
+        parts = row.split("|")
+        train_nos.append((parts[3].strip(), parts[2].strip(), parts[6], parts[7]))
+    return tickets, codes, train_nos
+
+
+def shared_decode(rows):
+    """新实现：解码一次，渲染、站码与车次编号记录共用同一批记录"""
+    decoded = decode_rows(rows)
+    codes = [(row.from_telecode, row.to_telecode) for row in decoded]
+    train_nos = [(row.train_code.strip(), row.train_no.strip(), row.from_telecode, row.to_telecode)
+                 for row in decoded]
+    return decoded, codes, train_nos
+
+
+def bench(fn, rows):
+    best = float("inf")
+    for _ in range(ROUNDS):
+        start = time.perf_counter()
+        fn(rows)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    rows = make_rows(ROWS)
+    decode_only = bench(decode_rows, rows)
+    legacy = bench(legacy_parse, rows)
+    shared = bench(shared_decode, rows)
+    print(f"{ROWS} 行合成余票数据，取 {ROUNDS} 轮最快值")
+    print(f"{'实现':<16} {'总耗时(ms)':>10} {'us/行':>8}")
+    for name, seconds in (("旧: 三次 split", legacy), ("新: 单次解码", shared), ("decode_rows", decode_only)):
+        print(f"{name:<16} {seconds * 1000:>10.1f} {seconds / ROWS * 1e6:>8.2f}")
+    print(f"加速比: {legacy / shared:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,208 @@
+"""本地模拟12306服务：用于联调与可复现的故障演练（延迟、反爬拦截、5xx）
+
+用法:
+    uv run python scripts/fake_12306.py [--port 9306] [--latency 0.05] [--block-every 5] ...
+    UPSTREAM_BASE_URL=http://127.0.0.1:9306 uv run python scripts/start_server.py
+
+模拟 leftTicket/init、leftTicket/queryG（余票与中转）、czxx/queryByTrainNo，返回按站码确定生成的数据。
+故障按每个接口的请求序号注入（第 N 次请求起的行为固定），同一配置下结果可重复：
+    --fail-first N     每个接口前 N 次请求返回 502
+    --block-first N    每个接口前 N 次请求 302 跳转到 error.html
+    --block-every N    每第 N 次请求被拦截
+    --error-every N    每第 N 次请求返回 502
+    --slow-every N     每第 N 次请求额外等待 --slow-latency 秒
+运行中可 POST /_fake/config 修改上述参数（JSON，键名用下划线），GET /_fake/stats 查看各接口请求数，
+POST /_fake/reset 清零请求序号。
+"""
+
+import argparse
+import asyncio
+import collections
+import zlib
+from typing import Any, Dict, List
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import HTMLResponse, JSONResponse, RedirectResponse
+
+FAULTS: Dict[str, Any] = {
+    "latency": 0.0,
+    "slow_every": 0,
+    "slow_latency": 3.0,
+    "fail_first": 0,
+    "block_first": 0,
+    "block_every": 0,
+    "error_every": 0,
+    "transfer_plans": 23,
+}
+CALLS: Dict[str, int] = collections.Counter()
+OUTCOMES: Dict[str, int] = collections.Counter()
+TRAIN_PREFIXES = "GDCZTK"
+
+app = FastAPI(title="fake 12306")
+
+
+def ticket_rows(from_code: str, to_code: str, train_date: str) -> List[str]:
+    """按站码与日期确定生成的 queryG 余票行（| 分隔，字段位置与官方一致）"""
+    seed = zlib.crc32(f"{from_code}{to_code}{train_date}".encode())
+    rows = []
+    for i in range(8):
+        prefix = TRAIN_PREFIXES[(seed + i) % len(TRAIN_PREFIXES)]
+        code = f"{prefix}{(seed >> 4) % 900 + i * 7 + 1}"
+        hour = (6 + i * 2 + seed % 2) % 24
+        parts = [""] * 40
+        parts[0] = "secret"
+        parts[1] = "预订"
+        parts[2] = f"24{code:0>8}0{i}"[:12]
+        parts[3] = code
+        parts[4] = parts[6] = from_code
+        parts[5] = parts[7] = to_code
+        parts[8] = f"{hour:02d}:{(seed + i * 13) % 60:02d}"
+        parts[9] = f"{(hour + 4) % 24:02d}:{(seed + i * 29) % 60:02d}"
+        parts[10] = f"04:{(i * 16) % 60:02d}"
+        parts[11] = "Y"
+        parts[13] = train_date.replace("-", "")
+        for index, value in ((30, "有"), (31, str((seed + i) % 20)), (32, "无"), (26, "有"), (23, "候补")):
+            parts[index] = value
+        rows.append("|".join(parts))
+    return rows
+
+
+def route_stations(train_no: str) -> List[Dict[str, str]]:
+    seed = zlib.crc32(train_no.encode())
+    count = 3 + seed % 5
+    stations = []
+    for i in range(count):
+        hour = (7 + i) % 24
+        stations.append({
+            "station_no": f"{i + 1:02d}",
+            "station_name": f"模拟站{(seed + i) % 97}",
+            "arrive_time": "----" if i == 0 else f"{hour:02d}:00",
+            "start_time": "----" if i == count - 1 else f"{hour:02d}:05",
+            "stopover_time": "----" if i in (0, count - 1) else "5分钟",
+        })
+    return stations
+
+
+def transfer_plans(result_index: int) -> List[Dict[str, Any]]:
+    total = FAULTS["transfer_plans"]
+    plans = []
+    for i in range(result_index, min(result_index + 10, total)):
+        plans.append({
+            "middle_station_name": f"中转站{i}",
+            "all_lishi": "5小时",
+            "wait_time": "30分",
+            "fullList": [
+                {"station_train_code": f"G{100 + i}", "from_station_name": "出发站", "to_station_name": f"中转站{i}",
+                 "start_time": "08:00", "arrive_time": "11:00", "lishi": "03:00", "ze_num": "有"},
+                {"station_train_code": f"D{200 + i}", "from_station_name": f"中转站{i}", "to_station_name": "到达站",
+                 "start_time": "11:30", "arrive_time": "13:00", "lishi": "01:30", "ze_num": "5"},
+            ],
+        })
+    return plans
+
+
+async def inject_fault(endpoint: str):
+    """按该接口的请求序号决定本次行为，返回需要直接返回的故障响应（正常时返回 None）"""
+    CALLS[endpoint] += 1
+    n = CALLS[endpoint]
+    delay = FAULTS["latency"]
+    if FAULTS["slow_every"] and n % FAULTS["slow_every"] == 0:
+        delay += FAULTS["slow_latency"]
+    if delay:
+        await asyncio.sleep(delay)
+    if n <= FAULTS["fail_first"] or (FAULTS["error_every"] and n % FAULTS["error_every"] == 0):
+        OUTCOMES[f"{endpoint}:error"] += 1
+        return JSONResponse({"status": False, "messages": ["模拟服务异常"]}, status_code=502)
+    if n <= FAULTS["block_first"] or (FAULTS["block_every"] and n % FAULTS["block_every"] == 0):
+        OUTCOMES[f"{endpoint}:blocked"] += 1
+        return RedirectResponse("/otn/view/error.html", status_code=302)
+    OUTCOMES[f"{endpoint}:ok"] += 1
+    return None
+
+
+@app.get("/otn/leftTicket/init")
+async def init():
+    response = HTMLResponse("<html>fake 12306</html>")
+    response.set_cookie("JSESSIONID", f"FAKE{CALLS['init']}", path="/")
+    CALLS["init"] += 1
+    return response
+
+
+@app.get("/otn/view/error.html")
+async def error_page():
+    return HTMLResponse("<html>网络可能存在问题，请您重试一下！</html>")
+
+
+@app.get("/otn/leftTicket/queryG")
+async def query_g(request: Request):
+    q = request.query_params
+    if "result_index" in q:
+        fault = await inject_fault("transfer")
+        if fault is not None:
+            return fault
+        return {"status": True, "data": {"middleList": transfer_plans(int(q["result_index"]))}}
+    fault = await inject_fault("queryG")
+    if fault is not None:
+        return fault
+    from_code = q.get("leftTicketDTO.from_station", "")
+    to_code = q.get("leftTicketDTO.to_station", "")
+    train_date = q.get("leftTicketDTO.train_date", "")
+    return {
+        "status": True,
+        "httpstatus": 200,
+        "data": {"result": ticket_rows(from_code, to_code, train_date), "flag": "1", "map": {}},
+    }
+
+
+@app.get("/otn/czxx/queryByTrainNo")
+async def query_by_train_no(request: Request):
+    fault = await inject_fault("queryByTrainNo")
+    if fault is not None:
+        return fault
+    return {"status": True, "data": {"data": route_stations(request.query_params.get("train_no", ""))}}
+
+
+@app.post("/_fake/config")
+async def update_config(request: Request):
+    changes = await request.json()
+    unknown = set(changes) - set(FAULTS)
+    if unknown:
+        return JSONResponse({"error": f"未知参数: {sorted(unknown)}"}, status_code=400)
+    FAULTS.update(changes)
+    return FAULTS
+
+
+@app.get("/_fake/stats")
+async def stats():
+    return {"calls": dict(CALLS), "outcomes": dict(OUTCOMES), "faults": FAULTS}
+
+
+@app.post("/_fake/reset")
+async def reset():
+    CALLS.clear()
+    OUTCOMES.clear()
+    return {"ok": True}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地模拟12306服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9306)
+    parser.add_argument("--latency", type=float, default=0.0, help="每个请求的基础延迟（秒）")
+    parser.add_argument("--slow-every", type=int, default=0, help="每第 N 次请求变慢")
+    parser.add_argument("--slow-latency", type=float, default=3.0, help="慢请求额外延迟（秒）")
+    parser.add_argument("--fail-first", type=int, default=0, help="每个接口前 N 次请求返回 502")
+    parser.add_argument("--block-first", type=int, default=0, help="每个接口前 N 次请求被拦截")
+    parser.add_argument("--block-every", type=int, default=0, help="每第 N 次请求被拦截")
+    parser.add_argument("--error-every", type=int, default=0, help="每第 N 次请求返回 502")
+    parser.add_argument("--transfer-plans", type=int, default=23, help="中转方案总数")
+    args = parser.parse_args()
+    for key in FAULTS:
+        FAULTS[key] = getattr(args, key)
+    print(f"🚄 模拟12306服务: http://{args.host}:{args.port}  故障配置: {FAULTS}")
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
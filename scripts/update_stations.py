@@ -6,10 +6,11 @@ import sys
 import logging
 from datetime import datetime
 
-# 兼容包路径，自动把项目根目录加入PYTHONPATH
-sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+# 兼容包路径，自动把 src 目录加入PYTHONPATH
+# （快照按模块路径序列化车站对象，必须与服务端一样以 mcp_12306 包名导入）
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "src")))
 
-from src.mcp_12306.services.station_service import StationService
+from mcp_12306.services.station_service import StationService
 
 STATION_JS_URL = "https://kyfw.12306.cn/otn/resources/js/framework/station_name.js"
 LOCAL_PATH = "src/mcp_12306/resources/station_name.js"
@@ -24,30 +25,39 @@ async def fetch_station_js(url=STATION_JS_URL, save_path=LOCAL_PATH):
                 await f.write(text)
     return save_path
 
-async def update_stations():
+async def update_stations(snapshot_only=False):
     print("🚀 12306车站信息更新工具")
     print("=" * 50)
     print(f"🌐 数据源: {STATION_JS_URL}")
     print(f"⏰ 更新时间: {datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')} (UTC)")
     print(f"👤 操作用户: {os.getenv('USERNAME') or os.getenv('USER') or 'unknown'}")
     print("=" * 50)
-    try:
-        print("📡 正在连接12306官网...")
-        await fetch_station_js()
-        print("✅ 已成功获取12306最新JS数据!")
-    except Exception as e:
-        print(f"❌ 获取失败: {e}")
-        print("🔄 使用本地 station_name.js 文件继续解析...")
+    if snapshot_only:
+        print("📦 仅根据本地 station_name.js 生成快照，跳过下载")
         if not os.path.exists(LOCAL_PATH):
             print("❌ 本地 station_name.js 文件不存在，无法继续。")
             sys.exit(1)
+    else:
+        try:
+            print("📡 正在连接12306官网...")
+            await fetch_station_js()
+            print("✅ 已成功获取12306最新JS数据!")
+        except Exception as e:
+            print(f"❌ 获取失败: {e}")
+            print("🔄 使用本地 station_name.js 文件继续解析...")
+            if not os.path.exists(LOCAL_PATH):
+                print("❌ 本地 station_name.js 文件不存在，无法继续。")
+                sys.exit(1)
     print("🔍 正在解析车站数据...")
     service = StationService()
-    await service.load_stations(path=LOCAL_PATH)
+    # 不读取旧快照，始终从JS重新解析
+    await service.load_stations(path=LOCAL_PATH, use_snapshot=False)
     print(f"✅ 共加载 {len(service.stations)} 个车站，示例：")
     for station in service.stations[:10]:
         print(f"    - {station.name}（{station.code}，{station.city}）")
+    snapshot_path = service.save_snapshot(js_path=LOCAL_PATH)
+    print(f"📦 已生成预编译快照: {snapshot_path}")
     print("✨ 车站信息更新完成！")
 
 if __name__ == "__main__":
-    asyncio.run(update_stations())
\ No newline at end of file
+    asyncio.run(update_stations(snapshot_only="--snapshot-only" in sys.argv[1:]))
\ No newline at end of file
@@ -0,0 +1,38 @@
+"""经停站预热脚本：让运行中的服务预取最近余票查询中出现过的车次的经停站
+
+用法: uv run python scripts/warm_timetables.py [--limit N] [--url http://127.0.0.1:8000]
+配置了 ADMIN_TOKEN 时自动带上请求头 X-Admin-Token。
+"""
+
+import argparse
+import sys
+from pathlib import Path
+
+import httpx
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+from mcp_12306.utils.config import get_settings
+
+
+def main():
+    settings = get_settings()
+    parser = argparse.ArgumentParser(description="预热经停站时刻表缓存")
+    parser.add_argument("--url", default=f"http://127.0.0.1:{settings.server_port}", help="服务地址")
+    parser.add_argument("--limit", type=int, default=None, help="最多预取的车次数")
+    args = parser.parse_args()
+
+    headers = {"X-Admin-Token": settings.admin_token} if settings.admin_token else {}
+    params = {"limit": args.limit} if args.limit else None
+    try:
+        resp = httpx.post(f"{args.url}/admin/warm-timetables", headers=headers, params=params, timeout=300)
+        resp.raise_for_status()
+    except httpx.HTTPError as e:
+        print(f"❌ 预热失败: {e}")
+        sys.exit(1)
+    result = resp.json()
+    print(f"✅ 预热完成: 候选 {result['candidates']} 个车次，成功 {result['fetched']}，失败 {result['failed']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,14 +2,15 @@ import asyncio
 import json
 import logging
 import random
+import re
 import httpx
 from datetime import datetime, date
 import datetime as dtmod
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Optional, Tuple
 import uuid
 import pytz
 
-from fastapi import FastAPI, Request, HTTPException
+from fastapi import FastAPI, Request, HTTPException, Header
 from fastapi.responses import StreamingResponse, JSONResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
 import uvicorn
@@ -17,9 +18,16 @@ import uvicorn
 from .models.ticket import TicketQuery
 from .services.station_service import StationService
 from .services.ticket_service import TicketService
-from .services.http_client import HttpClient
+from .services.http_client import HttpClient, UpstreamError
+from .services.session_pool import SessionPool
+from .services.station_refresher import StationRefresher
+from .services.ticket_rows import SEAT_CLASSES, SORT_FIELDS, TicketFilter, TicketRow, decode_rows, seat_counts
+from .services.train_resolver import train_codes_of
+from .services.cache_backend import create_cache_backend
+from .services.session_store import SessionJanitor, create_session_store
 from .utils.config import get_settings
 from .utils.date_utils import validate_date
+from .utils.json_utils import FastJSONResponse, dumps
 
 settings = get_settings()
 
@@ -29,24 +37,168 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 station_service = StationService()
-ticket_service = TicketService()
+station_refresher = StationRefresher(station_service)
+# 进程共享的上游连接池客户端，启动时创建、关闭时释放
 http_client = HttpClient()
-# 确保票务服务使用同一个车站服务实例
-ticket_service.station_service = station_service
+# 预热cookie会话池，工具调用借用已完成init的会话
+session_pool = SessionPool(http_client)
+# 确保票务服务使用同一个车站服务实例与连接池
+# 缓存后端（CACHE_BACKEND=sqlite 时多个 worker 共享余票、车次解析与经停站缓存）
+cache_backend = create_cache_backend()
+ticket_service = TicketService(http_client=http_client, station_service=station_service,
+                               session_pool=session_pool, cache_backend=cache_backend)
 
 # MCP Protocol Version - Support 2025-03-26 Streamable HTTP transport
 MCP_PROTOCOL_VERSION = "2025-03-26"  # Updated to latest protocol version
 SERVER_NAME = "12306-mcp-server"
 SERVER_VERSION = "1.0.0"
 
-USER_AGENT = (
-    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
-    "AppleWebKit/537.36 (KHTML, like Gecko) "
-    "Chrome/123.0.0.0 Safari/537.36"
+# MCP 会话存储（MCP_SESSION_STORE=sqlite 时多个 worker 共享会话）
+session_store = create_session_store()
+session_janitor = SessionJanitor(session_store)
+
+# 车票类工具的可选输出格式参数
+OUTPUT_FORMAT_PROPERTY = {
+    "type": "string", "title": "输出格式",
+    "description": "markdown=文本（默认）；json=结构化记录，放在 structuredContent 中，content 中附同样内容的 JSON 文本",
+    "enum": ["markdown", "json"], "default": "markdown"
+}
+
+# 余票查询的可选筛选、排序与截断参数，在渲染前作用于解析后的车次
+TICKET_FILTER_PROPERTIES = {
+    "train_types": {
+        "type": "array", "title": "车次类型（可选）", "description": "车次首字母，如 [\"G\", \"D\"]，任一匹配即保留",
+        "items": {"type": "string", "pattern": "^[A-Za-z]$"}
+    },
+    "depart_after": {"type": "string", "title": "最早出发时间（可选）", "description": "HH:MM，含该时刻", "pattern": "^\\d{2}:\\d{2}$"},
+    "depart_before": {"type": "string", "title": "最晚出发时间（可选）", "description": "HH:MM，含该时刻", "pattern": "^\\d{2}:\\d{2}$"},
+    "arrive_after": {"type": "string", "title": "最早到达时间（可选）", "description": "HH:MM，含该时刻；按出发当天计，次日到达晚于当天任何时刻", "pattern": "^\\d{2}:\\d{2}$"},
+    "arrive_before": {"type": "string", "title": "最晚到达时间（可选）", "description": "HH:MM，含该时刻；按出发当天计，次日到达晚于当天任何时刻", "pattern": "^\\d{2}:\\d{2}$"},
+    "seat_classes": {
+        "type": "array", "title": "有票席别（可选）", "description": "只保留其中任一席别有票的车次",
+        "items": {"type": "string", "enum": [key for key, _ in SEAT_CLASSES] + [label for _, label in SEAT_CLASSES]}
+    },
+    "sort_by": {"type": "string", "title": "排序（可选）", "description": "start_time=按出发时间，arrive_time=按到达时间，duration=按历时，默认保持12306顺序", "enum": list(SORT_FIELDS)},
+    "limit": {"type": "integer", "title": "最多返回车次数（可选）", "description": "筛选排序后每组最多返回的车次数", "minimum": 1}
+}
+
+# 车票类工具成功结果中 structuredContent 的结构（markdown 与 json 输出都附带；错误结果 isError=true，只有文本 content）
+SEATS_SCHEMA = {
+    "type": "object", "description": "在售席别的余票（\"有\"、数字、\"无\" 等），不售的席别不出现",
+    "properties": {key: {"type": "string", "title": label} for key, label in SEAT_CLASSES},
+    "additionalProperties": False
+}
+TRAIN_RECORD_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "train_code": {"type": "string", "title": "车次"},
+        "train_no": {"type": "string", "title": "列车编号"},
+        "from_station": {"type": "string", "title": "出发站"},
+        "from_telecode": {"type": "string", "title": "出发站三字码"},
+        "to_station": {"type": "string", "title": "到达站"},
+        "to_telecode": {"type": "string", "title": "到达站三字码"},
+        "start_time": {"type": "string", "title": "出发时间"},
+        "arrive_time": {"type": "string", "title": "到达时间"},
+        "duration": {"type": "string", "title": "历时"},
+        "can_web_buy": {"type": "boolean", "title": "是否可网购"},
+        "seats": SEATS_SCHEMA
+    },
+    "required": ["train_code", "train_no", "from_station", "from_telecode", "to_station", "to_telecode",
+                 "start_time", "arrive_time", "duration", "can_web_buy", "seats"]
+}
+TICKET_GROUP_PROPERTIES = {
+    "from_station": {"type": "string", "title": "出发站"},
+    "to_station": {"type": "string", "title": "到达站"},
+    "train_date": {"type": "string", "title": "出发日期"},
+    "total": {"type": "integer", "title": "返回车次数"},
+    "unfiltered_total": {"type": "integer", "title": "筛选前车次数"},
+    "trains": {"type": "array", "title": "车次列表", "items": TRAIN_RECORD_SCHEMA}
+}
+TICKETS_OUTPUT_SCHEMA = {
+    "type": "object", "title": "余票查询结果",
+    "properties": TICKET_GROUP_PROPERTIES,
+    "required": list(TICKET_GROUP_PROPERTIES)
+}
+TICKETS_BATCH_OUTPUT_SCHEMA = {
+    "type": "object", "title": "批量余票查询结果", "description": "groups 与查询组合一一对应",
+    "properties": {
+        "total_queries": {"type": "integer", "title": "查询组数"},
+        "succeeded": {"type": "integer", "title": "成功组数"},
+        "failed": {"type": "integer", "title": "失败组数"},
+        "groups": {
+            "type": "array", "title": "各组结果",
+            "items": {
+                "type": "object",
+                "properties": {
+                    **TICKET_GROUP_PROPERTIES,
+                    "error": {"type": ["string", "null"], "title": "失败原因", "description": "成功时为 null"}
+                },
+                "required": list(TICKET_GROUP_PROPERTIES) + ["error"]
+            }
+        }
+    },
+    "required": ["total_queries", "succeeded", "failed", "groups"]
+}
+
+# 中转方案各段的余票字段：(12306字段, 记录中的键名, 中文名)，按官方顺序输出
+TRANSFER_SEAT_FIELDS = (
+    ("swz_num", "business_seat", "商务座"),
+    ("tz_num", "special_seat", "特等座"),
+    ("zy_num", "first_class", "一等座"),
+    ("ze_num", "second_class", "二等座"),
+    ("gr_num", "advanced_soft_sleeper", "高级软卧"),
+    ("rw_num", "soft_sleeper", "软卧/动卧"),
+    ("rz_num", "soft_seat", "一等卧/软座"),
+    ("yw_num", "hard_sleeper", "硬卧"),
+    ("yz_num", "hard_seat", "硬座"),
+    ("wz_num", "no_seat", "无座"),
 )
+TRANSFER_SEAT_LABELS = {key: label for _, key, label in TRANSFER_SEAT_FIELDS}
 
-# Connected clients for session management
-connected_clients: Dict[str, Dict] = {}
+TRANSFER_OUTPUT_SCHEMA = {
+    "type": "object", "title": "中转查询结果",
+    "properties": {
+        "from_station": {"type": "string", "title": "出发站"},
+        "to_station": {"type": "string", "title": "到达站"},
+        "train_date": {"type": "string", "title": "出发日期"},
+        "total": {"type": "integer", "title": "方案数"},
+        "plans": {
+            "type": "array", "title": "中转方案",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "middle_station": {"type": "string", "title": "中转站"},
+                    "wait_time": {"type": "string", "title": "换乘等候时间"},
+                    "all_lishi": {"type": "string", "title": "总历时"},
+                    "segments": {
+                        "type": "array", "title": "各段车次",
+                        "items": {
+                            "type": "object",
+                            "properties": {
+                                "train_code": {"type": "string", "title": "车次"},
+                                "from_station": {"type": "string", "title": "出发站"},
+                                "to_station": {"type": "string", "title": "到达站"},
+                                "start_time": {"type": "string", "title": "出发时间"},
+                                "arrive_time": {"type": "string", "title": "到达时间"},
+                                "duration": {"type": "string", "title": "历时"},
+                                "seats": {
+                                    "type": "object", "description": "12306 返回的各席别余票，未返回的席别不出现",
+                                    "properties": {key: {"type": "string", "title": label}
+                                                   for _, key, label in TRANSFER_SEAT_FIELDS},
+                                    "additionalProperties": False
+                                }
+                            },
+                            "required": ["train_code", "from_station", "to_station", "start_time",
+                                         "arrive_time", "duration", "seats"]
+                        }
+                    }
+                },
+                "required": ["middle_station", "wait_time", "all_lishi", "segments"]
+            }
+        }
+    },
+    "required": ["from_station", "to_station", "train_date", "total", "plans"]
+}
 
 # MCP Tools Definition according to spec
 MCP_TOOLS = [
@@ -61,11 +213,49 @@ MCP_TOOLS = [
             "properties": {
                 "from_station": {"type": "string", "title": "出发站", "description": "出发车站名称，例如：北京、上海、广州", "minLength": 1},
                 "to_station": {"type": "string", "title": "到达站", "description": "到达车站名称，例如：北京、上海、广州", "minLength": 1},
-                "train_date": {"type": "string", "title": "出发日期", "description": "出发日期，格式：YYYY-MM-DD", "pattern": "^\\d{4}-\\d{2}-\\d{2}$"}
+                "train_date": {"type": "string", "title": "出发日期", "description": "出发日期，格式：YYYY-MM-DD", "pattern": "^\\d{4}-\\d{2}-\\d{2}$"},
+                "format": OUTPUT_FORMAT_PROPERTY,
+                **TICKET_FILTER_PROPERTIES
             },
             "required": ["from_station", "to_station", "train_date"],
             "additionalProperties": False
-        }
+        },
+        "outputSchema": TICKETS_OUTPUT_SCHEMA
+    },
+    {
+        "name": "query-tickets-batch",
+        "description": "批量余票查询。一次查询多个日期和/或多组出发到达站（如“本周末北京到上海还有票吗”），各组并发查询，按组返回车次与余票，单组失败不影响其他组。",
+        "inputSchema": {
+            "$schema": "http://json-schema.org/draft-07/schema#",
+            "type": "object",
+            "title": "批量车票查询参数",
+            "description": "日期列表与站对列表两两组合，每个组合为一组查询",
+            "properties": {
+                "train_dates": {
+                    "type": "array", "title": "出发日期列表", "description": "出发日期，格式：YYYY-MM-DD",
+                    "items": {"type": "string", "pattern": "^\\d{4}-\\d{2}-\\d{2}$"}, "minItems": 1
+                },
+                "from_station": {"type": "string", "title": "出发站", "description": "未提供 pairs 时使用"},
+                "to_station": {"type": "string", "title": "到达站", "description": "未提供 pairs 时使用"},
+                "pairs": {
+                    "type": "array", "title": "站对列表（可选）", "description": "多组出发站/到达站，支持中文名、三字码",
+                    "items": {
+                        "type": "object",
+                        "properties": {
+                            "from_station": {"type": "string", "title": "出发站", "minLength": 1},
+                            "to_station": {"type": "string", "title": "到达站", "minLength": 1}
+                        },
+                        "required": ["from_station", "to_station"],
+                        "additionalProperties": False
+                    }
+                },
+                "format": OUTPUT_FORMAT_PROPERTY,
+                **TICKET_FILTER_PROPERTIES
+            },
+            "required": ["train_dates"],
+            "additionalProperties": False
+        },
+        "outputSchema": TICKETS_BATCH_OUTPUT_SCHEMA
     },
     {
         "name": "search-stations",
@@ -97,11 +287,14 @@ MCP_TOOLS = [
                 "train_date": {"type": "string", "title": "出发日期", "pattern": "^\\d{4}-\\d{2}-\\d{2}$"},
                 "middle_station": {"type": "string", "title": "中转站（可选）", "description": "指定中转站名称或三字码，可选"},
                 "isShowWZ": {"type": "string", "title": "是否显示无座车次（Y/N）", "description": "Y=显示无座车次，N=不显示，默认N", "default": "N"},
-                "purpose_codes": {"type": "string", "title": "乘客类型（00=普通，0X=学生）", "description": "00为普通，0X为学生，默认00"}
+                "purpose_codes": {"type": "string", "title": "乘客类型（00=普通，0X=学生）", "description": "00为普通，0X为学生，默认00"},
+                "max_plans": {"type": "integer", "title": "最多返回方案数（可选）", "description": "凑够该数量即停止分页，默认返回全部方案", "minimum": 1},
+                "format": OUTPUT_FORMAT_PROPERTY
             },
             "required": ["from_station", "to_station", "train_date"],
             "additionalProperties": False
-        }
+        },
+        "outputSchema": TRANSFER_OUTPUT_SCHEMA
     },
     {
         "name": "get-train-route-stations",
@@ -179,7 +372,7 @@ async def root():
         "transport": "Streamable HTTP (2025-03-26)",
         "stations_loaded": len(station_service.stations),
         "tools": [tool["name"] for tool in MCP_TOOLS],
-        "active_sessions": len(connected_clients)
+        "active_sessions": await session_store.count()
     }
 
 @app.get("/health")
@@ -188,9 +381,37 @@ async def health():
         "status": "healthy",
         "timestamp": datetime.now().isoformat(),
         "stations": len(station_service.stations),
-        "active_sessions": len(connected_clients)
+        "active_sessions": await session_store.count(),
+        "mcp_sessions": await session_store.snapshot(),
+        "upstream_sessions": session_pool.snapshot(),
+        "upstream_limits": session_pool.governor.snapshot(),
+        "ticket_cache": ticket_service.left_ticket_cache.stats(),
+        "upstream_inflight": ticket_service.inflight.stats(),
+        "train_no_cache": ticket_service.train_resolver.stats(),
+        "timetable_cache": ticket_service.timetable_cache.stats(),
+        "cache_backend": cache_backend.stats() if cache_backend is not None else {"backend": "memory"},
+        "station_reload": station_refresher.snapshot()
     }
 
+def check_admin_token(token: Optional[str]):
+    if settings.admin_token and token != settings.admin_token:
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+@app.post("/admin/reload-stations")
+async def admin_reload_stations(x_admin_token: Optional[str] = Header(default=None)):
+    """手动触发车站数据热重载"""
+    check_admin_token(x_admin_token)
+    result = await station_refresher.reload()
+    if not result["ok"]:
+        return JSONResponse(status_code=500, content=result)
+    return result
+
+@app.post("/admin/warm-timetables")
+async def admin_warm_timetables(limit: Optional[int] = None, x_admin_token: Optional[str] = Header(default=None)):
+    """预取最近余票查询中出现过的车次的经停站"""
+    check_admin_token(x_admin_token)
+    return await ticket_service.warm_timetables(limit=limit)
+
 @app.get("/schema/tools")
 async def get_tools_schema():
     return {
@@ -220,31 +441,31 @@ async def mcp_endpoint_get(request: Request):
     logger.info(f"🔗 New MCP GET connection established - Session ID: {session_id}")
     
     # Store client connection info
-    connected_clients[session_id] = {
+    await session_store.create(session_id, {
         "connected_at": datetime.now().isoformat(),
         "user_agent": request.headers.get("user-agent", ""),
         "client_ip": request.client.host if request.client else "unknown",
         "initialized": False,
         "protocol_version": MCP_PROTOCOL_VERSION
-    }
+    })
     
     async def generate_events():
         try:
             # Keep connection alive with periodic pings
             while True:
                 await asyncio.sleep(30)  # Send ping every 30 seconds
+                # 连接保持期间刷新会话，避免被判定为闲置过期
+                await session_store.get(session_id)
                 yield f"event: ping\ndata: {{\"timestamp\": \"{datetime.now().isoformat()}\"}}\n\n"
                 
         except asyncio.CancelledError:
             logger.info(f"🔌 MCP GET connection closed - Session ID: {session_id}")
             # Clean up client connection
-            if session_id in connected_clients:
-                del connected_clients[session_id]
+            await session_store.delete(session_id)
         except Exception as e:
             logger.error(f"❌ MCP GET error for session {session_id}: {e}")
             # Clean up client connection
-            if session_id in connected_clients:
-                del connected_clients[session_id]
+            await session_store.delete(session_id)
     
     return StreamingResponse(
         generate_events(),
@@ -292,13 +513,13 @@ async def mcp_endpoint_post(request: Request):
             session_id = str(uuid.uuid4())
             
             # Store session info
-            connected_clients[session_id] = {
+            await session_store.create(session_id, {
                 "connected_at": datetime.now().isoformat(),
                 "user_agent": request.headers.get("user-agent", ""),
                 "client_ip": request.client.host if request.client else "unknown",
                 "initialized": False,
                 "protocol_version": client_protocol_version
-            }
+            })
             
             # Accept the client's protocol version or use our default
             accepted_version = client_protocol_version if client_protocol_version else MCP_PROTOCOL_VERSION
@@ -346,8 +567,8 @@ async def mcp_endpoint_post(request: Request):
                 status_code=400
             )
         
-        # Validate session exists
-        if session_id not in connected_clients:
+        # Validate session exists（同时刷新会话的最后使用时间）
+        if await session_store.get(session_id) is None:
             logger.error(f"❌ Invalid session ID: {session_id}")
             return JSONResponse(
                 {
@@ -464,52 +685,14 @@ async def mcp_endpoint_post(request: Request):
             logger.info(f"🔧 Executing tool: {tool_name}")
             logger.info(f"📋 Arguments: {arguments}")
             
-            # Execute the appropriate tool
-            try:
-                # Map tool names with hyphens to underscores for internal functions
-                if tool_name == "query-tickets":
-                    content = await query_tickets_validated(arguments)
-                elif tool_name == "search-stations":
-                    content = await search_stations_validated(arguments)
-                elif tool_name == "query-transfer":
-                    content = await query_transfer_validated(arguments)
-                elif tool_name == "get-train-route-stations":
-                    content = await get_train_route_stations_validated(arguments)
-                elif tool_name == "get-train-no-by-train-code":
-                    content = await get_train_no_by_train_code_validated(arguments)
-                elif tool_name == "get-current-time":
-                    content = await get_current_time_validated(arguments)
-                else:
-                    content = [{
-                        "type": "text", 
-                        "text": f"❌ 未知工具: {tool_name}"
-                    }]
-                
-                response = {
-                    "jsonrpc": "2.0",
-                    "id": request_id,
-                    "result": {
-                        "content": content,
-                        "isError": False
-                    }
-                }
-                logger.info(f"✅ Tool {tool_name} executed successfully")
-                
-            except Exception as tool_error:
-                logger.error(f"❌ Tool execution error: {tool_error}")
-                response = {
-                    "jsonrpc": "2.0",
-                    "id": request_id,
-                    "result": {
-                        "content": [{
-                            "type": "text",
-                            "text": f"❌ 工具执行失败: {str(tool_error)}"
-                        }],
-                        "isError": True
-                    }
-                }
-            
-            return JSONResponse(response)
+            # 客户端接受 SSE 且带 progressToken（或开启 MCP_STREAM_TOOL_RESULTS）时，
+            # 分页/批量查询改为 SSE 流式返回：每完成一次上游请求发出进度通知与部分结果，最后发出完整响应
+            progress_token = (params.get("_meta") or {}).get("progressToken")
+            if tool_name in STREAMING_TOOLS and accepts_event_stream(request) and (
+                    progress_token is not None or settings.mcp_stream_tool_results):
+                return stream_tool_call(request_id, tool_name, arguments, progress_token)
+            response = await execute_tool_call(request_id, tool_name, arguments)
+            return FastJSONResponse(response)
         
         # Handle notifications (no response required)
         elif method and method.startswith("notifications/"):
@@ -520,8 +703,7 @@ async def mcp_endpoint_post(request: Request):
             if notification_type == "initialized":
                 logger.info("🎉 Client initialized successfully - MCP handshake complete!")
                 # Mark session as fully initialized
-                if session_id in connected_clients:
-                    connected_clients[session_id]["initialized"] = True
+                await session_store.update(session_id, initialized=True)
             
             # Notifications should return 202 Accepted according to MCP spec
             return Response(status_code=202)  # Accepted
@@ -591,8 +773,7 @@ async def mcp_endpoint_delete(request: Request):
             status_code=400
         )
     
-    if session_id in connected_clients:
-        del connected_clients[session_id]
+    if await session_store.delete(session_id):
         logger.info(f"🗑️ Session terminated: {session_id}")
         return Response(status_code=200)
     else:
@@ -610,6 +791,120 @@ async def sse_endpoint():
             yield f"data: ping {datetime.now().isoformat()}\n\n"
     return StreamingResponse(event_generator(), media_type="text/event-stream")
 
+# 支持流式返回的工具：结果由多次上游请求（批量分组、中转分页）组成
+STREAMING_TOOLS = {"query-tickets-batch", "query-transfer"}
+
+class ToolProgress:
+    """流式 tools/call 的消息队列：工具执行中写入进度通知与部分结果，SSE 响应依次发出，最后是完整响应"""
+
+    def __init__(self, tool_name: str, progress_token: Any = None):
+        self.tool_name = tool_name
+        self.progress_token = progress_token
+        self.queue: asyncio.Queue = asyncio.Queue()
+
+    def _notify(self, method: str, params: Dict[str, Any]):
+        self.queue.put_nowait((False, {"jsonrpc": "2.0", "method": method, "params": params}))
+
+    def progress(self, progress: int, total: Optional[int] = None, message: str = ""):
+        """进度通知（notifications/progress），请求未带 progressToken 时不发送"""
+        if self.progress_token is None:
+            return
+        params: Dict[str, Any] = {"progressToken": self.progress_token, "progress": progress}
+        if total is not None:
+            params["total"] = total
+        if message:
+            params["message"] = message
+        self._notify("notifications/progress", params)
+
+    def partial(self, content: Any):
+        """部分结果，格式同工具返回值（content 列表或结构化结果），以日志通知（notifications/message）发出"""
+        data = {**content} if isinstance(content, dict) else {"content": content}
+        self._notify("notifications/message", {
+            "level": "info", "logger": self.tool_name, "data": {"type": "partial_result", **data}
+        })
+
+    def finish(self, response: Dict[str, Any]):
+        self.queue.put_nowait((True, response))
+
+def accepts_event_stream(request: Request) -> bool:
+    return "text/event-stream" in request.headers.get("accept", "")
+
+def stream_tool_call(request_id: Any, tool_name: str, arguments: dict, progress_token: Any) -> StreamingResponse:
+    """以 text/event-stream 返回 tools/call：先发进度通知与部分结果，最后一条为 JSON-RPC 响应"""
+    progress = ToolProgress(tool_name, progress_token)
+
+    async def run():
+        progress.finish(await execute_tool_call(request_id, tool_name, arguments, progress))
+
+    async def events():
+        task = asyncio.ensure_future(run())
+        try:
+            while True:
+                final, message = await progress.queue.get()
+                yield f"event: message\ndata: {dumps(message)}\n\n"
+                if final:
+                    break
+        finally:
+            # 客户端提前断开时停止工具执行
+            task.cancel()
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "Access-Control-Allow-Origin": "*",
+            "X-Accel-Buffering": "no",  # Disable nginx buffering
+        }
+    )
+
+async def execute_tool_call(request_id: Any, tool_name: str, arguments: dict,
+                            progress: Optional[ToolProgress] = None) -> Dict[str, Any]:
+    """执行工具并构造 JSON-RPC 响应；progress 不为空时分页/批量工具随执行上报进度与部分结果"""
+    try:
+        # Map tool names with hyphens to underscores for internal functions
+        if tool_name == "query-tickets":
+            content = await query_tickets_validated(arguments)
+        elif tool_name == "query-tickets-batch":
+            content = await query_tickets_batch_validated(arguments, progress)
+        elif tool_name == "search-stations":
+            content = await search_stations_validated(arguments)
+        elif tool_name == "query-transfer":
+            content = await query_transfer_validated(arguments, progress)
+        elif tool_name == "get-train-route-stations":
+            content = await get_train_route_stations_validated(arguments)
+        elif tool_name == "get-train-no-by-train-code":
+            content = await get_train_no_by_train_code_validated(arguments)
+        elif tool_name == "get-current-time":
+            content = await get_current_time_validated(arguments)
+        else:
+            content = error_result(f"❌ 未知工具: {tool_name}")
+        
+        # 结构化结果已带 content 与 structuredContent，错误结果已带 isError
+        result = {**content} if isinstance(content, dict) else {"content": content}
+        result.setdefault("isError", False)
+        response = {
+            "jsonrpc": "2.0",
+            "id": request_id,
+            "result": result
+        }
+        logger.info(f"✅ Tool {tool_name} executed successfully")
+        
+    except Exception as tool_error:
+        logger.error(f"❌ Tool execution error: {tool_error}")
+        response = {
+            "jsonrpc": "2.0",
+            "id": request_id,
+            "result": {
+                "content": [{
+                    "type": "text",
+                    "text": f"❌ 工具执行失败: {str(tool_error)}"
+                }],
+                "isError": True
+            }
+        }
+    return response
+
 # 车站名/三字码自动转换
 async def ensure_telecode(val):
     if val.isalpha() and val.isupper() and len(val) == 3:
@@ -617,38 +912,12 @@ async def ensure_telecode(val):
     code = await station_service.get_station_code(val)
     return code
 
-# 解析票务字符串
-
-def parse_ticket_string(ticket_str, query):
-    parts = ticket_str.split('|')
-    if len(parts) < 35:
-        return None
-    return {
-        "train_no": parts[3],
-        "start_time": parts[8],
-        "arrive_time": parts[9],
-        "duration": parts[10],
-        "business_seat_num": parts[32] or "",
-        "first_class_num": parts[31] or "",
-        "second_class_num": parts[30] or "",
-        "advanced_soft_sleeper_num": parts[21] or "",
-        "soft_sleeper_num": parts[23] or "",
-        "dongwo_num": parts[33] or "",
-        "hard_sleeper_num": parts[28] or "",
-        "soft_seat_num": parts[24] or "",
-        "hard_seat_num": parts[29] or "",
-        "no_seat_num": parts[26] or "",
-        "from_station": query["from_station"],
-        "to_station": query["to_station"],
-        "train_date": query["train_date"]
-    }
-
 # 车站模糊搜索工具
 async def search_stations_validated(args: dict) -> list:
     query = args.get("query", "").strip()
     limit = args.get("limit", 10)
     if not query:
-        return [{"type": "text", "text": "❌ 请输入搜索关键词"}]
+        return error_result("❌ 请输入搜索关键词")
     if not isinstance(limit, int) or limit < 1 or limit > 50:
         limit = 10
     result = await station_service.search_stations(query, limit)
@@ -675,6 +944,112 @@ async def search_stations_validated(args: dict) -> list:
         text += f"• 检查拼写是否正确"
         return [{"type": "text", "text": text}]
 
+def wants_json(args: dict) -> bool:
+    """工具参数是否要求结构化输出（format=json）"""
+    return str(args.get("format") or "markdown").strip().lower() == "json"
+
+def structured_result(data: Dict[str, Any], text: Optional[str] = None) -> Dict[str, Any]:
+    """
+    结构化工具结果：structuredContent 为记录本身；content 为 markdown 文本，
+    未给出 text（format=json）时为同样内容的 JSON 文本，兼容只读 content 的客户端
+    """
+    return {"content": [{"type": "text", "text": dumps(data) if text is None else text}], "structuredContent": data}
+
+def error_result(text: str) -> Dict[str, Any]:
+    """工具错误结果（isError=true）；声明了 outputSchema 的工具出错时也不带 structuredContent"""
+    return {"content": [{"type": "text", "text": text}], "isError": True}
+
+SEAT_LABELS = dict(SEAT_CLASSES)
+SEAT_KEYS_BY_LABEL = {label: key for key, label in SEAT_CLASSES}
+CLOCK_PATTERN = re.compile(r"^(?:[01]\d|2[0-3]):[0-5]\d$")
+
+def parse_ticket_filter(args: dict) -> Tuple[Optional[TicketFilter], List[str]]:
+    """从工具参数解析筛选条件，返回 (条件, 错误列表)；未给出任何条件时条件为 None"""
+    errors = []
+    train_types = args.get("train_types") or []
+    if isinstance(train_types, str):
+        train_types = [train_types]
+    # 兼容 "GD"、"G,D" 等写法，按字母拆开
+    train_types = tuple(dict.fromkeys(ch for item in train_types for ch in str(item).upper() if ch.isalpha()))
+    times = {}
+    for name in ("depart_after", "depart_before", "arrive_after", "arrive_before"):
+        value = str(args.get(name) or "").strip()
+        if value and not CLOCK_PATTERN.match(value):
+            errors.append(f"{name} 格式错误，应为 HH:MM")
+        times[name] = value or None
+    seat_classes = args.get("seat_classes") or []
+    if isinstance(seat_classes, str):
+        seat_classes = [seat_classes]
+    seat_keys = []
+    for seat in seat_classes:
+        seat = str(seat).strip()
+        key = seat if seat in SEAT_LABELS else SEAT_KEYS_BY_LABEL.get(seat)
+        if key is None:
+            errors.append(f"未知席别：{seat}（可选：{'、'.join(SEAT_KEYS_BY_LABEL)}）")
+        elif key not in seat_keys:
+            seat_keys.append(key)
+    sort_by = str(args.get("sort_by") or "").strip() or None
+    if sort_by and sort_by not in SORT_FIELDS:
+        errors.append(f"sort_by 应为 {' / '.join(SORT_FIELDS)} 之一")
+    limit = args.get("limit")
+    if limit is not None:
+        try:
+            limit = int(limit)
+        except (TypeError, ValueError):
+            limit = 0
+        if limit < 1:
+            errors.append("limit 应为正整数")
+    ticket_filter = TicketFilter(train_types=train_types, seat_classes=tuple(seat_keys), sort_by=sort_by,
+                                 limit=limit, **times)
+    if ticket_filter == TicketFilter():
+        ticket_filter = None
+    return ticket_filter, errors
+
+async def ticket_records(tickets: List[TicketRow]) -> List[Dict[str, Any]]:
+    """把解码后的余票行转为输出记录（补全站名），markdown 与 json 两种输出共用"""
+    names: Dict[str, str] = {}
+
+    async def station_name(code: str) -> str:
+        if code not in names:
+            station = await station_service.get_station_by_code(code) if code else None
+            names[code] = station.name if station else (code or "?")
+        return names[code]
+
+    return [{
+        "train_code": ticket.train_code,
+        "train_no": ticket.train_no,
+        "from_station": await station_name(ticket.from_telecode),
+        "from_telecode": ticket.from_telecode,
+        "to_station": await station_name(ticket.to_telecode),
+        "to_telecode": ticket.to_telecode,
+        "start_time": ticket.start_time,
+        "arrive_time": ticket.arrive_time,
+        "duration": ticket.duration,
+        "can_web_buy": ticket.can_web_buy == "Y",
+        "seats": seat_counts(ticket),
+    } for ticket in tickets]
+
+def render_ticket_records(records: List[Dict[str, Any]], from_station: str, to_station: str, train_date: str,
+                          unfiltered: Optional[int] = None) -> str:
+    """把车次记录渲染为 markdown 车次列表；unfiltered 为筛选前的车次数，给出时在标题中注明"""
+    found = f"📊 找到 **{len(records)}** 趟列车"
+    if unfiltered is not None:
+        found += f"（共 {unfiltered} 趟，已按条件筛选）"
+    parts = [f"🚄 **{from_station} → {to_station}** ({train_date})\n\n", found + ":\n\n"]
+    append = parts.append
+    for i, record in enumerate(records, 1):
+        append(f"**{i}.** 🚆 **{record['train_code']}** （{record['from_station']}[{record['from_telecode']}] → "
+               f"{record['to_station']}[{record['to_telecode']}]）\n")
+        append(f"      ⏰ `{record['start_time']}` → `{record['arrive_time']}`")
+        if record["duration"]:
+            append(f" (历时 {record['duration']})")
+        append("\n")
+        seats = record["seats"]
+        if seats:
+            append("      💺 " + " | ".join(f"{SEAT_LABELS[key]}:{num}" for key, num in seats.items()) + "\n")
+        append("\n")
+    return "".join(parts)
+
 # ========== query_tickets_validated 重构 ========== 
 async def query_tickets_validated(args: dict) -> list:
     try:
@@ -691,9 +1066,11 @@ async def query_tickets_validated(args: dict) -> list:
             errors.append("出发日期不能为空")
         elif not validate_date(train_date):
             errors.append("日期格式错误，请使用 YYYY-MM-DD 格式")
+        ticket_filter, filter_errors = parse_ticket_filter(args)
+        errors.extend(filter_errors)
         if errors:
             error_text = "❌ **参数验证失败:**\n" + "\n".join(f"{i+1}. {err}" for i, err in enumerate(errors))
-            return [{"type": "text", "text": error_text}]
+            return error_result(error_text)
         from_code = await ensure_telecode(from_station)
         to_code = await ensure_telecode(to_station)
         if not from_code or not to_code:
@@ -710,83 +1087,146 @@ async def query_tickets_validated(args: dict) -> list:
                     suggest_text += f"\n\n🔍 到达站'{to_station}'可能是：\n"
                     for s in result.stations:
                         suggest_text += f"- {s.name}（{s.code}，拼音：{s.pinyin}，简拼：{s.py_short}）\n"
-            return [{"type": "text", "text": "❌ 车站名称无效，请检查输入。" + suggest_text + "\n\n💡 可尝试拼音、简拼、三字码或用 search_stations 工具辅助查询。"}]
-        import httpx
-        url_init = "https://kyfw.12306.cn/otn/leftTicket/init"
-        url_u = "https://kyfw.12306.cn/otn/leftTicket/queryG"
-        headers = {
-            "User-Agent": USER_AGENT,
-            "Referer": "https://kyfw.12306.cn/otn/leftTicket/init",
-            "Host": "kyfw.12306.cn",
-            "Accept": "application/json, text/javascript, */*; q=0.01"
+            return error_result("❌ 车站名称无效，请检查输入。" + suggest_text + "\n\n💡 可尝试拼音、简拼、三字码或用 search_stations 工具辅助查询。")
+        try:
+            tickets_data = await ticket_service.fetch_left_ticket_rows(from_code, to_code, train_date)
+        except UpstreamError as e:
+            return error_result(f"❌ {e}")
+        rows = decode_rows(tickets_data)
+        unfiltered = len(rows)
+        if ticket_filter:
+            rows = ticket_filter.apply(rows)
+        records = await ticket_records(rows)
+        data = {
+            "from_station": from_station, "to_station": to_station, "train_date": train_date,
+            "total": len(records), "unfiltered_total": unfiltered, "trains": records,
         }
-        async with httpx.AsyncClient(follow_redirects=True, timeout=8, verify=False) as client:
-            await client.get(url_init, headers=headers)
-            params = {
-                "leftTicketDTO.train_date": train_date,
-                "leftTicketDTO.from_station": from_code,
-                "leftTicketDTO.to_station": to_code,
-                "purpose_codes": "ADULT"
-            }
-            resp = await client.get(url_u, headers=headers, params=params)
-            logger.info(f"12306 queryG status: {resp.status_code}, url: {resp.url}")
-            if resp.status_code != 200:
-                logger.error(f"12306接口返回异常: {resp.status_code}, body: {resp.text}")
-                return [{"type": "text", "text": f"❌ 12306接口返回异常: {resp.status_code}\n{resp.text}"}]
-            try:
-                data = resp.json().get("data", {})
-                tickets_data = data.get("result", [])
-            except Exception as e:
-                logger.error(f"❌ 12306响应解析失败: {repr(e)}，原始内容: {resp.text}")
-                return [{"type": "text", "text": f"❌ 12306响应解析失败: {repr(e)}\n原始内容: {resp.text}"}]
-        tickets = []
-        for ticket_str in tickets_data:
-            ticket = parse_ticket_string(ticket_str, {
-                "from_station": from_station,
-                "to_station": to_station,
-                "train_date": train_date
-            })
-            if ticket:
-                tickets.append(ticket)
-        if tickets:
-            text = f"🚄 **{from_station} → {to_station}** ({train_date})\n\n"
-            text += f"📊 找到 **{len(tickets)}** 趟列车:\n\n"
-            for i, ticket in enumerate(tickets, 1):
-                ticket_str = tickets_data[i-1] if i-1 < len(tickets_data) else None
-                from_station_name = to_station_name = from_code_actual = to_code_actual = None
-                if ticket_str:
-                    parts = ticket_str.split('|')
-                    from_code_actual = parts[6] if len(parts) > 6 else None
-                    to_code_actual = parts[7] if len(parts) > 7 else None
-                    from_station_obj = await station_service.get_station_by_code(from_code_actual) if from_code_actual else None
-                    to_station_obj = await station_service.get_station_by_code(to_code_actual) if to_code_actual else None
-                    from_station_name = from_station_obj.name if from_station_obj else (from_code_actual or "?")
-                    to_station_name = to_station_obj.name if to_station_obj else (to_code_actual or "?")
-                text += f"**{i}.** 🚆 **{ticket['train_no']}** （{from_station_name}[{from_code_actual}] → {to_station_name}[{to_code_actual}]）\n"
-                text += f"      ⏰ `{ticket['start_time']}` → `{ticket['arrive_time']}`"
-                if ticket['duration']:
-                    text += f" (历时 {ticket['duration']})"
-                text += "\n"
-                seats = []
-                if ticket['business_seat_num']: seats.append(f"商务座:{ticket['business_seat_num']}")
-                if ticket['first_class_num']: seats.append(f"一等座:{ticket['first_class_num']}")
-                if ticket['second_class_num']: seats.append(f"二等座:{ticket['second_class_num']}")
-                if ticket['advanced_soft_sleeper_num']: seats.append(f"高级软卧:{ticket['advanced_soft_sleeper_num']}")
-                if ticket['soft_sleeper_num']: seats.append(f"软卧:{ticket['soft_sleeper_num']}")
-                if ticket['hard_sleeper_num']: seats.append(f"硬卧:{ticket['hard_sleeper_num']}")
-                if ticket['soft_seat_num']: seats.append(f"软座:{ticket['soft_seat_num']}")
-                if ticket['hard_seat_num']: seats.append(f"硬座:{ticket['hard_seat_num']}")
-                if ticket['no_seat_num']: seats.append(f"无座:{ticket['no_seat_num']}")
-                if ticket['dongwo_num']: seats.append(f"动卧:{ticket['dongwo_num']}")
-                if seats:
-                    text += f"      💺 {' | '.join(seats)}\n"
-                text += "\n"
-            return [{"type": "text", "text": text}]
+        # 声明了 outputSchema，markdown 输出同样附带 structuredContent
+        if wants_json(args):
+            return structured_result(data)
+        if records:
+            text = render_ticket_records(records, from_station, to_station, train_date,
+                                         unfiltered if ticket_filter else None)
+        elif unfiltered:
+            text = f"❌ 共 {unfiltered} 趟列车，没有符合筛选条件的车次（{from_station}→{to_station} {train_date}）"
         else:
-            return [{"type": "text", "text": f"❌ 未找到该线路的余票（{from_station}→{to_station} {train_date}）"}]
+            text = f"❌ 未找到该线路的余票（{from_station}→{to_station} {train_date}）"
+        return structured_result(data, text)
     except Exception as e:
         logger.error(f"❌ 查询车票失败: {repr(e)}")
-        return [{"type": "text", "text": f"❌ **查询失败:** {repr(e)}"}]
+        return error_result(f"❌ **查询失败:** {repr(e)}")
+
+# ========== query_tickets_batch_validated 批量查询 ==========
+async def query_tickets_batch_validated(args: dict, progress: Optional[ToolProgress] = None) -> list:
+    """
+    批量查询多个日期和/或多组站对的余票。
+    日期与站对两两组合为若干组查询，并发获取后按组输出；某组失败只在该组下报告原因。
+    流式返回时每组完成即上报进度与该组结果。
+    """
+    try:
+        dates = args.get("train_dates") or []
+        if isinstance(dates, str):
+            dates = [dates]
+        pairs = args.get("pairs") or []
+        if not pairs and (args.get("from_station") or args.get("to_station")):
+            pairs = [{"from_station": args.get("from_station", ""), "to_station": args.get("to_station", "")}]
+        errors = []
+        if not dates:
+            errors.append("出发日期列表不能为空")
+        if not pairs:
+            errors.append("请提供 from_station/to_station 或 pairs")
+        ticket_filter, filter_errors = parse_ticket_filter(args)
+        errors.extend(filter_errors)
+        if errors:
+            error_text = "❌ **参数验证失败:**\n" + "\n".join(f"{i+1}. {err}" for i, err in enumerate(errors))
+            return error_result(error_text)
+        # 去重并保持输入顺序
+        dates = list(dict.fromkeys(str(d).strip() for d in dates))
+        pairs = list(dict.fromkeys(
+            (str(p.get("from_station", "")).strip(), str(p.get("to_station", "")).strip()) for p in pairs
+        ))
+        queries = [(f, t, d) for f, t in pairs for d in dates]
+        max_queries = settings.batch_query_max_queries
+        if len(queries) > max_queries:
+            return error_result(f"❌ 单次最多批量查询 {max_queries} 组，当前 {len(queries)} 组，请减少日期或站对")
+        logger.info(f"🔍 批量查询参数: {len(pairs)} 组站对 × {len(dates)} 个日期")
+
+        # 先在本地完成参数与车站校验，只把有效的组发往12306
+        problems: Dict[int, str] = {}
+        valid: List[tuple] = []
+        for idx, (from_station, to_station, train_date) in enumerate(queries):
+            if not from_station or not to_station:
+                problems[idx] = "出发站和到达站不能为空"
+                continue
+            if not validate_date(train_date):
+                problems[idx] = "日期格式错误，请使用 YYYY-MM-DD 格式"
+                continue
+            from_code = await ensure_telecode(from_station)
+            to_code = await ensure_telecode(to_station)
+            if not from_code or not to_code:
+                problems[idx] = f"车站名称无效：{from_station if not from_code else to_station}"
+                continue
+            valid.append((idx, (from_code, to_code, train_date)))
+
+        async def build_group(idx: int, error: Optional[str], raw_rows: Optional[List[str]]) -> Dict[str, Any]:
+            from_station, to_station, train_date = queries[idx]
+            rows = [] if error else decode_rows(raw_rows)
+            unfiltered = len(rows)
+            if ticket_filter:
+                rows = ticket_filter.apply(rows)
+            records = await ticket_records(rows)
+            return {
+                "from_station": from_station, "to_station": to_station, "train_date": train_date,
+                "error": error, "total": len(records), "unfiltered_total": unfiltered, "trains": records,
+            }
+
+        def render_group(group: Dict[str, Any]) -> str:
+            # 每组以空行结尾，组间的 --- 才是分隔线而不会把上一行变成 setext 标题
+            header = f"🚄 **{group['from_station']} → {group['to_station']}** ({group['train_date']})\n\n"
+            if group["error"]:
+                return header + f"❌ {group['error']}\n\n"
+            if group["trains"]:
+                return render_ticket_records(
+                    group["trains"], group["from_station"], group["to_station"], group["train_date"],
+                    group["unfiltered_total"] if ticket_filter else None)
+            if group["unfiltered_total"]:
+                return header + f"❌ 共 {group['unfiltered_total']} 趟列车，没有符合筛选条件的车次\n\n"
+            return header + "❌ 未找到该线路的余票\n\n"
+
+        # 流式返回时各组完成即构造并上报，最终结果直接复用
+        streamed: Dict[int, Dict[str, Any]] = {}
+        on_result = None
+        if progress:
+            async def on_result(position: int, result: Dict[str, Any]):
+                idx = valid[position][0]
+                group = streamed[idx] = await build_group(idx, result["error"], result["rows"])
+                progress.progress(len(streamed), len(valid),
+                                  f"{group['from_station']}→{group['to_station']} {group['train_date']} 已完成")
+                progress.partial(structured_result(group) if wants_json(args)
+                                 else [{"type": "text", "text": render_group(group)}])
+
+        results = await ticket_service.fetch_left_ticket_rows_batch([q for _, q in valid], on_result=on_result)
+        fetched = {idx: result for (idx, _), result in zip(valid, results)}
+
+        groups = []
+        for idx in range(len(queries)):
+            if idx in streamed:
+                groups.append(streamed[idx])
+            elif idx in problems:
+                groups.append(await build_group(idx, problems[idx], None))
+            else:
+                groups.append(await build_group(idx, fetched[idx]["error"], fetched[idx]["rows"]))
+        ok = sum(1 for group in groups if not group["error"])
+        data = {"total_queries": len(queries), "succeeded": ok, "failed": len(queries) - ok, "groups": groups}
+        if wants_json(args):
+            return structured_result(data)
+
+        text = f"📦 **批量余票查询**：共 {len(queries)} 组，成功 {ok} 组，失败 {len(queries) - ok} 组\n\n"
+        text += "---\n\n".join(render_group(group) for group in groups)
+        return structured_result(data, text)
+    except Exception as e:
+        logger.error(f"❌ 批量查询车票失败: {repr(e)}")
+        return error_result(f"❌ **批量查询失败:** {repr(e)}")
 
 # ========== get_train_no_by_train_code_validated 重构 ========== 
 async def get_train_no_by_train_code_validated(args: dict) -> list:
@@ -802,68 +1242,35 @@ async def get_train_no_by_train_code_validated(args: dict) -> list:
     try:
         dt = datetime.strptime(train_date, "%Y-%m-%d")
         if dt.date() < date.today():
-            return [{"type": "text", "text": "❌ 出发日期不能早于今天"}]
+            return error_result("❌ 出发日期不能早于今天")
     except Exception:
-        return [{"type": "text", "text": "❌ 出发日期格式错误，应为YYYY-MM-DD"}]
+        return error_result("❌ 出发日期格式错误，应为YYYY-MM-DD")
     def is_telecode(val):
         return val.isalpha() and val.isupper() and len(val) == 3
     if not is_telecode(from_station):
         code = await station_service.get_station_code(from_station)
         if not code:
-            return [{"type": "text", "text": f"❌ 出发站无效或无法识别：{from_station}"}]
+            return error_result(f"❌ 出发站无效或无法识别：{from_station}")
         from_station = code
     if not is_telecode(to_station):
         code = await station_service.get_station_code(to_station)
         if not code:
-            return [{"type": "text", "text": f"❌ 到达站无效或无法识别：{to_station}"}]
+            return error_result(f"❌ 到达站无效或无法识别：{to_station}")
         to_station = code
-    import httpx
-    url_init = "https://kyfw.12306.cn/otn/leftTicket/init"
-    url_u = "https://kyfw.12306.cn/otn/leftTicket/queryG"
-    headers = {
-        "User-Agent": USER_AGENT,
-        "Referer": "https://kyfw.12306.cn/otn/leftTicket/init",
-        "Host": "kyfw.12306.cn",
-        "Accept": "application/json, text/javascript, */*; q=0.01"
-    }
-    async with httpx.AsyncClient(follow_redirects=True, timeout=8, verify=False) as client:
-        await client.get(url_init, headers=headers)
-        params = {
-            "leftTicketDTO.train_date": train_date,
-            "leftTicketDTO.from_station": from_station,
-            "leftTicketDTO.to_station": to_station,
-            "purpose_codes": "ADULT"
-        }
-        resp = await client.get(url_u, headers=headers, params=params)
-        try:
-            data = resp.json().get("data", {})
-            tickets_data = data.get("result", [])
-        except Exception:
-            return [{"type": "text", "text": "❌ 12306反爬拦截或数据异常，请稍后重试"}]
-    if not tickets_data:
-        return [{"type": "text", "text": f"❌ 未找到该线路的余票数据（{from_station}->{to_station} {train_date}）"}]
-    found = None
-    for ticket_str in tickets_data:
-        parts = ticket_str.split('|')
-        try:
-            idx = parts.index('预订')
-            train_no = parts[idx+1].strip()
-            train_code_str = parts[idx+2].strip().upper()
-            if train_code_str == train_code:
-                found = train_no
-                break
-        except Exception:
-            continue
+    try:
+        found = await ticket_service.resolve_train_no(train_code, from_station, to_station, train_date)
+    except UpstreamError as e:
+        return error_result(f"❌ {e}")
     if not found:
-        debug_codes = []
-        for p in tickets_data:
-            try:
-                parts = p.split('|')
-                idx = parts.index('预订')
-                debug_codes.append(parts[idx+2])
-            except Exception:
-                continue
-        return [{"type": "text", "text": f"❌ 未找到该车次号的列车编号（{train_code} {from_station}->{to_station} {train_date}）。\n可用车次号: {debug_codes}"}]
+        # 未命中时余票数据已在缓存中，列出可用车次不会再请求上游
+        try:
+            tickets_data = await ticket_service.fetch_left_ticket_rows(from_station, to_station, train_date)
+        except UpstreamError:
+            tickets_data = []
+        if not tickets_data:
+            return error_result(f"❌ 未找到该线路的余票数据（{from_station}->{to_station} {train_date}）")
+        debug_codes = train_codes_of(tickets_data)
+        return error_result(f"❌ 未找到该车次号的列车编号（{train_code} {from_station}->{to_station} {train_date}）。\n可用车次号: {debug_codes}")
     return [
         {"type": "text", "text": f"车次 {train_code}（{from_station}→{to_station}，{train_date}）的列车编号为：{found}"}
     ]
@@ -883,21 +1290,21 @@ async def get_train_route_stations_validated(args: dict) -> list:
         
         # 参数校验
         if not train_no:
-            return [{"type": "text", "text": "❌ 车次编号(train_no)不能为空"}]
+            return error_result("❌ 车次编号(train_no)不能为空")
         if not from_station:
-            return [{"type": "text", "text": "❌ 出发站不能为空"}]
+            return error_result("❌ 出发站不能为空")
         if not to_station:
-            return [{"type": "text", "text": "❌ 到达站不能为空"}]
+            return error_result("❌ 到达站不能为空")
         if not train_date:
-            return [{"type": "text", "text": "❌ 出发日期不能为空"}]
+            return error_result("❌ 出发日期不能为空")
         
         # 日期格式校验
         try:
             dt = datetime.strptime(train_date, "%Y-%m-%d")
             if dt.date() < date.today():
-                return [{"type": "text", "text": "❌ 出发日期不能早于今天"}]
+                return error_result("❌ 出发日期不能早于今天")
         except Exception:
-            return [{"type": "text", "text": "❌ 出发日期格式错误，应为YYYY-MM-DD"}]
+            return error_result("❌ 出发日期格式错误，应为YYYY-MM-DD")
         
         # 三字码转换
         def is_telecode(val):
@@ -906,13 +1313,13 @@ async def get_train_route_stations_validated(args: dict) -> list:
         if not is_telecode(from_station):
             code = await station_service.get_station_code(from_station)
             if not code:
-                return [{"type": "text", "text": f"❌ 出发站无效或无法识别：{from_station}"}]
+                return error_result(f"❌ 出发站无效或无法识别：{from_station}")
             from_station = code
         
         if not is_telecode(to_station):
             code = await station_service.get_station_code(to_station)
             if not code:
-                return [{"type": "text", "text": f"❌ 到达站无效或无法识别：{to_station}"}]
+                return error_result(f"❌ 到达站无效或无法识别：{to_station}")
             to_station = code
         
         # 检测输入是车次号还是列车编号
@@ -924,80 +1331,31 @@ async def get_train_route_stations_validated(args: dict) -> list:
         if is_train_code:
             # 输入的是车次号，需要先转换为列车编号
             logger.info(f"检测到车次号 {train_no}，正在转换为列车编号...")
-            convert_args = {
-                "train_code": train_no,
-                "from_station": from_station,
-                "to_station": to_station,
-                "train_date": train_date
-            }
-            convert_result = await get_train_no_by_train_code_validated(convert_args)
-            
-            if not convert_result or convert_result[0].get("type") != "text":
-                return [{"type": "text", "text": f"❌ 无法获取车次 {train_no} 的列车编号"}]
-            
-            result_text = convert_result[0].get("text", "")
-            if "❌" in result_text:
-                return convert_result  # 返回错误信息
-            
-            # 从结果中提取列车编号
-            # 格式: "车次 C9569（XXX→YYY，2024-12-01）的列车编号为：57000C95690L"
-            match = re.search(r'列车编号为：(\S+)', result_text)
-            if not match:
-                return [{"type": "text", "text": f"❌ 无法解析车次 {train_no} 的列车编号"}]
-            
-            actual_train_no = match.group(1)
+            # 刚查过余票时直接命中解析缓存，不再请求上游
+            try:
+                actual_train_no = await ticket_service.resolve_train_no(
+                    train_no, from_station, to_station, train_date
+                )
+            except UpstreamError as e:
+                return error_result(f"❌ {e}")
+            if not actual_train_no:
+                return error_result(f"❌ 无法获取车次 {train_no} 的列车编号（{from_station}->{to_station} {train_date}）")
             logger.info(f"车次 {train_no} 转换为列车编号: {actual_train_no}")
         else:
             # 输入的是列车编号，直接使用
             actual_train_no = train_no
             logger.info(f"使用列车编号: {actual_train_no}")
         
-        # 调用12306经停站接口 - 使用正确的API端点
-        url = "https://kyfw.12306.cn/otn/czxx/queryByTrainNo"
-        params = {
-            "train_no": actual_train_no,  # 使用转换后的列车编号
-            "from_station_telecode": from_station,
-            "to_station_telecode": to_station,
-            "depart_date": train_date
-        }
-        
-        # 使用与参考实现相同的请求方式
-        headers = {
-            "User-Agent": USER_AGENT,
-            "Referer": "https://kyfw.12306.cn/otn/leftTicket/init",
-            "Accept": "application/json, text/javascript, */*; q=0.01",
-            "Accept-Language": "zh-CN,zh;q=0.9",
-            "Connection": "keep-alive",
-            "Host": "kyfw.12306.cn",            "X-Requested-With": "XMLHttpRequest",
-            "Origin": "https://kyfw.12306.cn"
-        }
-        
-        async with httpx.AsyncClient(follow_redirects=True, timeout=8, verify=False) as client:
-            # 先访问init获取cookie
-            init_resp = await client.get("https://kyfw.12306.cn/otn/leftTicket/init", headers=headers)
-            logger.info(f"12306 init status: {init_resp.status_code}")
-            
-            resp = await client.get(url, headers=headers, params=params)
-            logger.info(f"12306 route query status: {resp.status_code}, url: {resp.url}")
-            
-            # 检查HTTP状态码
-            if resp.status_code != 200:
-                logger.error(f"12306接口返回异常状态码: {resp.status_code}, body: {resp.text}")
-                return [{"type": "text", "text": f"❌ 12306接口返回异常: {resp.status_code}"}]
-            
-            # 检查是否被重定向到错误页面
-            if "error.html" in str(resp.url) or "ntce" in str(resp.url):
-                return [{"type": "text", "text": "❌ 12306反爬虫拦截，请稍后重试或更换网络环境。"}]
-            
-            try:
-                json_data = resp.json()
-                logger.info(f"12306 response keys: {list(json_data.keys()) if json_data else 'None'}")
-            except Exception as e:
-                logger.error(f"12306响应解析失败: {str(e)}, body: {resp.text}")
-                return [{"type": "text", "text": f"❌ 12306响应解析失败: {str(e)}"}]
+        # 调用12306经停站接口（借用已预热的会话，并发相同请求合并）
+        try:
+            json_data = await ticket_service.fetch_route_stations(
+                actual_train_no, from_station, to_station, train_date
+            )
+        except UpstreamError as e:
+            return error_result(f"❌ {e}")
         
         if not json_data:
-            return [{"type": "text", "text": "❌ 12306接口返回空数据"}]
+            return error_result("❌ 12306接口返回空数据")
         
         # 解析经停站数据 - 使用与参考实现相同的数据结构解析
         data = json_data.get("data", {})
@@ -1015,7 +1373,7 @@ async def get_train_route_stations_validated(args: dict) -> list:
             stations = data["route"]
         
         if not stations:
-            return [{"type": "text", "text": f"❌ 未找到车次 {train_no} 的经停站信息"}]
+            return error_result(f"❌ 未找到车次 {train_no} 的经停站信息")
         
         # 格式化输出 - 使用与参考实现相同的输出格式
         text = f"🚄 **{train_no}** 经停站时刻表 ({train_date})\n\n"
@@ -1035,13 +1393,64 @@ async def get_train_route_stations_validated(args: dict) -> list:
         
     except Exception as e:
         logger.error(f"❌ 查询经停站失败: {repr(e)}")
-        return [{"type": "text", "text": f"❌ **查询经停站失败:** {repr(e)}"}]
+        return error_result(f"❌ **查询经停站失败:** {repr(e)}")
+
+def transfer_records(plans: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """把中转方案转为输出记录，少于两段或格式异常的方案跳过"""
+    records = []
+    for plan in plans:
+        try:
+            # 优先用 fullList，降级用 trainList
+            full_list = plan.get("fullList") or plan.get("trainList") or []
+            if len(full_list) < 2:
+                continue
+            segments = [{
+                "train_code": seg.get("station_train_code", "?"),
+                "from_station": seg.get("from_station_name", "?"),
+                "to_station": seg.get("to_station_name", "?"),
+                "start_time": seg.get("start_time", "?"),
+                "arrive_time": seg.get("arrive_time", "?"),
+                "duration": seg.get("lishi", ""),
+                "seats": {key: seg[field] for field, key, _ in TRANSFER_SEAT_FIELDS if field in seg},
+            } for seg in full_list]
+            records.append({
+                "middle_station": plan.get("middle_station_name") or full_list[0].get("to_station_name", "?"),
+                "wait_time": plan.get("wait_time", ""),
+                "all_lishi": plan.get("all_lishi", ""),
+                "segments": segments,
+            })
+        except (AttributeError, TypeError) as e:
+            logger.warning(f"跳过格式异常的中转方案: {e}")
+    return records
+
+def render_transfer_records(records: List[Dict[str, Any]], from_station: str, to_station: str, train_date: str) -> str:
+    """把中转方案记录渲染为 markdown 文本"""
+    return f"🚉 **中转查询结果**\n\n{from_station} → {to_station}（{train_date}）\n\n" + render_transfer_plans(records)
+
+def render_transfer_plans(records: List[Dict[str, Any]], start: int = 1) -> str:
+    """渲染中转方案列表，序号从 start 开始（流式返回时接续已发出的方案）"""
+    parts = []
+    append = parts.append
+    for i, record in enumerate(records, start):
+        append(f"**{i}.** 中转站:{record['middle_station']}  ⏱️总历时:{record['all_lishi']}  ⏳等候:{record['wait_time']}\n")
+        seg_texts = []
+        for idx, seg in enumerate(record["segments"], 1):
+            seg_text = f"    {idx}. {seg['train_code']} {seg['from_station']}({seg['start_time']}) → {seg['to_station']}({seg['arrive_time']})"
+            if seg["duration"]:
+                seg_text += f" 历时:{seg['duration']}"
+            if seg["seats"]:
+                seg_text += "\n         " + " | ".join(
+                    f"{TRANSFER_SEAT_LABELS[key]}:{num}" for key, num in seg["seats"].items())
+            seg_texts.append(seg_text)
+        append("\n".join(seg_texts) + "\n\n")
+    return "".join(parts)
 
 # ========== query_transfer_validated 函数实现 ==========
-async def query_transfer_validated(args: dict) -> list:
+async def query_transfer_validated(args: dict, progress: Optional[ToolProgress] = None) -> list:
     """
     查询中转换乘方案。使用参考代码的正确实现方式。
     支持指定中转站、学生票、无座车次等选项，自动分页获取所有中转方案。
+    流式返回时每合并一页即上报进度与该页方案。
     """
     try:
         from_station = args.get("from_station", "").strip()
@@ -1050,18 +1459,27 @@ async def query_transfer_validated(args: dict) -> list:
         middle_station = args.get("middle_station", "").strip() if "middle_station" in args else ""
         isShowWZ = args.get("isShowWZ", "N").strip().upper() or "N"
         purpose_codes = args.get("purpose_codes", "00").strip().upper() or "00"
+        max_plans = args.get("max_plans")
         
         # 参数校验
         if not from_station or not to_station or not train_date:
-            return [{"type": "text", "text": "❌ 请输入出发站、到达站和出发日期"}]
+            return error_result("❌ 请输入出发站、到达站和出发日期")
         
         # 日期格式校验
         try:
             dt = datetime.strptime(train_date, "%Y-%m-%d")
             if dt.date() < date.today():
-                return [{"type": "text", "text": "❌ 出发日期不能早于今天"}]
+                return error_result("❌ 出发日期不能早于今天")
         except Exception:
-            return [{"type": "text", "text": "❌ 出发日期格式错误，应为YYYY-MM-DD"}]
+            return error_result("❌ 出发日期格式错误，应为YYYY-MM-DD")
+        
+        if max_plans is not None:
+            try:
+                max_plans = int(max_plans)
+            except (TypeError, ValueError):
+                return error_result("❌ max_plans 应为正整数")
+            if max_plans < 1:
+                return error_result("❌ max_plans 应为正整数")
         
         # 自动转三字码 - 使用参考代码的实现
         async def ensure_telecode(val):
@@ -1073,145 +1491,48 @@ async def query_transfer_validated(args: dict) -> list:
         from_code = await ensure_telecode(from_station)
         to_code = await ensure_telecode(to_station)
         if not from_code:
-            return [{"type": "text", "text": f"❌ 出发站无效或无法识别：{from_station}"}]
+            return error_result(f"❌ 出发站无效或无法识别：{from_station}")
         if not to_code:
-            return [{"type": "text", "text": f"❌ 到达站无效或无法识别：{to_station}"}]
-        
-        # 使用参考代码的完整分页查询逻辑
-        url_init = "https://kyfw.12306.cn/otn/leftTicket/init"
-        url = "https://kyfw.12306.cn/otn/leftTicket/queryG"
-        headers = {
-            "User-Agent": USER_AGENT,
-            "Referer": "https://kyfw.12306.cn/otn/leftTicket/init",
-            "Accept": "application/json, text/javascript, */*; q=0.01",
-            "Accept-Language": "zh-CN,zh;q=0.9",
-            "Connection": "keep-alive",
-            "Host": "kyfw.12306.cn",
-            "X-Requested-With": "XMLHttpRequest",
-            "Origin": "https://kyfw.12306.cn"
-        }
+            return error_result(f"❌ 到达站无效或无法识别：{to_station}")
         
-        all_transfer_list = []
-        async with httpx.AsyncClient(follow_redirects=True, timeout=8, verify=False) as client:
-            # 先访问init获取cookie
-            await client.get(url_init, headers=headers)
-            
-            # 分页查询所有中转方案
-            page_size = 10
-            result_index = 0
-            while True:
-                params = {
-                    "train_date": train_date,
-                    "from_station_telecode": from_code,
-                    "to_station_telecode": to_code,
-                    "middle_station": middle_station,
-                    "result_index": str(result_index),
-                    "can_query": "Y",
-                    "isShowWZ": isShowWZ,
-                    "purpose_codes": purpose_codes,
-                    "channel": "E"
-                }
-                
-                resp = await client.get(url, headers=headers, params=params)
-                
-                # 检查反爬虫
-                if resp.status_code == 302 or "error.html" in str(resp.headers.get("location", "")):
-                    return [{"type": "text", "text": "❌ 12306反爬虫拦截（302跳转），请稍后重试或更换网络环境。"}]
-                
-                try:
-                    data = resp.json().get("data", {})
-                    transfer_list = data.get("middleList", [])
-                except Exception:
-                    return [{"type": "text", "text": "❌ 12306反爬拦截或数据异常，请稍后重试"}]
-                
-                if not transfer_list:
-                    break
-                
-                all_transfer_list.extend(transfer_list)
-                
-                # 如果返回的数据少于页面大小，说明已经是最后一页
-                if len(transfer_list) < page_size:
-                    break
-                
-                result_index += page_size
-        
-        if not all_transfer_list:
-            return [{"type": "text", "text": f"❌ 未查到中转方案（{from_station}→{to_station} {train_date}）"}]
-        
-        # 使用参考代码的输出格式
-        text = f"🚉 **中转查询结果**\n\n{from_station} → {to_station}（{train_date}）\n\n"
-        
-        for i, item in enumerate(all_transfer_list, 1):
-            try:
-                # 优先用 fullList，降级用 trainList
-                full_list = item.get("fullList") or item.get("trainList") or []
-                if len(full_list) < 2:
-                    continue
-                
-                seg_texts = []
-                for idx, seg in enumerate(full_list, 1):
-                    code = seg.get("station_train_code", "?")
-                    from_name = seg.get("from_station_name", "?")
-                    to_name = seg.get("to_station_name", "?")
-                    st = seg.get("start_time", "?")
-                    at = seg.get("arrive_time", "?")
-                    lishi = seg.get("lishi", "")
-                    
-                    # 余票字段严格按官方顺序输出
-                    seat_info = []
-                    # 商务座
-                    if "swz_num" in seg:
-                        seat_info.append(f"商务座:{seg.get('swz_num', '--')}")
-                    # 特等座
-                    if "tz_num" in seg:
-                        seat_info.append(f"特等座:{seg.get('tz_num', '--')}")
-                    # 一等座
-                    if "zy_num" in seg:
-                        seat_info.append(f"一等座:{seg.get('zy_num', '--')}")
-                    # 二等座
-                    if "ze_num" in seg:
-                        seat_info.append(f"二等座:{seg.get('ze_num', '--')}")
-                    # 高级软卧
-                    if "gr_num" in seg:
-                        seat_info.append(f"高级软卧:{seg.get('gr_num', '--')}")
-                    # 软卧/动卧
-                    if "rw_num" in seg:
-                        seat_info.append(f"软卧/动卧:{seg.get('rw_num', '--')}")
-                    # 一等卧
-                    if "rz_num" in seg:
-                        seat_info.append(f"一等卧/软座:{seg.get('rz_num', '--')}")
-                    # 硬卧
-                    if "yw_num" in seg:
-                        seat_info.append(f"硬卧:{seg.get('yw_num', '--')}")
-                    # 硬座
-                    if "yz_num" in seg:
-                        seat_info.append(f"硬座:{seg.get('yz_num', '--')}")                    # 无座
-                    if "wz_num" in seg:
-                        seat_info.append(f"无座:{seg.get('wz_num', '--')}")
-                    
-                    seg_text = f"    {idx}. {code} {from_name}({st}) → {to_name}({at})"
-                    if lishi:
-                        seg_text += f" 历时:{lishi}"
-                    if seat_info:
-                        seg_text += "\n         " + " | ".join(seat_info)
-                    seg_texts.append(seg_text)
-                
-                mid_station = item.get("middle_station_name") or full_list[0].get("to_station_name", "?")
-                wait_time = item.get("wait_time", "")
-                all_lishi = item.get("all_lishi", "")
-                
-                text += f"**{i}.** 中转站:{mid_station}  ⏱️总历时:{all_lishi}  ⏳等候:{wait_time}\n"
-                text += "\n".join(seg_texts) + "\n\n"
-                
-            except Exception as e:
-                text += f"**{i}.** [解析失败] {e}\n"
-                continue
+        on_page = None
+        if progress:
+            streamed = {"pages": 0, "plans": 0}
+
+            async def on_page(page: List[Dict[str, Any]]):
+                records = transfer_records(page)
+                streamed["pages"] += 1
+                progress.progress(streamed["pages"],
+                                  message=f"已获取第 {streamed['pages']} 页，累计 {streamed['plans'] + len(records)} 个方案")
+                if records:
+                    progress.partial(structured_result({"plans": records}) if wants_json(args)
+                                     else [{"type": "text", "text": render_transfer_plans(records, streamed["plans"] + 1)}])
+                streamed["plans"] += len(records)
+
+        # 并发预取分页，按页序合并全部中转方案
+        try:
+            all_transfer_list = await ticket_service.fetch_transfer_plans(
+                from_code, to_code, train_date, middle_station,
+                isShowWZ, purpose_codes, max_plans=max_plans, on_page=on_page
+            )
+        except UpstreamError as e:
+            return error_result(f"❌ {e}")
         
-        return [{"type": "text", "text": text}]
+        records = transfer_records(all_transfer_list)
+        data = {
+            "from_station": from_station, "to_station": to_station, "train_date": train_date,
+            "total": len(records), "plans": records,
+        }
+        if wants_json(args):
+            return structured_result(data)
+        if not records:
+            return structured_result(data, f"❌ 未查到中转方案（{from_station}→{to_station} {train_date}）")
+        text = render_transfer_records(records, from_station, to_station, train_date)
+        return structured_result(data, text)
         
     except Exception as e:
         logger.error(f"❌ 查询中转失败: {repr(e)}")
-        return [{"type": "text", "text": f"❌ **查询中转失败:** {repr(e)}"}]
+        return error_result(f"❌ **查询中转失败:** {repr(e)}")
 
 # ========== get_current_time_validated 新增时间工具 ==========
 async def get_current_time_validated(args: dict) -> list:
@@ -1232,7 +1553,7 @@ async def get_current_time_validated(args: dict) -> list:
         return [{"type": "text", "text": text}]
     except Exception as e:
         logger.error(f"❌ 获取时间信息失败: {repr(e)}")
-        return [{"type": "text", "text": f"❌ **获取时间信息失败:** {repr(e)}"}]
+        return error_result(f"❌ **获取时间信息失败:** {repr(e)}")
 
 @app.on_event("startup")
 async def startup_event():
@@ -1245,6 +1566,24 @@ async def startup_event():
     logger.info("📚 正在加载车站数据...")
     await station_service.load_stations()
     logger.info(f"✅ 已加载 {len(station_service.stations)} 个车站")
+    await station_refresher.start()
+    
+    # 创建共享上游连接池并预热cookie会话
+    await http_client.create_session()
+    await session_pool.start()
+    await session_janitor.start()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """应用关闭时释放共享资源"""
+    await station_refresher.stop()
+    await session_janitor.stop()
+    await session_pool.stop()
+    await http_client.close_session()
+    if cache_backend is not None:
+        cache_backend.close()
+    session_store.close()
+    logger.info("🔌 已关闭共享上游连接池")
 
 async def main_server():
     """启动MCP服务器"""
@@ -3,5 +3,7 @@
 from .station_service import StationService
 from .ticket_service import TicketService
 from .http_client import HttpClient
+from .session_pool import SessionPool
+from .station_refresher import StationRefresher
 
-__all__ = ["StationService", "TicketService", "HttpClient"]
\ No newline at end of file
+__all__ = ["StationService", "TicketService", "HttpClient", "SessionPool", "StationRefresher"]
\ No newline at end of file
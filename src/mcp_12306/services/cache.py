@@ -0,0 +1,262 @@
+"""上游结果缓存"""
+
+import asyncio
+import logging
+import sys
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional, Tuple
+
+from .cache_backend import CacheBackend
+from .singleflight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+
+def estimate_size(value: Any) -> int:
+    """粗略估算缓存值占用的字节数（递归展开 list/tuple/dict）"""
+    size = sys.getsizeof(value)
+    if isinstance(value, (list, tuple)):
+        size += sum(estimate_size(v) for v in value)
+    elif isinstance(value, dict):
+        size += sum(estimate_size(k) + estimate_size(v) for k, v in value.items())
+    return size
+
+
+_MISSING = object()
+# 共享后端回源租约时长，需长于一次上游请求的超时时间
+LEASE_TTL = 10.0
+LEASE_POLL_INTERVAL = 0.05
+
+
+class _Entry:
+    __slots__ = ("value", "expires_at", "stale_until", "size")
+
+    def __init__(self, value: Any, expires_at: float, stale_until: float, size: int):
+        self.value = value
+        self.expires_at = expires_at
+        self.stale_until = stale_until
+        self.size = size
+
+
+class TTLCache:
+    """带TTL、LRU淘汰与内存上限的内存缓存
+
+    - 条目在 ttl 秒内为新鲜数据，直接命中；
+    - 过期后 stale_ttl 秒内为陈旧数据：开启 stale-while-revalidate 时先返回旧值，
+      同时在后台为该key发起一次刷新（同一key同一时间只有一个刷新任务）；
+    - 超过 max_entries 或 max_bytes 时按最近最少使用顺序淘汰；
+    - 传入 backend 时作为第二层：内存未命中先查后端，上游结果同时写回后端，
+      多个 worker 共用同一后端时同一份数据只需请求一次上游。后端以 name 作为命名空间；
+    - 同一进程内同一key同时只有一个回源流程（查后端、争取或等待租约、fetch），其余未命中的调用方等待其结果。
+    """
+
+    def __init__(self, ttl: float, max_entries: int = 512, max_bytes: Optional[int] = None,
+                 stale_ttl: float = 0.0, name: str = "cache",
+                 backend: Optional[CacheBackend] = None):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.stale_ttl = stale_ttl
+        self.name = name
+        self._data: "OrderedDict[Hashable, _Entry]" = OrderedDict()
+        self._bytes = 0
+        self._refreshing: Dict[Hashable, asyncio.Task] = {}
+        self._loads = SingleFlight(name=f"{name}-load")
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.backend = backend
+        self.backend_hits = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def _lookup(self, key: Hashable) -> Tuple[Optional[_Entry], bool]:
+        """返回 (条目, 是否新鲜)；彻底过期的条目直接删除"""
+        entry = self._data.get(key)
+        if entry is None:
+            return None, False
+        now = time.monotonic()
+        if now < entry.expires_at:
+            self._data.move_to_end(key)
+            return entry, True
+        if now < entry.stale_until:
+            self._data.move_to_end(key)
+            return entry, False
+        self._remove(key)
+        return None, False
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """只读取新鲜数据"""
+        entry, fresh = self._lookup(key)
+        if entry is not None and fresh:
+            self.hits += 1
+            return entry.value
+        self.misses += 1
+        return default
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        ttl = self.ttl if ttl is None else ttl
+        size = estimate_size(value)
+        if self.max_bytes is not None and size > self.max_bytes:
+            logger.debug(f"[{self.name}] 条目过大，不缓存: {key}")
+            return
+        if key in self._data:
+            self._remove(key)
+        now = time.monotonic()
+        self._data[key] = _Entry(value, now + ttl, now + ttl + self.stale_ttl, size)
+        self._bytes += size
+        self._evict()
+
+    def peek(self, key: Hashable, default: Any = None) -> Any:
+        """读取新鲜数据，不影响LRU顺序与命中统计"""
+        entry = self._data.get(key)
+        if entry is None or time.monotonic() >= entry.expires_at:
+            return default
+        return entry.value
+
+    def items(self) -> List[Tuple[Hashable, Any]]:
+        """未过期的全部条目，按最近使用从旧到新排列（不计入命中统计）"""
+        now = time.monotonic()
+        return [(k, e.value) for k, e in self._data.items() if now < e.expires_at]
+
+    def invalidate(self, key: Hashable):
+        if key in self._data:
+            self._remove(key)
+
+    def clear(self):
+        self._data.clear()
+        self._bytes = 0
+
+    async def aget(self, key: Hashable, default: Any = None) -> Any:
+        """读取新鲜数据，内存未命中时查第二层后端"""
+        value = self.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+        value = await self._from_backend(key)
+        return default if value is _MISSING else value
+
+    async def aset(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        """写入内存与第二层后端"""
+        await self.aset_many([(key, value)], ttl)
+
+    async def aset_many(self, items: List[Tuple[Hashable, Any]], ttl: Optional[float] = None):
+        ttl = self.ttl if ttl is None else ttl
+        for key, value in items:
+            self.set(key, value, ttl)
+        if self.backend is not None and items:
+            await self.backend.set_many(self.name, items, ttl)
+
+    async def get_or_fetch(self, key: Hashable, fetch: Callable[[], Awaitable[Any]],
+                           stale_while_revalidate: bool = True, ttl: Optional[float] = None,
+                           cacheable: Optional[Callable[[Any], bool]] = None) -> Any:
+        """读取缓存，未命中时调用 fetch 获取并写入缓存；fetch 抛出的异常不会被缓存
+
+        ttl 覆盖本次写入的有效期；cacheable 返回 False 的结果只返回不缓存。
+        """
+        entry, fresh = self._lookup(key)
+        if entry is not None and fresh:
+            self.hits += 1
+            return entry.value
+        if entry is not None and stale_while_revalidate:
+            self.stale_hits += 1
+            self._schedule_refresh(key, fetch)
+            return entry.value
+        self.misses += 1
+        return await self._load(key, fetch, ttl, cacheable)
+
+    async def _from_backend(self, key: Hashable) -> Any:
+        """从第二层后端读取并回填内存，未命中返回 _MISSING"""
+        if self.backend is None:
+            return _MISSING
+        found = await self.backend.get(self.name, key)
+        if found is None:
+            return _MISSING
+        value, remaining = found
+        self.backend_hits += 1
+        self.set(key, value, ttl=remaining)
+        return value
+
+    async def _load(self, key: Hashable, fetch: Callable[[], Awaitable[Any]],
+                    ttl: Optional[float] = None, cacheable: Optional[Callable[[Any], bool]] = None) -> Any:
+        """回源入口：本进程内同一key的并发未命中合并为一次 _fill，只有它争取或等待后端租约"""
+        return await self._loads.do(key, lambda: self._fill(key, fetch, ttl, cacheable))
+
+    async def _fill(self, key: Hashable, fetch: Callable[[], Awaitable[Any]],
+                    ttl: Optional[float] = None, cacheable: Optional[Callable[[Any], bool]] = None) -> Any:
+        """先查第二层后端（其他 worker 可能已取到），仍未命中才调用 fetch"""
+        value = await self._from_backend(key)
+        if value is not _MISSING:
+            return value
+        if self.backend is None:
+            value = await fetch()
+            if cacheable is None or cacheable(value):
+                self.set(key, value, ttl)
+            return value
+        if not await self.backend.acquire_lease(self.name, key, LEASE_TTL):
+            # 其他 worker 正在回源：等它写入后端，租约释放仍无结果时自己回源
+            value = await self._wait_for_backend(key)
+            if value is not _MISSING:
+                return value
+            await self.backend.acquire_lease(self.name, key, LEASE_TTL)
+        try:
+            value = await fetch()
+            if cacheable is None or cacheable(value):
+                await self.aset(key, value, ttl)
+        finally:
+            await self.backend.release_lease(self.name, key)
+        return value
+
+    async def _wait_for_backend(self, key: Hashable) -> Any:
+        deadline = time.monotonic() + LEASE_TTL
+        while time.monotonic() < deadline:
+            await asyncio.sleep(LEASE_POLL_INTERVAL)
+            value = await self._from_backend(key)
+            if value is not _MISSING:
+                return value
+            if not await self.backend.lease_held(self.name, key):
+                return await self._from_backend(key)
+        return _MISSING
+
+    def _schedule_refresh(self, key: Hashable, fetch: Callable[[], Awaitable[Any]]):
+        if key in self._refreshing:
+            return
+
+        async def refresh():
+            try:
+                await self._load(key, fetch)
+            except Exception as e:
+                logger.warning(f"[{self.name}] 后台刷新失败 {key}: {e}")
+            finally:
+                self._refreshing.pop(key, None)
+
+        self._refreshing[key] = asyncio.create_task(refresh())
+
+    def _remove(self, key: Hashable):
+        entry = self._data.pop(key)
+        self._bytes -= entry.size
+
+    def _evict(self):
+        while self._data and (
+            len(self._data) > self.max_entries
+            or (self.max_bytes is not None and self._bytes > self.max_bytes)
+        ):
+            key, entry = self._data.popitem(last=False)
+            self._bytes -= entry.size
+            self.evictions += 1
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.stale_hits + self.misses
+        return {
+            "entries": len(self._data),
+            "bytes": self._bytes,
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round((self.hits + self.stale_hits) / lookups, 4) if lookups else 0.0,
+            "backend_hits": self.backend_hits,
+            "backend": self.backend.name if self.backend is not None else "memory",
+        }
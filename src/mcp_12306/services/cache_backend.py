@@ -0,0 +1,231 @@
+"""可插拔的缓存存储后端"""
+
+import abc
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Hashable, Iterable, Optional, Tuple
+
+from mcp_12306.utils.config import get_settings
+
+logger = logging.getLogger(__name__)
+
+
+class CacheBackend(abc.ABC):
+    """缓存存储后端接口
+
+    值按 (namespace, key) 存取，写入时给定有效期；get 返回 (值, 剩余有效秒数)，
+    未命中或已过期返回 None。值须可 JSON 序列化（余票行、经停站JSON、列车编号）。
+    TTLCache 自身就是进程内的一层（CACHE_BACKEND=memory），传入后端时把它作为进程内存之后的共享第二层。
+    """
+
+    name = "backend"
+
+    @abc.abstractmethod
+    async def get(self, namespace: str, key: Hashable) -> Optional[Tuple[Any, float]]:
+        """读取未过期的值，返回 (值, 剩余有效秒数)"""
+
+    async def set(self, namespace: str, key: Hashable, value: Any, ttl: float):
+        await self.set_many(namespace, [(key, value)], ttl)
+
+    @abc.abstractmethod
+    async def set_many(self, namespace: str, items: Iterable[Tuple[Hashable, Any]], ttl: float):
+        """批量写入，同一批共用有效期"""
+
+    async def acquire_lease(self, namespace: str, key: Hashable, ttl: float) -> bool:
+        """争取某个key的回源权；返回 False 表示其他进程正在回源"""
+        return True
+
+    async def release_lease(self, namespace: str, key: Hashable):
+        pass
+
+    async def lease_held(self, namespace: str, key: Hashable) -> bool:
+        """是否有其他进程持有该key的回源权"""
+        return False
+
+    def close(self):
+        pass
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": self.name}
+
+
+def _encode_key(key: Hashable) -> str:
+    return json.dumps(list(key) if isinstance(key, tuple) else key, ensure_ascii=False)
+
+
+class SqliteBackend(CacheBackend):
+    """本机共享后端：SQLite（WAL 模式）
+
+    同一台机器上的多个 uvicorn worker 指向同一个数据库文件即可共享缓存，
+    服务重启后未过期的数据仍然有效。过期时间使用墙钟时间，读取时过滤过期记录，
+    打开时清理一次过期数据。读写放到线程中执行；数据库异常只记录日志并按未命中处理。
+    回源租约（lease 表）保证多个 worker 同时未命中同一个key时只有一个请求上游。
+    """
+
+    name = "sqlite"
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=5.0, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            " namespace TEXT NOT NULL,"
+            " key TEXT NOT NULL,"
+            " value TEXT NOT NULL,"
+            " expires_at REAL NOT NULL,"
+            " PRIMARY KEY (namespace, key))"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS lease ("
+            " namespace TEXT NOT NULL,"
+            " key TEXT NOT NULL,"
+            " owner INTEGER NOT NULL,"
+            " expires_at REAL NOT NULL,"
+            " PRIMARY KEY (namespace, key))"
+        )
+        self.errors = 0
+        self.purge_expired()
+
+    def _get(self, namespace: str, key: str) -> Optional[Tuple[Any, float]]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM cache WHERE namespace = ? AND key = ? AND expires_at > ?",
+                (namespace, key, now)
+            ).fetchone()
+        if row is None:
+            return None
+        return json.loads(row[0]), row[1] - now
+
+    def _set_many(self, namespace: str, rows: list):
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO cache (namespace, key, value, expires_at) VALUES (?, ?, ?, ?)",
+                    rows
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def _acquire_lease(self, namespace: str, key: str, ttl: float) -> bool:
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute(
+                    "DELETE FROM lease WHERE namespace = ? AND key = ? AND expires_at <= ?", (namespace, key, now)
+                )
+                cur = self._conn.execute(
+                    "INSERT OR IGNORE INTO lease (namespace, key, owner, expires_at) VALUES (?, ?, ?, ?)",
+                    (namespace, key, os.getpid(), now + ttl)
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return cur.rowcount == 1
+
+    def _release_lease(self, namespace: str, key: str):
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM lease WHERE namespace = ? AND key = ? AND owner = ?", (namespace, key, os.getpid())
+            )
+
+    def _lease_held(self, namespace: str, key: str) -> bool:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT 1 FROM lease WHERE namespace = ? AND key = ? AND expires_at > ?",
+                (namespace, key, time.time())
+            ).fetchone()
+        return row is not None
+
+    async def acquire_lease(self, namespace: str, key: Hashable, ttl: float) -> bool:
+        try:
+            return await asyncio.to_thread(self._acquire_lease, namespace, _encode_key(key), ttl)
+        except sqlite3.Error as e:
+            self.errors += 1
+            logger.warning(f"获取回源租约失败 [{namespace}]: {e}")
+            return True
+
+    async def release_lease(self, namespace: str, key: Hashable):
+        try:
+            await asyncio.to_thread(self._release_lease, namespace, _encode_key(key))
+        except sqlite3.Error as e:
+            self.errors += 1
+            logger.warning(f"释放回源租约失败 [{namespace}]: {e}")
+
+    async def lease_held(self, namespace: str, key: Hashable) -> bool:
+        try:
+            return await asyncio.to_thread(self._lease_held, namespace, _encode_key(key))
+        except sqlite3.Error:
+            self.errors += 1
+            return False
+
+    async def get(self, namespace: str, key: Hashable) -> Optional[Tuple[Any, float]]:
+        try:
+            return await asyncio.to_thread(self._get, namespace, _encode_key(key))
+        except (sqlite3.Error, ValueError) as e:
+            self.errors += 1
+            logger.warning(f"读取共享缓存失败 [{namespace}]: {e}")
+            return None
+
+    async def set_many(self, namespace: str, items: Iterable[Tuple[Hashable, Any]], ttl: float):
+        expires_at = time.time() + ttl
+        rows = [
+            (namespace, _encode_key(key), json.dumps(value, ensure_ascii=False), expires_at)
+            for key, value in items
+        ]
+        if not rows:
+            return
+        try:
+            await asyncio.to_thread(self._set_many, namespace, rows)
+        except (sqlite3.Error, TypeError, ValueError) as e:
+            self.errors += 1
+            logger.warning(f"写入共享缓存失败 [{namespace}]: {e}")
+
+    def purge_expired(self) -> int:
+        with self._lock:
+            cur = self._conn.execute("DELETE FROM cache WHERE expires_at <= ?", (time.time(),))
+            self._conn.execute("DELETE FROM lease WHERE expires_at <= ?", (time.time(),))
+        return cur.rowcount
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": self.name, "path": self.path, "errors": self.errors}
+
+
+def create_cache_backend(kind: Optional[str] = None, path: Optional[str] = None) -> Optional[CacheBackend]:
+    """
+    按配置创建共享缓存后端（CACHE_BACKEND）。
+    memory（默认）返回 None：各缓存只用进程内 TTLCache；sqlite 返回 SqliteBackend。
+    """
+    settings = get_settings()
+    kind = (kind or settings.cache_backend).lower()
+    if kind == "memory":
+        return None
+    if kind == "sqlite":
+        path = path or settings.cache_backend_path
+        try:
+            backend = SqliteBackend(path)
+        except sqlite3.Error as e:
+            logger.warning(f"共享缓存不可用，改用进程内缓存: {e}")
+            return None
+        logger.info(f"共享缓存后端: sqlite {path}")
+        return backend
+    logger.warning(f"未知的缓存后端 {kind}，改用进程内缓存")
+    return None
@@ -2,19 +2,33 @@
 
 import asyncio
 import logging
+from http.cookiejar import CookieJar, DefaultCookiePolicy
 from typing import Optional, Dict, Any
 import httpx
 from mcp_12306.utils.config import get_settings
 
 logger = logging.getLogger(__name__)
 
+UPSTREAM_ORIGIN = "https://kyfw.12306.cn"
+
+
+class UpstreamError(Exception):
+    """12306上游请求失败（状态码异常、反爬拦截或响应无法解析）"""
+
 
 class HttpClient:
-    """12306 HTTP客户端"""
+    """12306 HTTP客户端
+
+    进程内共享的长连接客户端：服务启动时创建、关闭时释放，
+    所有工具调用复用同一个连接池（HTTP/2 + keep-alive），避免每次请求重新握手。
+    共享客户端自身不保存cookie，cookie由调用方按会话传入（见 SessionPool）。
+    配置了 UPSTREAM_BASE_URL 时把12306地址替换为该地址（本地模拟服务）。
+    """
     
     def __init__(self):
         self.settings = get_settings()
         self.session: Optional[httpx.AsyncClient] = None
+        self.base_url = self.settings.upstream_base_url.rstrip("/")
         
     async def __aenter__(self):
         await self.create_session()
@@ -24,40 +38,78 @@ class HttpClient:
         await self.close_session()
         
     async def create_session(self):
-        """创建HTTP会话"""
+        """创建HTTP会话（已存在时直接复用）"""
+        if self.session is not None and not self.session.is_closed:
+            return
         headers = {
             'User-Agent': self.settings.user_agent,
             'Accept': 'application/json, text/javascript, */*; q=0.01',
             'Accept-Language': 'zh-CN,zh;q=0.9,en;q=0.8',
             'Accept-Encoding': 'gzip, deflate, br',
-            'Connection': 'keep-alive',
             'X-Requested-With': 'XMLHttpRequest',
             'Cache-Control': 'no-cache',
             'Pragma': 'no-cache'
         }
+        limits = httpx.Limits(
+            max_connections=self.settings.http_max_connections,
+            max_keepalive_connections=self.settings.http_max_keepalive_connections,
+            keepalive_expiry=self.settings.http_keepalive_expiry
+        )
+        
+        # 禁止共享客户端记录cookie，避免不同会话的cookie相互串用
+        no_cookies = CookieJar(policy=DefaultCookiePolicy(allowed_domains=[]))
         
         self.session = httpx.AsyncClient(
             headers=headers,
+            cookies=no_cookies,
             timeout=self.settings.request_timeout,
+            limits=limits,
+            http2=self.settings.http2_enabled,
             verify=False,  # 12306证书问题
             follow_redirects=True
         )
+        logger.info(
+            f"已创建共享HTTP连接池: http2={self.settings.http2_enabled}, "
+            f"max_connections={self.settings.http_max_connections}, "
+            f"max_keepalive={self.settings.http_max_keepalive_connections}"
+        )
         
     async def close_session(self):
         """关闭HTTP会话"""
         if self.session:
             await self.session.aclose()
+            self.session = None
             
-    async def get(self, url: str, params: Optional[Dict[str, Any]] = None) -> httpx.Response:
-        """GET请求"""
+    async def get(self, url: str, params: Optional[Dict[str, Any]] = None,
+                  headers: Optional[Dict[str, str]] = None,
+                  timeout: Optional[float] = None,
+                  raise_for_status: bool = True,
+                  cookies: Optional[httpx.Cookies] = None) -> httpx.Response:
+        """GET请求
+
+        raise_for_status=False 时由调用方自行处理非2xx状态码。
+        传入 cookies 时随请求发送，并把响应中的 Set-Cookie 写回该cookie对象。
+        """
         if not self.session:
             await self.create_session()
         assert self.session is not None  # 类型保证
+        if self.base_url and url.startswith(UPSTREAM_ORIGIN):
+            url = self.base_url + url[len(UPSTREAM_ORIGIN):]
         try:
             logger.info(f"发送GET请求: {url}")
-            response = await self.session.get(url, params=params)
+            request = self.session.build_request(
+                "GET", url, params=params, headers=headers,
+                timeout=timeout if timeout is not None else httpx.USE_CLIENT_DEFAULT
+            )
+            if cookies is not None:
+                cookies.set_cookie_header(request)
+            response = await self.session.send(request)
+            if cookies is not None:
+                for r in (*response.history, response):
+                    cookies.extract_cookies(r)
             logger.info(f"响应状态: {response.status_code}")
-            response.raise_for_status()
+            if raise_for_status:
+                response.raise_for_status()
             return response
         except httpx.RequestError as e:
             logger.error(f"请求错误: {e}")
@@ -81,4 +133,4 @@ class HttpClient:
             raise
         except httpx.HTTPStatusError as e:
             logger.error(f"HTTP状态错误: {e}")
-            raise
\ No newline at end of file
+            raise
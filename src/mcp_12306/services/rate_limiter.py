@@ -0,0 +1,182 @@
+"""上游请求限流与并发控制"""
+
+import asyncio
+import contextlib
+import logging
+import time
+from typing import Any, AsyncIterator, Dict, Optional
+
+from mcp_12306.utils.config import get_settings
+from .http_client import UpstreamError
+
+logger = logging.getLogger(__name__)
+
+# 连续的拦截响应在该时间窗口内只降速一次
+BACKOFF_COOLDOWN = 1.0
+
+
+class RateLimitExceeded(UpstreamError):
+    """排队等待上游配额超过期限"""
+
+
+class Permit:
+    """一次上游请求的配额，请求结束后由调用方标记是否被拦截"""
+
+    __slots__ = ("blocked",)
+
+    def __init__(self):
+        self.blocked = False
+
+
+class EndpointLimiter:
+    """单个上游接口的令牌桶 + 最大在途请求数
+
+    调用方按到达顺序排队：队首先等在途数低于上限，再等令牌桶有令牌，两者同时满足才放行。
+    AIMD 自适应：收到拦截响应时速率乘以 backoff_factor（不低于 min_rate）并清空令牌，
+    之后每个正常完成的请求把速率加回 recovery_step，直到配置的速率上限。
+    排队超过 queue_timeout 秒抛出 RateLimitExceeded。
+    """
+
+    def __init__(self, name: str, rate: float, burst: int, max_in_flight: int,
+                 queue_timeout: float, min_rate: float, backoff_factor: float, recovery_step: float):
+        self.name = name
+        self.max_rate = max(rate, min_rate)
+        self.rate = self.max_rate
+        self.burst = max(1, burst)
+        self.max_in_flight = max(1, max_in_flight)
+        self.queue_timeout = queue_timeout
+        self.min_rate = min_rate
+        self.backoff_factor = backoff_factor
+        self.recovery_step = recovery_step
+        self.tokens = float(self.burst)
+        self.in_flight = 0
+        self.queued = 0
+        self._updated_at = time.monotonic()
+        self._last_backoff = 0.0
+        # asyncio.Lock 按先来先得唤醒，持有者即队首
+        self._head = asyncio.Lock()
+        self._slot_freed = asyncio.Event()
+        self.stats = {"acquired": 0, "rejected": 0, "blocked": 0, "backoffs": 0,
+                      "max_queue_depth": 0, "total_wait_ms": 0.0, "max_wait_ms": 0.0}
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(float(self.burst), self.tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+
+    async def _wait_turn(self):
+        async with self._head:
+            while self.in_flight >= self.max_in_flight:
+                self._slot_freed.clear()
+                await self._slot_freed.wait()
+            self._refill()
+            while self.tokens < 1:
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+                self._refill()
+            # 队首持锁期间在途数只会减少，这里同时占用令牌与在途名额
+            self.tokens -= 1
+            self.in_flight += 1
+
+    @contextlib.asynccontextmanager
+    async def acquire(self) -> AsyncIterator[Permit]:
+        """排队取得配额；退出时归还在途名额并按 permit.blocked 调整速率"""
+        started = time.monotonic()
+        self.queued += 1
+        self.stats["max_queue_depth"] = max(self.stats["max_queue_depth"], self.queued)
+        try:
+            await asyncio.wait_for(self._wait_turn(), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.stats["rejected"] += 1
+            logger.warning(f"[{self.name}] 上游请求排队超过 {self.queue_timeout:.0f}s，已放弃")
+            raise RateLimitExceeded(f"12306请求繁忙（{self.name} 排队超时），请稍后重试")
+        finally:
+            self.queued -= 1
+        waited_ms = (time.monotonic() - started) * 1000
+        self.stats["acquired"] += 1
+        self.stats["total_wait_ms"] += waited_ms
+        self.stats["max_wait_ms"] = max(self.stats["max_wait_ms"], waited_ms)
+
+        permit = Permit()
+        completed = False
+        try:
+            yield permit
+            completed = True
+        finally:
+            self.in_flight -= 1
+            self._slot_freed.set()
+            if permit.blocked:
+                self._backoff()
+            elif completed:
+                # 请求异常（超时、连接失败）不作为恢复速率的依据
+                self.rate = min(self.max_rate, self.rate + self.recovery_step)
+
+    def _backoff(self):
+        self.stats["blocked"] += 1
+        now = time.monotonic()
+        if now - self._last_backoff < BACKOFF_COOLDOWN:
+            return
+        self._last_backoff = now
+        self._refill()
+        self.rate = max(self.min_rate, self.rate * self.backoff_factor)
+        self.tokens = min(self.tokens, 0.0)
+        self.stats["backoffs"] += 1
+        logger.warning(f"[{self.name}] 收到12306拦截响应，限速降至 {self.rate:.2f} req/s")
+
+    def snapshot(self) -> Dict[str, Any]:
+        acquired = self.stats["acquired"]
+        return {
+            "rate": round(self.rate, 3),
+            "max_rate": self.max_rate,
+            "burst": self.burst,
+            "in_flight": self.in_flight,
+            "max_in_flight": self.max_in_flight,
+            "queue_depth": self.queued,
+            "avg_wait_ms": round(self.stats["total_wait_ms"] / acquired, 1) if acquired else 0.0,
+            **{k: round(v, 1) if isinstance(v, float) else v
+               for k, v in self.stats.items() if k != "total_wait_ms"},
+        }
+
+
+class UpstreamGovernor:
+    """按接口分别限流（queryG / transfer / queryByTrainNo）
+
+    未登记的接口不受限；UPSTREAM_RATE_LIMIT_ENABLED=false 时全部放行。
+    """
+
+    def __init__(self, enabled: Optional[bool] = None):
+        settings = get_settings()
+        self.enabled = enabled if enabled is not None else settings.upstream_rate_limit_enabled
+        budgets = {
+            "queryG": (settings.upstream_queryg_rate, settings.upstream_queryg_burst,
+                       settings.upstream_queryg_max_in_flight),
+            "transfer": (settings.upstream_transfer_rate, settings.upstream_transfer_burst,
+                         settings.upstream_transfer_max_in_flight),
+            "queryByTrainNo": (settings.upstream_route_rate, settings.upstream_route_burst,
+                               settings.upstream_route_max_in_flight),
+        }
+        self.limiters: Dict[str, EndpointLimiter] = {
+            name: EndpointLimiter(
+                name, rate, burst, max_in_flight,
+                queue_timeout=settings.upstream_queue_timeout,
+                min_rate=settings.upstream_min_rate,
+                backoff_factor=settings.upstream_backoff_factor,
+                recovery_step=settings.upstream_recovery_step
+            )
+            for name, (rate, burst, max_in_flight) in budgets.items()
+        }
+
+    @contextlib.asynccontextmanager
+    async def acquire(self, endpoint: Optional[str]) -> AsyncIterator[Permit]:
+        limiter = self.limiters.get(endpoint) if self.enabled and endpoint else None
+        if limiter is None:
+            yield Permit()
+            return
+        async with limiter.acquire() as permit:
+            yield permit
+
+    def snapshot(self) -> Dict[str, Any]:
+        """各接口限流状态，供 /health 展示"""
+        return {
+            "enabled": self.enabled,
+            **{name: limiter.snapshot() for name, limiter in self.limiters.items()},
+        }
@@ -0,0 +1,149 @@
+"""上游请求重试退避、熔断与对冲"""
+
+import logging
+import random
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Iterator, Optional
+
+from .http_client import UpstreamError
+
+logger = logging.getLogger(__name__)
+
+# 对冲延迟按最近多少次请求的耗时计算，样本不足时使用固定延迟
+LATENCY_WINDOW = 256
+MIN_LATENCY_SAMPLES = 20
+# 对冲预算的累积上限（允许的连续对冲次数）
+HEDGE_BUDGET_CAP = 5.0
+
+
+class CircuitOpenError(UpstreamError):
+    """接口处于熔断状态，请求未发出"""
+
+
+def decorrelated_jitter(base: float, cap: float, rng: random.Random = random) -> Iterator[float]:
+    """
+    decorrelated jitter 退避序列：下一次等待在 [base, 上一次 × 3] 内随机取值，不超过 cap。
+    多个调用方同时失败时重试时间自然错开，不会同时再次打到上游。
+    """
+    delay = base
+    while True:
+        delay = min(cap, rng.uniform(base, delay * 3))
+        yield delay
+
+
+class CircuitBreaker:
+    """单个上游接口的熔断器
+
+    连续 failure_threshold 次失败（拦截、5xx、连接异常）后打开，reset_timeout 秒内直接失败，
+    不再向12306发请求；之后放行一个探测请求（half_open），成功则关闭，失败则继续打开。
+    探测请求迟迟没有结果时，再过 reset_timeout 秒放行下一个探测请求。
+    """
+
+    def __init__(self, name: str, failure_threshold: int, reset_timeout: float):
+        self.name = name
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self._opened_at = 0.0
+        self.stats = {"opened": 0, "rejected": 0}
+
+    @property
+    def is_open(self) -> bool:
+        return self.state != "closed"
+
+    def check(self):
+        """请求前调用：熔断中且未到探测时间时抛出 CircuitOpenError"""
+        if self.state == "closed":
+            return
+        remaining = self._opened_at + self.reset_timeout - time.monotonic()
+        if remaining > 0:
+            self.stats["rejected"] += 1
+            raise CircuitOpenError(f"12306接口 {self.name} 暂时不可用（熔断中，约 {remaining:.0f}s 后重试）")
+        self.state = "half_open"
+        self._opened_at = time.monotonic()
+        logger.info(f"[{self.name}] 熔断等待结束，放行探测请求")
+
+    def record_success(self):
+        if self.state != "closed":
+            logger.info(f"[{self.name}] 探测请求成功，熔断关闭")
+        self.state = "closed"
+        self.failures = 0
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == "half_open" or (self.state == "closed" and self.failures >= self.failure_threshold):
+            self.state = "open"
+            self._opened_at = time.monotonic()
+            self.stats["opened"] += 1
+            logger.warning(f"[{self.name}] 连续失败 {self.failures} 次，熔断 {self.reset_timeout:.0f}s")
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {"state": self.state, "failures": self.failures, **self.stats}
+
+
+class LatencyWindow:
+    """最近若干次上游请求耗时（秒）的滑动窗口"""
+
+    def __init__(self, size: int = LATENCY_WINDOW):
+        self.samples: Deque[float] = deque(maxlen=size)
+
+    def __len__(self) -> int:
+        return len(self.samples)
+
+    def record(self, seconds: float):
+        self.samples.append(seconds)
+
+    def percentile(self, p: float) -> Optional[float]:
+        """第 p 百分位耗时，样本不足时返回 None"""
+        if len(self.samples) < MIN_LATENCY_SAMPLES:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))]
+
+
+class HedgePolicy:
+    """单个接口的自适应对冲策略
+
+    首个请求超过最近耗时的第 percentile 百分位仍未返回时才对冲（不低于 min_delay，
+    样本不足时用 fallback_delay）。对冲预算每个请求累积 max_ratio，每次对冲消耗 1，
+    额外请求量长期不超过 max_ratio；预算用完时跳过对冲。
+    stats: requests 请求数、fired 发出对冲、won 对冲请求先返回、skipped 因预算或排队跳过。
+    """
+
+    def __init__(self, name: str, percentile: float, fallback_delay: float,
+                 min_delay: float, max_ratio: float):
+        self.name = name
+        self.percentile = percentile
+        self.fallback_delay = fallback_delay
+        self.min_delay = min_delay
+        self.max_ratio = max_ratio
+        self.latency = LatencyWindow()
+        self.budget = 1.0
+        self.stats = {"requests": 0, "fired": 0, "won": 0, "skipped": 0}
+
+    def delay(self) -> float:
+        observed = self.latency.percentile(self.percentile)
+        return max(self.min_delay, observed if observed is not None else self.fallback_delay)
+
+    def on_request(self):
+        self.stats["requests"] += 1
+        self.budget = min(HEDGE_BUDGET_CAP, self.budget + self.max_ratio)
+
+    def try_fire(self) -> bool:
+        """消耗一次对冲预算，预算不足时返回 False"""
+        if self.budget < 1:
+            self.stats["skipped"] += 1
+            return False
+        self.budget -= 1
+        self.stats["fired"] += 1
+        return True
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "delay_ms": round(self.delay() * 1000, 1),
+            "samples": len(self.latency),
+            "budget": round(self.budget, 2),
+            **self.stats,
+        }
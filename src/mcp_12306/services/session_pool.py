@@ -0,0 +1,348 @@
+"""12306会话预热池"""
+
+import asyncio
+import itertools
+import logging
+import time
+from typing import Dict, List, Optional, Any
+
+import httpx
+
+from mcp_12306.utils.config import get_settings
+from .http_client import HttpClient
+from .rate_limiter import UpstreamGovernor
+from .resilience import CircuitBreaker, HedgePolicy, LatencyWindow, decorrelated_jitter
+
+logger = logging.getLogger(__name__)
+
+INIT_URL = "https://kyfw.12306.cn/otn/leftTicket/init"
+# 可重试的上游状态码
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+
+def is_blocked_response(response: httpx.Response) -> bool:
+    """判断响应是否为12306反爬拦截（跳转到 error.html / ntce 页面）"""
+    if "error.html" in str(response.url) or "ntce" in str(response.url):
+        return True
+    if response.status_code == 302:
+        location = response.headers.get("location", "")
+        return "error.html" in location or "ntce" in location
+    return False
+
+
+class WarmSession:
+    """已访问过 /otn/leftTicket/init 的cookie会话"""
+
+    _ids = itertools.count(1)
+
+    def __init__(self, cookies: httpx.Cookies):
+        self.id = next(self._ids)
+        self.cookies = cookies
+        self.created_at = time.monotonic()
+        self.valid = True
+
+    def age(self) -> float:
+        return time.monotonic() - self.created_at
+
+    def __repr__(self):
+        return f"WarmSession(id={self.id}, age={self.age():.0f}s, valid={self.valid})"
+
+
+class SessionPool:
+    """cookie会话预热池
+
+    启动时预先完成若干个 init 请求并保存各自的cookie，后台在过期前轮换刷新；
+    工具调用直接借用已预热的会话，不再每次先请求 init。
+    响应被重定向到 error.html/ntce 时作废该会话并在后台补充新会话。
+    指定 endpoint 的请求先经过该接口的限流器（见 UpstreamGovernor），拦截响应会让其自动降速；
+    同时按接口熔断，失败时换一个会话按 decorrelated jitter 退避重试，可选对冲（hedging）请求。
+    """
+
+    def __init__(self, http_client: HttpClient, size: Optional[int] = None,
+                 ttl: Optional[float] = None, refresh_margin: Optional[float] = None,
+                 governor: Optional[UpstreamGovernor] = None):
+        settings = get_settings()
+        self.http_client = http_client
+        self.governor = governor or UpstreamGovernor()
+        self.retry_attempts = max(0, settings.upstream_retry_attempts)
+        self.retry_base_delay = settings.upstream_retry_base_delay
+        self.retry_max_delay = settings.upstream_retry_max_delay
+        self.breaker_threshold = settings.upstream_breaker_threshold
+        self.breaker_reset_timeout = settings.upstream_breaker_reset_timeout
+        self.breakers: Dict[str, CircuitBreaker] = {}
+        self.hedge_enabled = settings.upstream_hedge_enabled
+        self.hedge_policies: Dict[str, HedgePolicy] = {
+            name: HedgePolicy(
+                name, percentile=settings.upstream_hedge_percentile,
+                fallback_delay=settings.upstream_hedge_delay,
+                min_delay=settings.upstream_hedge_min_delay,
+                max_ratio=settings.upstream_hedge_max_ratio
+            )
+            for name in (e.strip() for e in settings.upstream_hedge_endpoints.split(",")) if name
+        }
+        self.size = max(1, size if size is not None else settings.session_pool_size)
+        self.ttl = ttl if ttl is not None else settings.session_ttl
+        self.refresh_margin = refresh_margin if refresh_margin is not None else settings.session_refresh_margin
+        self.sessions: List[WarmSession] = []
+        self._cursor = itertools.count()
+        self._lock = asyncio.Lock()
+        self._refresh_task: Optional[asyncio.Task] = None
+        # 会话作废后的后台补充任务；运行中再次作废时补充完成后再补一轮
+        self._fill_task: Optional[asyncio.Task] = None
+        self._fill_again = False
+        self.stats = {"created": 0, "refreshed": 0, "invalidated": 0, "init_failures": 0,
+                      "retries": 0}
+
+    async def start(self):
+        """预热会话并启动后台刷新任务"""
+        await self._fill()
+        if self._refresh_task is None:
+            self._refresh_task = asyncio.create_task(self._refresh_loop())
+        logger.info(f"会话预热池已就绪: {len(self.sessions)}/{self.size}")
+
+    async def stop(self):
+        """停止后台刷新任务并清空会话"""
+        if self._refresh_task is not None:
+            self._refresh_task.cancel()
+            try:
+                await self._refresh_task
+            except asyncio.CancelledError:
+                pass
+            self._refresh_task = None
+        if self._fill_task is not None:
+            self._fill_task.cancel()
+            try:
+                await self._fill_task
+            except asyncio.CancelledError:
+                pass
+            self._fill_task = None
+        self.sessions = []
+
+    async def acquire(self, avoid: Optional[WarmSession] = None) -> WarmSession:
+        """借用一个已预热的会话（轮询分配，池为空时同步创建）；有其他可用会话时不返回 avoid"""
+        alive = [s for s in self.sessions if s.valid and s.age() < self.ttl]
+        if not alive:
+            await self._fill()
+            alive = [s for s in self.sessions if s.valid]
+            if not alive:
+                # init失败时退化为空cookie会话，由上游请求自行决定结果
+                return WarmSession(httpx.Cookies())
+        if avoid is not None and len(alive) > 1:
+            alive = [s for s in alive if s is not avoid]
+        return alive[next(self._cursor) % len(alive)]
+
+    def invalidate(self, session: WarmSession):
+        """作废被拦截的会话，并在后台补充新会话"""
+        if not session.valid:
+            return
+        session.valid = False
+        if session in self.sessions:
+            self.sessions.remove(session)
+        self.stats["invalidated"] += 1
+        logger.warning(f"会话被12306拦截，已作废: {session}")
+        if self._fill_task is None or self._fill_task.done():
+            self._fill_task = asyncio.create_task(self._background_fill())
+        else:
+            self._fill_again = True
+
+    async def _background_fill(self):
+        while True:
+            self._fill_again = False
+            try:
+                await self._fill()
+            except Exception as e:
+                logger.error(f"补充会话失败: {e}")
+            if not self._fill_again:
+                return
+
+    async def get(self, url: str, params: Optional[Dict[str, Any]] = None,
+                  headers: Optional[Dict[str, str]] = None,
+                  timeout: Optional[float] = None,
+                  raise_for_status: bool = True,
+                  endpoint: Optional[str] = None) -> httpx.Response:
+        """使用预热会话发起GET请求，命中反爬拦截时作废该会话
+
+        endpoint 为上游接口名（queryG / transfer / queryByTrainNo）：请求经过该接口的限流与熔断，
+        拦截、5xx/429 与连接异常按退避重试至多 retry_attempts 次，重试仍失败时返回最后一次响应
+        （或抛出最后一次异常）。熔断中抛出 CircuitOpenError，排队超时抛出 RateLimitExceeded。
+        """
+        if endpoint is None:
+            response = await self._send(url, params, headers, timeout, None)
+            if raise_for_status:
+                response.raise_for_status()
+            return response
+
+        breaker = self.breaker(endpoint)
+        delays = decorrelated_jitter(self.retry_base_delay, self.retry_max_delay)
+        attempt = 0
+        while True:
+            breaker.check()
+            response: Optional[httpx.Response] = None
+            try:
+                response = await self._attempt(url, params, headers, timeout, endpoint)
+                failure = self._failure_reason(response)
+            except httpx.TransportError as e:
+                error = e
+                failure = repr(e)
+            if failure is None:
+                breaker.record_success()
+                break
+            breaker.record_failure()
+            if attempt >= self.retry_attempts or breaker.is_open:
+                if response is None:
+                    raise error
+                break
+            attempt += 1
+            self.stats["retries"] += 1
+            delay = next(delays)
+            logger.warning(f"[{endpoint}] 上游请求失败（{failure}），{delay:.2f}s 后第 {attempt} 次重试")
+            await asyncio.sleep(delay)
+        if raise_for_status:
+            response.raise_for_status()
+        return response
+
+    @staticmethod
+    def _failure_reason(response: httpx.Response) -> Optional[str]:
+        if is_blocked_response(response):
+            return "反爬拦截"
+        if response.status_code in RETRYABLE_STATUS:
+            return f"状态码 {response.status_code}"
+        return None
+
+    def breaker(self, endpoint: str) -> CircuitBreaker:
+        breaker = self.breakers.get(endpoint)
+        if breaker is None:
+            breaker = CircuitBreaker(endpoint, self.breaker_threshold, self.breaker_reset_timeout)
+            self.breakers[endpoint] = breaker
+        return breaker
+
+    async def _send(self, url: str, params: Optional[Dict[str, Any]], headers: Optional[Dict[str, str]],
+                    timeout: Optional[float], endpoint: Optional[str],
+                    avoid: Optional[WarmSession] = None, used: Optional[List[WarmSession]] = None,
+                    latency: Optional[LatencyWindow] = None) -> httpx.Response:
+        """
+        单次请求：取得限流配额，借用会话发出，被拦截时作废该会话并通知限流器降速。
+        used 记录本次借用的会话（对冲请求据此换会话），latency 记录正常响应的耗时（不含排队）。
+        """
+        async with self.governor.acquire(endpoint) as permit:
+            session = await self.acquire(avoid)
+            if used is not None:
+                used.append(session)
+            started = time.monotonic()
+            response = await self.http_client.get(
+                url, params=params, headers=headers, timeout=timeout,
+                raise_for_status=False, cookies=session.cookies
+            )
+            if is_blocked_response(response):
+                permit.blocked = True
+                self.invalidate(session)
+            elif latency is not None:
+                latency.record(time.monotonic() - started)
+        return response
+
+    async def _attempt(self, url: str, params: Optional[Dict[str, Any]], headers: Optional[Dict[str, str]],
+                       timeout: Optional[float], endpoint: str) -> httpx.Response:
+        """
+        一次（可能对冲的）请求。对冲只对 UPSTREAM_HEDGE_ENDPOINTS 中的接口生效：首个请求超过
+        该接口近期耗时的高百分位仍未返回时，换一个会话再发一次，先拿到响应的一方胜出并取消另一方；
+        两者都异常时抛出后失败的异常。对冲预算用完或该接口已有请求在排队时不对冲。
+        """
+        policy = self.hedge_policies.get(endpoint) if self.hedge_enabled else None
+        if policy is None:
+            return await self._send(url, params, headers, timeout, endpoint)
+        policy.on_request()
+        used: List[WarmSession] = []
+        primary = asyncio.ensure_future(
+            self._send(url, params, headers, timeout, endpoint, used=used, latency=policy.latency)
+        )
+        pending = {primary}
+        try:
+            delay = policy.delay()
+            done, _ = await asyncio.wait(pending, timeout=delay)
+            if not done:
+                limiter = self.governor.limiters.get(endpoint)
+                if limiter is not None and self.governor.enabled and limiter.queued > 0:
+                    policy.stats["skipped"] += 1
+                elif policy.try_fire():
+                    logger.info(f"[{endpoint}] {delay * 1000:.0f}ms 未响应，换会话发出对冲请求")
+                    pending.add(asyncio.ensure_future(self._send(
+                        url, params, headers, timeout, endpoint,
+                        avoid=used[0] if used else None, latency=policy.latency
+                    )))
+            while True:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                succeeded = [task for task in done if task.exception() is None]
+                if primary in succeeded:
+                    return primary.result()
+                if succeeded:
+                    policy.stats["won"] += 1
+                    return succeeded[0].result()
+                if not pending:
+                    return done.pop().result()
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def snapshot(self) -> Dict[str, Any]:
+        """当前池状态，供 /health 展示"""
+        return {
+            "size": self.size,
+            "warm": sum(1 for s in self.sessions if s.valid and s.age() < self.ttl),
+            **self.stats,
+            "breakers": {name: breaker.snapshot() for name, breaker in self.breakers.items()},
+            "hedging": {
+                "enabled": self.hedge_enabled,
+                **{name: policy.snapshot() for name, policy in self.hedge_policies.items()},
+            },
+        }
+
+    async def _new_session(self) -> Optional[WarmSession]:
+        cookies = httpx.Cookies()
+        try:
+            response = await self.http_client.get(
+                INIT_URL, headers={"Referer": INIT_URL}, raise_for_status=False, cookies=cookies
+            )
+        except httpx.HTTPError as e:
+            self.stats["init_failures"] += 1
+            logger.warning(f"会话预热失败: {e}")
+            return None
+        if is_blocked_response(response):
+            self.stats["init_failures"] += 1
+            logger.warning("会话预热被12306拦截")
+            return None
+        self.stats["created"] += 1
+        return WarmSession(cookies)
+
+    async def _fill(self):
+        async with self._lock:
+            self.sessions = [s for s in self.sessions if s.valid and s.age() < self.ttl]
+            missing = self.size - len(self.sessions)
+            if missing <= 0:
+                return
+            created = await asyncio.gather(*(self._new_session() for _ in range(missing)))
+            self.sessions.extend(s for s in created if s is not None)
+
+    async def _rotate_expiring(self):
+        """替换即将过期的会话：先建新会话再下线旧会话，保证池中始终有可用会话"""
+        deadline = self.ttl - self.refresh_margin
+        expiring = [s for s in self.sessions if s.age() >= deadline]
+        for old in expiring:
+            new = await self._new_session()
+            if new is None:
+                continue
+            async with self._lock:
+                if old in self.sessions:
+                    self.sessions[self.sessions.index(old)] = new
+                else:
+                    self.sessions.append(new)
+            self.stats["refreshed"] += 1
+
+    async def _refresh_loop(self):
+        interval = max(1.0, min(self.refresh_margin, self.ttl / 2))
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self._rotate_expiring()
+                await self._fill()
+            except Exception as e:
+                logger.error(f"会话刷新失败: {e}")
@@ -0,0 +1,337 @@
+"""MCP 会话存储"""
+
+import abc
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from mcp_12306.utils.config import get_settings
+
+logger = logging.getLogger(__name__)
+
+
+class SessionStore(abc.ABC):
+    """MCP 会话（Mcp-Session-Id）存储接口
+
+    会话闲置超过 ttl 秒即视为过期；get 命中时刷新最后使用时间（touch-on-use）。
+    共享实现可被同一台机器上的多个 worker 共用，任一进程签发的会话在其他进程同样有效；
+    目前没有网络共享的实现，多台主机的副本之间会话不互通，负载均衡需按 Mcp-Session-Id 保持会话粘滞。
+    会话数超过 max_sessions 时按最久未使用淘汰；过期会话由 sweep() 批量清理。
+    stats 为本进程的计数：created 新建、expired 过期清理、evicted 超上限淘汰。
+    """
+
+    name = "session_store"
+
+    def __init__(self, ttl: float, max_sessions: int = 10000):
+        self.ttl = ttl
+        self.max_sessions = max(1, max_sessions)
+        self.stats = {"created": 0, "expired": 0, "evicted": 0}
+
+    @abc.abstractmethod
+    async def create(self, session_id: str, info: Dict[str, Any]):
+        """写入新会话，超过 max_sessions 时淘汰最久未使用的会话"""
+
+    @abc.abstractmethod
+    async def get(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """读取未过期的会话并刷新最后使用时间，不存在或已过期返回 None"""
+
+    @abc.abstractmethod
+    async def update(self, session_id: str, **fields: Any) -> bool:
+        """合并更新会话字段，会话不存在时返回 False"""
+
+    @abc.abstractmethod
+    async def delete(self, session_id: str) -> bool:
+        """删除会话，会话不存在时返回 False"""
+
+    @abc.abstractmethod
+    async def count(self) -> int:
+        """未过期的会话数"""
+
+    @abc.abstractmethod
+    async def sweep(self) -> int:
+        """清理全部过期会话，返回清理数量"""
+
+    async def snapshot(self) -> Dict[str, Any]:
+        """当前状态，供 /health 展示"""
+        return {
+            "store": self.name, "active": await self.count(),
+            "ttl": self.ttl, "max_sessions": self.max_sessions, **self.stats,
+        }
+
+    def close(self):
+        pass
+
+
+class MemorySessionStore(SessionStore):
+    """进程内会话存储（单 worker 部署）"""
+
+    name = "memory"
+
+    def __init__(self, ttl: float, max_sessions: int = 10000):
+        super().__init__(ttl, max_sessions)
+        # session_id -> (会话信息, 最后使用时间)，按最后使用时间从旧到新排列
+        self._sessions: "OrderedDict[str, tuple[Dict[str, Any], float]]" = OrderedDict()
+
+    def _alive(self, session_id: str) -> Optional[Dict[str, Any]]:
+        item = self._sessions.get(session_id)
+        if item is None:
+            return None
+        info, last_seen = item
+        if time.monotonic() - last_seen > self.ttl:
+            del self._sessions[session_id]
+            self.stats["expired"] += 1
+            return None
+        return info
+
+    async def create(self, session_id: str, info: Dict[str, Any]):
+        self._sessions[session_id] = (dict(info), time.monotonic())
+        self._sessions.move_to_end(session_id)
+        self.stats["created"] += 1
+        while len(self._sessions) > self.max_sessions:
+            evicted, _ = self._sessions.popitem(last=False)
+            self.stats["evicted"] += 1
+            logger.info(f"MCP 会话数超过上限，淘汰最久未使用的会话: {evicted}")
+
+    async def get(self, session_id: str) -> Optional[Dict[str, Any]]:
+        info = self._alive(session_id)
+        if info is not None:
+            self._sessions[session_id] = (info, time.monotonic())
+            self._sessions.move_to_end(session_id)
+        return info
+
+    async def update(self, session_id: str, **fields: Any) -> bool:
+        info = await self.get(session_id)
+        if info is None:
+            return False
+        info.update(fields)
+        return True
+
+    async def delete(self, session_id: str) -> bool:
+        return self._sessions.pop(session_id, None) is not None
+
+    async def count(self) -> int:
+        cutoff = time.monotonic() - self.ttl
+        return sum(1 for _, last_seen in self._sessions.values() if last_seen >= cutoff)
+
+    async def sweep(self) -> int:
+        # 按最后使用时间有序，从最旧的一端清理到第一个未过期会话为止
+        cutoff = time.monotonic() - self.ttl
+        removed = 0
+        while self._sessions:
+            session_id, (_, last_seen) = next(iter(self._sessions.items()))
+            if last_seen >= cutoff:
+                break
+            del self._sessions[session_id]
+            removed += 1
+        self.stats["expired"] += removed
+        return removed
+
+
+class SqliteSessionStore(SessionStore):
+    """共享会话存储：SQLite（WAL 模式）
+
+    同一台机器上的多个 uvicorn worker 共用一个数据库文件（不支持放在网络文件系统上供多台主机共用）。
+    最后使用时间用墙钟时间；为减少写入，同一会话在 touch_interval 秒内只刷新一次。读写放到线程中执行。
+    数据库被锁或损坏时记录日志后按会话不存在处理（客户端重新 initialize），不向调用方抛出异常。
+    """
+
+    name = "sqlite"
+
+    def __init__(self, path: str, ttl: float, max_sessions: int = 10000):
+        super().__init__(ttl, max_sessions)
+        self.path = path
+        self.touch_interval = min(30.0, ttl / 10)
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=5.0, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS mcp_session ("
+            " session_id TEXT PRIMARY KEY,"
+            " info TEXT NOT NULL,"
+            " last_seen REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS mcp_session_last_seen ON mcp_session (last_seen)")
+
+    def _fetchone(self, sql: str, params: tuple = ()) -> Optional[tuple]:
+        with self._lock:
+            return self._conn.execute(sql, params).fetchone()
+
+    def _write(self, sql: str, params: tuple = ()) -> int:
+        with self._lock:
+            return self._conn.execute(sql, params).rowcount
+
+    def _create(self, session_id: str, info: Dict[str, Any]) -> int:
+        """写入新会话，超过上限时删除最久未使用的会话，返回淘汰数量"""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO mcp_session (session_id, info, last_seen) VALUES (?, ?, ?)",
+                    (session_id, json.dumps(info, ensure_ascii=False), time.time())
+                )
+                total = self._conn.execute("SELECT COUNT(*) FROM mcp_session").fetchone()[0]
+                evicted = 0
+                if total > self.max_sessions:
+                    evicted = self._conn.execute(
+                        "DELETE FROM mcp_session WHERE session_id IN ("
+                        " SELECT session_id FROM mcp_session ORDER BY last_seen LIMIT ?)",
+                        (total - self.max_sessions,)
+                    ).rowcount
+                self._conn.execute("COMMIT")
+            except Exception:
+                if self._conn.in_transaction:
+                    self._conn.execute("ROLLBACK")
+                raise
+        return evicted
+
+    def _get(self, session_id: str) -> Optional[Dict[str, Any]]:
+        now = time.time()
+        row = self._fetchone(
+            "SELECT info, last_seen FROM mcp_session WHERE session_id = ? AND last_seen >= ?",
+            (session_id, now - self.ttl)
+        )
+        if row is None:
+            return None
+        if now - row[1] >= self.touch_interval:
+            self._write("UPDATE mcp_session SET last_seen = ? WHERE session_id = ?", (now, session_id))
+        return json.loads(row[0])
+
+    def _update(self, session_id: str, fields: Dict[str, Any]) -> bool:
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT info FROM mcp_session WHERE session_id = ? AND last_seen >= ?",
+                    (session_id, time.time() - self.ttl)
+                ).fetchone()
+                if row is not None:
+                    info = json.loads(row[0])
+                    info.update(fields)
+                    self._conn.execute(
+                        "UPDATE mcp_session SET info = ?, last_seen = ? WHERE session_id = ?",
+                        (json.dumps(info, ensure_ascii=False), time.time(), session_id)
+                    )
+                self._conn.execute("COMMIT")
+            except Exception:
+                if self._conn.in_transaction:
+                    self._conn.execute("ROLLBACK")
+                raise
+        return row is not None
+
+    async def create(self, session_id: str, info: Dict[str, Any]):
+        try:
+            evicted = await asyncio.to_thread(self._create, session_id, info)
+        except (sqlite3.Error, TypeError, ValueError) as e:
+            logger.warning(f"写入 MCP 会话失败: {e}")
+            return
+        self.stats["created"] += 1
+        if evicted:
+            self.stats["evicted"] += evicted
+            logger.info(f"MCP 会话数超过上限，已淘汰 {evicted} 个最久未使用的会话")
+
+    async def get(self, session_id: str) -> Optional[Dict[str, Any]]:
+        try:
+            return await asyncio.to_thread(self._get, session_id)
+        except (sqlite3.Error, ValueError) as e:
+            logger.warning(f"读取 MCP 会话失败: {e}")
+            return None
+
+    async def update(self, session_id: str, **fields: Any) -> bool:
+        try:
+            return await asyncio.to_thread(self._update, session_id, fields)
+        except (sqlite3.Error, TypeError, ValueError) as e:
+            logger.warning(f"更新 MCP 会话失败: {e}")
+            return False
+
+    async def delete(self, session_id: str) -> bool:
+        try:
+            deleted = await asyncio.to_thread(
+                self._write, "DELETE FROM mcp_session WHERE session_id = ?", (session_id,)
+            )
+        except sqlite3.Error as e:
+            logger.warning(f"删除 MCP 会话失败: {e}")
+            return False
+        return deleted > 0
+
+    async def count(self) -> int:
+        try:
+            row = await asyncio.to_thread(
+                self._fetchone, "SELECT COUNT(*) FROM mcp_session WHERE last_seen >= ?", (time.time() - self.ttl,)
+            )
+        except sqlite3.Error as e:
+            logger.warning(f"统计 MCP 会话失败: {e}")
+            return 0
+        return row[0]
+
+    async def sweep(self) -> int:
+        try:
+            removed = await asyncio.to_thread(
+                self._write, "DELETE FROM mcp_session WHERE last_seen < ?", (time.time() - self.ttl,)
+            )
+        except sqlite3.Error as e:
+            logger.warning(f"清理过期 MCP 会话失败: {e}")
+            return 0
+        self.stats["expired"] += removed
+        return removed
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class SessionJanitor:
+    """后台定期清理过期会话，防止只 initialize 不再出现的客户端让会话表无限增长"""
+
+    def __init__(self, store: SessionStore, interval: Optional[float] = None):
+        self.store = store
+        self.interval = interval if interval is not None else get_settings().mcp_session_sweep_interval
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        if self.interval > 0 and self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _loop(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                removed = await self.store.sweep()
+                if removed:
+                    logger.info(f"已清理 {removed} 个过期 MCP 会话")
+            except Exception as e:
+                logger.error(f"清理过期 MCP 会话失败: {e}")
+
+
+def create_session_store(kind: Optional[str] = None) -> SessionStore:
+    """按配置（MCP_SESSION_STORE）创建会话存储，共享存储不可用时退回进程内存储"""
+    settings = get_settings()
+    kind = (kind or settings.mcp_session_store).lower()
+    ttl = settings.mcp_session_ttl
+    max_sessions = settings.mcp_session_max
+    if kind == "sqlite":
+        try:
+            store = SqliteSessionStore(settings.mcp_session_store_path, ttl, max_sessions)
+            logger.info(f"MCP 会话存储: sqlite {settings.mcp_session_store_path}")
+            return store
+        except sqlite3.Error as e:
+            logger.warning(f"共享会话存储不可用，改用进程内存储: {e}")
+    elif kind != "memory":
+        logger.warning(f"未知的会话存储 {kind}，改用进程内存储")
+    return MemorySessionStore(ttl, max_sessions)
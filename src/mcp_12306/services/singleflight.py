@@ -0,0 +1,64 @@
+"""并发相同上游请求合并（single-flight）"""
+
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+logger = logging.getLogger(__name__)
+
+
+class SingleFlight:
+    """同一key同一时刻只发起一次上游请求
+
+    并发调用方共享同一个任务的结果，异常同样传递给所有调用方。
+    任务独立于发起者运行，单个调用方被取消不会影响其他等待者。
+    调用时指定 cancel_abandoned=True 则在最后一个等待者被取消时一并取消任务（如不再需要的预取），
+    不再为无人等待的结果继续占用上游配额。
+    """
+
+    def __init__(self, name: str = "singleflight"):
+        self.name = name
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+        # 任务 -> 当前等待者数量
+        self._waiters: Dict[asyncio.Task, int] = {}
+        self.leaders = 0
+        self.shared = 0
+        self.abandoned = 0
+
+    def __len__(self) -> int:
+        return len(self._inflight)
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]], cancel_abandoned: bool = False) -> Any:
+        task = self._inflight.get(key)
+        if task is None:
+            self.leaders += 1
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda t, k=key: self._done(k, t))
+        else:
+            self.shared += 1
+            logger.debug(f"[{self.name}] 合并并发请求: {key}")
+        self._waiters[task] = self._waiters.get(task, 0) + 1
+        try:
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if cancel_abandoned and self._waiters[task] == 1 and not task.done():
+                task.cancel()
+                self.abandoned += 1
+                logger.debug(f"[{self.name}] 已无等待者，取消请求: {key}")
+            raise
+        finally:
+            self._waiters[task] -= 1
+            if not self._waiters[task]:
+                del self._waiters[task]
+
+    def _done(self, key: Hashable, task: asyncio.Task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        # 所有等待者都已取消时避免 "exception was never retrieved" 警告
+        if not task.cancelled():
+            task.exception()
+
+    def stats(self) -> Dict[str, Any]:
+        return {"in_flight": len(self._inflight), "leaders": self.leaders, "shared": self.shared,
+                "abandoned": self.abandoned}
@@ -0,0 +1,103 @@
+"""车站模糊搜索索引"""
+
+import heapq
+from array import array
+from typing import Dict, List, Sequence, Tuple
+
+
+def _lower(text: str) -> str:
+    """转小写；本来就是小写时复用原字符串对象，避免重复占用内存"""
+    lowered = text.lower()
+    return text if lowered == text else lowered
+
+
+def _fields_of(station) -> Tuple[str, ...]:
+    """参与匹配的字段（名称、拼音、简拼、三字码、城市），统一转为小写"""
+    return (
+        _lower(station.name.strip()),
+        _lower(station.pinyin),
+        _lower(station.py_short),
+        _lower(station.code),
+        _lower(station.city or ""),
+    )
+
+
+def _grams(text: str) -> set:
+    """文本的所有 1~3 字片段"""
+    grams = set(text)
+    grams.update(text[i:i + 2] for i in range(len(text) - 1))
+    grams.update(text[i:i + 3] for i in range(len(text) - 2))
+    return grams
+
+
+class StationSearchIndex:
+    """search_stations 的预计算索引
+
+    - 精确索引：名称/三字码/拼音/简拼（小写）-> 车站序号列表；
+    - 倒排索引：五个字段（含中文名与城市）的 1~3 字片段 -> 车站序号。
+    查询时取查询串各片段中最短的倒排列表作为候选，再逐个校验子串匹配并打分，
+    耗时只与候选数有关，不随车站总数线性增长。结果先列精确匹配（按加载顺序），
+    再列模糊匹配：按得分从高到低取前 limit 个，同分按加载顺序。
+    """
+
+    def __init__(self, stations: Sequence):
+        self.stations = stations
+        self._fields: List[Tuple[str, ...]] = []
+        self._exact: Dict[str, array] = {}
+        postings: Dict[str, array] = {}
+        for i, s in enumerate(stations):
+            fields = _fields_of(s)
+            self._fields.append(fields)
+            name, pinyin, py_short, code, _ = fields
+            for key in {name, code, pinyin, py_short}:
+                self._exact.setdefault(key, array("I")).append(i)
+            grams = set()
+            for text in fields:
+                grams |= _grams(text)
+            for g in grams:
+                postings.setdefault(g, array("I")).append(i)
+        self._postings = postings
+
+    def _candidates(self, query: str) -> Sequence[int]:
+        if not query:
+            return range(len(self.stations))
+        if len(query) <= 3:
+            return self._postings.get(query, ())
+        best: Sequence[int] = ()
+        for i in range(len(query) - 2):
+            posting = self._postings.get(query[i:i + 3])
+            if posting is None:
+                return ()
+            if not best or len(posting) < len(best):
+                best = posting
+        return best
+
+    @staticmethod
+    def _score(query: str, fields: Tuple[str, ...]) -> float:
+        """模糊匹配得分 (0, 1)：覆盖率越高越好，前缀匹配优于中间匹配"""
+        best = 0.0
+        for text in fields:
+            if text and query in text:
+                score = len(query) / len(text) * (1.0 if text.startswith(query) else 0.8)
+                best = max(best, score)
+        return round(0.9 * best, 3)
+
+    def search(self, query: str, limit: int = 10) -> List[Tuple[object, float]]:
+        """返回 [(车站, 得分)]；精确匹配得分为 1.0"""
+        results: List[Tuple[object, float]] = []
+        exact = self._exact.get(query, ())
+        for i in exact:
+            results.append((self.stations[i], 1.0))
+            if len(results) >= limit:
+                return results
+        matched = set(exact)
+        fuzzy = []
+        for i in self._candidates(query):
+            if i in matched:
+                continue
+            fields = self._fields[i]
+            if any(query in text for text in fields):
+                fuzzy.append((self.stations[i], self._score(query, fields)))
+        # 先排序再截断，避免高分车站因加载顺序靠后被挤出结果；nlargest 同分时保持原顺序
+        results.extend(heapq.nlargest(limit - len(results), fuzzy, key=lambda hit: hit[1]))
+        return results
@@ -0,0 +1,93 @@
+"""车站数据热重载"""
+
+import asyncio
+import logging
+import os
+import time
+from typing import Any, Dict, Optional, Tuple
+
+from mcp_12306.utils.config import get_settings
+from .station_service import StationService
+
+logger = logging.getLogger(__name__)
+
+
+def file_signature(path: str) -> Optional[Tuple[float, int]]:
+    """文件的 (修改时间, 大小)，文件不存在时返回 None"""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_mtime, st.st_size
+
+
+class StationRefresher:
+    """车站数据后台刷新器
+
+    定期检查车站JS文件的修改时间与大小，变化后在线程中重建车站表与索引，
+    建好后由 StationService 一次性换入；也可通过 reload() 手动触发。
+    interval 为 0 时不启动后台检查，只支持手动重载。
+    """
+
+    def __init__(self, station_service: StationService, path: Optional[str] = None,
+                 interval: Optional[float] = None):
+        self.station_service = station_service
+        self.path = path
+        self.interval = interval if interval is not None else get_settings().station_reload_interval
+        self._signature: Optional[Tuple[float, int]] = None
+        self._task: Optional[asyncio.Task] = None
+        self.stats = {"reloads": 0, "failures": 0, "last_reload": None}
+
+    @property
+    def source_path(self) -> str:
+        return self.path or self.station_service.source_path
+
+    async def start(self):
+        """记录当前文件状态并启动后台检查任务"""
+        self._signature = file_signature(self.source_path)
+        if self.interval > 0 and self._task is None:
+            self._task = asyncio.create_task(self._watch_loop())
+            logger.info(f"车站数据热重载已启用: 每 {self.interval:.0f} 秒检查 {self.source_path}")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def reload(self) -> Dict[str, Any]:
+        """立即重载车站数据，返回重载结果"""
+        path = self.source_path
+        signature = file_signature(path)
+        start = time.perf_counter()
+        ok = await self.station_service.reload_stations(path)
+        if ok:
+            self._signature = signature
+            self.stats["reloads"] += 1
+            self.stats["last_reload"] = time.time()
+        else:
+            self.stats["failures"] += 1
+        return {
+            "ok": ok,
+            "path": path,
+            "stations": len(self.station_service.stations),
+            "elapsed_ms": round((time.perf_counter() - start) * 1000, 1),
+        }
+
+    def snapshot(self) -> Dict[str, Any]:
+        """当前状态，供 /health 展示"""
+        return {"path": self.source_path, "interval": self.interval, **self.stats}
+
+    async def _watch_loop(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                signature = file_signature(self.source_path)
+                if signature is not None and signature != self._signature:
+                    logger.info(f"检测到车站数据文件变化，开始重载: {self.source_path}")
+                    await self.reload()
+            except Exception as e:
+                logger.error(f"车站数据热重载失败: {e}")
@@ -1,145 +1,283 @@
+import asyncio
+import hashlib
 import os
+import pickle
 import re
+import sys
 import aiofiles
 import logging
-from typing import Optional
+from typing import Dict, List, Optional
+
+from .station_index import StationSearchIndex
+
+DEFAULT_STATION_JS = "src/mcp_12306/resources/station_name.js"
+# 快照结构变化（Station 字段、索引实现）时递增，旧快照自动作废
+SNAPSHOT_VERSION = 2
 
 class Station:
+    # 每个进程常驻数千个车站对象，使用 __slots__ 去掉实例 __dict__；
+    # 城市、三字码等高度重复的短字符串做驻留，多个车站共享同一对象
+    __slots__ = ("name", "code", "pinyin", "py_short", "num", "city")
+
     def __init__(self, name, code, pinyin, py_short, num, city=None):
         self.name = name
-        self.code = code
+        self.code = sys.intern(code)
         self.pinyin = pinyin
-        self.py_short = py_short
+        self.py_short = sys.intern(py_short)
         self.num = num
-        self.city = city  # 城市字段可选
+        self.city = sys.intern(city) if city else city  # 城市字段可选
 
     def __repr__(self):
         return f"Station(name={self.name}, code={self.code}, pinyin={self.pinyin}, city={self.city})"
 
 class StationSearchResult:
-    def __init__(self, stations):
+    def __init__(self, stations, scores=None):
+        self.stations = stations
+        # 与 stations 一一对应的相关度得分，精确匹配为 1.0
+        self.scores = scores if scores is not None else [1.0] * len(stations)
+
+_STATION_NAMES_RE = re.compile(r"var station_names ?= ?'(.*?)';")
+_QUOTED_DATA_RE = re.compile(r"'(@[^']+)';")
+# 修正字段时从哪些下标里找（与原排列组合尝试范围一致）
+_CODE_SEARCH_END = 5
+_PINYIN_SEARCH_END = 6
+_PY_SHORT_SEARCH_END = 7
+# 汇总日志中每类问题最多列出的样例数
+_WARNING_SAMPLES = 3
+
+
+def _is_code(val: str) -> bool:
+    return len(val) == 3 and val.isalpha() and val.isupper()
+
+
+def _is_pinyin(val: str) -> bool:
+    return len(val) >= 2 and val.isalpha() and val.islower()
+
+
+def _is_py_short(val: str) -> bool:
+    return 1 <= len(val) <= 8 and val.isalpha() and val.islower()
+
+
+def _repair(parts: List[str], end: int, check) -> Optional[str]:
+    """在 parts[1:end] 中找第一个符合规则的字段"""
+    for val in parts[1:min(end, len(parts))]:
+        if check(val):
+            return val
+    return None
+
+
+def parse_station_js(content: str) -> Optional[List[Station]]:
+    """
+    解析12306原始JS，提取站点及所属城市信息
+    自动检测并修复字段顺序异常的数据行，增强排列组合尝试。
+
+    单遍扫描：三个字段都合规的行（绝大多数）直接构建，只有异常行才尝试修正；
+    修正与跳过情况汇总成一条日志，不逐行输出。纯CPU计算，运行时应放到线程中执行。
+    """
+    m = _STATION_NAMES_RE.search(content) or _QUOTED_DATA_RE.search(content)
+    if not m:
+        logging.error("未能解析到站点JS内容")
+        return None
+    result = []
+    issues: Dict[str, List[str]] = {}
+
+    def note(kind: str, sample: str):
+        issues.setdefault(kind, []).append(sample)
+
+    for st in m.group(1).split('@'):
+        if not st:
+            continue
+        parts = st.split('|')
+        if len(parts) < 8:
+            note("字段数异常已跳过", st)
+            continue
+        # 正确解析顺序：@id|车站名|三字码|拼音|简拼|编号|区域码|城市|...
+        name = parts[1].strip()
+        code = parts[2].strip()
+        pinyin = parts[3].strip()
+        py_short = parts[4].strip()
+        if not (_is_code(code) and _is_pinyin(pinyin) and _is_py_short(py_short)):
+            if not _is_code(code):
+                fixed = _repair(parts, _CODE_SEARCH_END, _is_code)
+                if fixed is None:
+                    note("三字码无法修正", st)
+                else:
+                    code = fixed
+                    note("三字码已修正", f"{name}=>{code}")
+            if not _is_pinyin(pinyin):
+                fixed = _repair(parts, _PINYIN_SEARCH_END, _is_pinyin)
+                if fixed is None:
+                    note("拼音无法修正", st)
+                else:
+                    pinyin = fixed
+                    note("拼音已修正", f"{name}=>{pinyin}")
+            if not _is_py_short(py_short):
+                fixed = _repair(parts, _PY_SHORT_SEARCH_END, _is_py_short)
+                if fixed is None:
+                    note("简拼无法修正", st)
+                else:
+                    py_short = fixed
+                    note("简拼已修正", f"{name}=>{py_short}")
+        result.append(Station(name, code, pinyin, py_short, parts[5].strip(), parts[7].strip()))
+    if issues:
+        summary = "；".join(
+            f"{kind} {len(samples)} 条（如 {', '.join(samples[:_WARNING_SAMPLES])}）"
+            for kind, samples in issues.items()
+        )
+        logging.warning(f"车站数据存在字段异常，共解析 {len(result)} 个车站：{summary}")
+    return result
+
+
+def content_digest(content: str) -> str:
+    """车站JS内容哈希，用于判断快照是否过期"""
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+def default_snapshot_path(js_path: str) -> str:
+    """快照默认与车站JS放在同一目录"""
+    return os.path.join(os.path.dirname(js_path), "station_snapshot.pkl")
+
+
+class StationTable:
+    """车站列表及其全部查询索引，构建完成后只读"""
+
+    def __init__(self, stations: List[Station], source_digest: Optional[str] = None):
         self.stations = stations
+        self.source_digest = source_digest
+        self.by_name: Dict[str, Station] = {}
+        self.by_code: Dict[str, Station] = {}
+        for s in stations:
+            # 名称/三字码取第一次出现的车站，与原线性查找结果一致
+            self.by_name.setdefault(s.name.strip(), s)
+            self.by_code.setdefault(s.code, s)
+        self.search_index = StationSearchIndex(stations)
+
+
+def write_snapshot(table: StationTable, path: str):
+    """把已建好索引的车站表写成快照（先写临时文件再原子替换）"""
+    payload = {"version": SNAPSHOT_VERSION, "source_digest": table.source_digest, "table": table}
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        pickle.dump(payload, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, path)
+
+
+def read_snapshot(path: str, source_digest: str) -> Optional[StationTable]:
+    """读取快照；不存在、版本不符或与车站JS内容不一致时返回 None"""
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "rb") as f:
+            payload = pickle.load(f)
+    except Exception as e:
+        logging.warning(f"车站快照读取失败，改为解析JS: {e}")
+        return None
+    if payload.get("version") != SNAPSHOT_VERSION:
+        logging.info("车站快照版本不匹配，改为解析JS")
+        return None
+    if payload.get("source_digest") != source_digest:
+        logging.info("车站快照已过期（JS内容已变化），改为解析JS")
+        return None
+    return payload["table"]
+
+
+def table_from_content(content: str, snapshot_path: str, use_snapshot: bool = True) -> Optional[StationTable]:
+    """由车站JS内容得到车站表：快照有效时直接读取，否则解析并建索引"""
+    digest = content_digest(content)
+    table = read_snapshot(snapshot_path, digest) if use_snapshot else None
+    if table is not None:
+        logging.info(f"已从快照加载{len(table.stations)}个车站: {snapshot_path}")
+        return table
+    result = parse_station_js(content)
+    if result is None:
+        return None
+    logging.info(f"已加载{len(result)}个车站（含城市信息，自动排列修正字段）")
+    return StationTable(result, digest)
+
+
+def build_station_table(path: str, snapshot_path: Optional[str] = None,
+                        use_snapshot: bool = True) -> Optional[StationTable]:
+    """同步读取车站JS并构建车站表（供线程池执行）"""
+    if not os.path.exists(path):
+        logging.error(f"站点文件不存在: {path}")
+        return None
+    with open(path, mode="r", encoding="utf-8") as f:
+        content = f.read()
+    return table_from_content(content, snapshot_path or default_snapshot_path(path), use_snapshot)
+
 
 class StationService:
     def __init__(self):
-        self.stations = []
+        # 车站表与索引整体替换：查询方法只读取 self._table 一次，
+        # 热重载时新表在后台线程建好后一次赋值换入，进行中的查询不会看到半成品
+        self._table = StationTable([])
+        self.source_path = DEFAULT_STATION_JS
+        self._reload_lock = asyncio.Lock()
 
-    async def load_stations(self, path="src/mcp_12306/resources/station_name.js"):
+    @property
+    def stations(self) -> List[Station]:
+        return self._table.stations
+
+    def set_stations(self, stations, source_digest=None):
+        """替换车站列表并重建索引"""
+        self._table = StationTable(stations, source_digest)
+
+    async def load_stations(self, path=DEFAULT_STATION_JS, snapshot_path=None, use_snapshot=True):
         """
-        解析12306原始JS，提取站点及所属城市信息
-        自动检测并修复字段顺序异常的数据行，增强排列组合尝试。
+        加载车站数据：优先读取与JS内容哈希一致的预编译快照，
+        快照缺失或过期（或 use_snapshot=False）时解析12306原始JS。
         """
         if not os.path.exists(path):
             logging.error(f"站点文件不存在: {path}")
             return
+        self.source_path = path
         async with aiofiles.open(path, mode="r", encoding="utf-8") as f:
             content = await f.read()
-        m = re.search(r"var station_names ?= ?'(.*?)';", content)
-        if not m:
-            m = re.search(r"'(@[^']+)';", content)
-        if not m:
-            logging.error("未能解析到站点JS内容")
-            return
-        data = m.group(1)
-        stations_raw = [s for s in data.split('@') if s]
-        result = []
-        for st in stations_raw:
-            parts = st.split('|')
-            if len(parts) < 8:
-                logging.warning(f"字段数异常，跳过：{st}")
-                continue
-            # 正确解析顺序：@id|车站名|三字码|拼音|简拼|编号|区域码|城市|...
-            name = parts[1].strip()
-            code = parts[2].strip()
-            pinyin = parts[3].strip()
-            py_short = parts[4].strip()
-            num = parts[5].strip()
-            city = parts[7].strip()
-            # 检查三字码、拼音、简拼是否合规，否则尝试排列组合
-            def is_code(val):
-                return val.isalpha() and val.isupper() and len(val) == 3
-            def is_pinyin(val):
-                return val.isalpha() and val.islower() and len(val) >= 2
-            def is_py_short(val):
-                return val.isalpha() and val.islower() and 1 <= len(val) <= 8
-            if not is_code(code):
-                found = False
-                for idx in range(1, min(5, len(parts))):
-                    if is_code(parts[idx]):
-                        code = parts[idx]
-                        found = True
-                        logging.warning(f"自动排列修正三字码：{name} => {code}")
-                        break
-                if not found:
-                    logging.warning(f"三字码无法修正：{st}")
-            if not is_pinyin(pinyin):
-                found = False
-                for idx in range(1, min(6, len(parts))):
-                    if is_pinyin(parts[idx]):
-                        pinyin = parts[idx]
-                        found = True
-                        logging.warning(f"自动排列修正拼音：{name} => {pinyin}")
-                        break
-                if not found:
-                    logging.warning(f"拼音无法修正：{st}")
-            if not is_py_short(py_short):
-                found = False
-                for idx in range(1, min(7, len(parts))):
-                    if is_py_short(parts[idx]):
-                        py_short = parts[idx]
-                        found = True
-                        logging.warning(f"自动排列修正简拼：{name} => {py_short}")
-                        break
-                if not found:
-                    logging.warning(f"简拼无法修正：{st}")
-            result.append(Station(name, code, pinyin, py_short, num, city))
-        self.stations = result
-        logging.info(f"已加载{len(self.stations)}个车站（含城市信息，自动排列修正字段）")
+        # 哈希、快照读取、解析与建索引都是纯CPU工作，放到线程中执行，不阻塞事件循环
+        table = await asyncio.to_thread(
+            table_from_content, content, snapshot_path or default_snapshot_path(path), use_snapshot
+        )
+        if table is not None:
+            self._table = table
+
+    async def reload_stations(self, path=None, snapshot_path=None) -> bool:
+        """
+        热重载车站数据：在线程中读取并构建新的车站表与索引，完成后原子替换。
+        构建失败时保留旧数据，返回 False。
+        """
+        path = path or self.source_path
+        async with self._reload_lock:
+            table = await asyncio.to_thread(build_station_table, path, snapshot_path)
+            if table is None or not table.stations:
+                logging.error(f"车站数据重载失败，继续使用现有 {len(self.stations)} 个车站")
+                return False
+            self._table = table
+            self.source_path = path
+        logging.info(f"车站数据已热重载: {len(table.stations)} 个车站")
+        return True
+
+    def save_snapshot(self, path=None, js_path=DEFAULT_STATION_JS):
+        """把当前车站表写成预编译快照，返回快照路径"""
+        path = path or default_snapshot_path(js_path)
+        write_snapshot(self._table, path)
+        return path
 
     async def get_station_by_name(self, name):
         name = name.strip()
         if name.endswith("站") and len(name) > 2:
             name = name[:-1]
-        for s in self.stations:
-            if s.name.strip() == name:
-                return s
-        return None
+        return self._table.by_name.get(name)
 
     async def get_station_by_code(self, code):
-        for s in self.stations:
-            if s.code == code:
-                return s
-        return None
+        return self._table.by_code.get(code)
 
     async def search_stations(self, query, limit=10):
         query = query.strip().lower()
         if query.endswith("站") and len(query) > 2:
             query = query[:-1]
-        results = []
-        matched_ids = set()
-        # 1. 精确匹配
-        for s in self.stations:
-            if (query == s.name.strip().lower() or
-                query == s.code.lower() or
-                query == s.pinyin.lower() or
-                query == s.py_short.lower()):
-                results.append(s)
-                matched_ids.add(id(s))
-                if len(results) >= limit:
-                    return StationSearchResult(results)
-        # 2. 模糊匹配（含city）
-        for s in self.stations:
-            if id(s) in matched_ids:
-                continue
-            if (query in s.name.strip().lower() or
-                query in s.pinyin.lower() or
-                query in s.py_short.lower() or
-                query in s.code.lower() or
-                (s.city and query in s.city.lower())):
-                results.append(s)
-                if len(results) >= limit:
-                    break
-        return StationSearchResult(results)
+        # 先精确匹配，再模糊匹配（含city），均走预计算索引
+        hits = self._table.search_index.search(query, limit)
+        return StationSearchResult([s for s, _ in hits], [score for _, score in hits])
 
     async def get_station_code(self, query: str) -> Optional[str]:
         if not query:
@@ -148,12 +286,13 @@ class StationService:
         # 兼容“站”
         if q.endswith("站") and len(q) > 2:
             q = q[:-1]
+        table = self._table
         # 1. 精确匹配 name（区分大小写，通常为中文）
-        for s in self.stations:
-            if q == s.name:
-                return s.code
+        s = table.by_name.get(q)
+        if s is not None:
+            return s.code
         # 2. 精确匹配 code（三字码，区分大小写，通常为大写）
-        for s in self.stations:
-            if q == s.code:
-                return s.code
+        s = table.by_code.get(q)
+        if s is not None:
+            return s.code
         return None
\ No newline at end of file
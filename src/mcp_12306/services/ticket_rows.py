@@ -0,0 +1,176 @@
+"""queryG 余票行解码"""
+
+from operator import attrgetter, itemgetter
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+# queryG 每行以 | 分隔：secret|按钮文字|train_no|车次号|始发|终到|出发站|到达站|出发时间|到达时间|历时|可购买|...
+# 全部字段位置只在这里定义
+TRAIN_NO = 2
+TRAIN_CODE = 3
+FROM_TELECODE = 6
+TO_TELECODE = 7
+START_TIME = 8
+ARRIVE_TIME = 9
+DURATION = 10
+CAN_WEB_BUY = 11
+ADVANCED_SOFT_SLEEPER_NUM = 21
+SOFT_SLEEPER_NUM = 23
+SOFT_SEAT_NUM = 24
+NO_SEAT_NUM = 26
+HARD_SLEEPER_NUM = 28
+HARD_SEAT_NUM = 29
+SECOND_CLASS_NUM = 30
+FIRST_CLASS_NUM = 31
+BUSINESS_SEAT_NUM = 32
+DONGWO_NUM = 33
+# 字段不足的行（格式异常或被截断）直接跳过
+MIN_FIELDS = 35
+# 只切出用到的字段，之后的部分（约 20 个字段）保留为一个整体不再切分
+_MAX_SPLIT = MIN_FIELDS - 1
+
+
+class TicketRow(NamedTuple):
+    """一行余票数据（余票字段保留原值，空字符串表示该席别不售）"""
+    train_no: str
+    train_code: str
+    from_telecode: str
+    to_telecode: str
+    start_time: str
+    arrive_time: str
+    duration: str
+    can_web_buy: str
+    business_seat_num: str
+    first_class_num: str
+    second_class_num: str
+    advanced_soft_sleeper_num: str
+    soft_sleeper_num: str
+    dongwo_num: str
+    hard_sleeper_num: str
+    soft_seat_num: str
+    hard_seat_num: str
+    no_seat_num: str
+
+
+# 席别：(记录中的键名, 中文名)，按输出顺序排列；TicketRow 中对应字段为 键名 + "_num"
+SEAT_CLASSES = (
+    ("business_seat", "商务座"),
+    ("first_class", "一等座"),
+    ("second_class", "二等座"),
+    ("advanced_soft_sleeper", "高级软卧"),
+    ("soft_sleeper", "软卧"),
+    ("hard_sleeper", "硬卧"),
+    ("soft_seat", "软座"),
+    ("hard_seat", "硬座"),
+    ("no_seat", "无座"),
+    ("dongwo", "动卧"),
+)
+_SEAT_FIELDS = tuple((key, TicketRow._fields.index(key + "_num")) for key, _ in SEAT_CLASSES)
+_SEAT_INDEX = dict(_SEAT_FIELDS)
+# 可用于排序的字段；到达时间按跨天后的绝对时刻（arrive_offset）排序
+SORT_FIELDS = ("start_time", "arrive_time", "duration")
+# 时刻无法解析的车次排在最后，也不满足任何到达时间条件
+_UNKNOWN_MINUTES = 1 << 30
+
+
+# 与 TicketRow 字段顺序一致，一次 C 层取值完成整行解码
+_pick = itemgetter(
+    TRAIN_NO, TRAIN_CODE, FROM_TELECODE, TO_TELECODE, START_TIME, ARRIVE_TIME, DURATION, CAN_WEB_BUY,
+    BUSINESS_SEAT_NUM, FIRST_CLASS_NUM, SECOND_CLASS_NUM, ADVANCED_SOFT_SLEEPER_NUM, SOFT_SLEEPER_NUM,
+    DONGWO_NUM, HARD_SLEEPER_NUM, SOFT_SEAT_NUM, HARD_SEAT_NUM, NO_SEAT_NUM
+)
+_make = TicketRow._make
+
+
+def decode_rows(rows: Iterable[str]) -> List[TicketRow]:
+    """解码 queryG 的 result 数组，每行只 split 一次，跳过字段不足的行"""
+    decoded = []
+    append = decoded.append
+    for row in rows:
+        parts = row.split("|", _MAX_SPLIT)
+        if len(parts) >= MIN_FIELDS:
+            append(_make(_pick(parts)))
+    return decoded
+
+
+def seat_counts(row: TicketRow) -> Dict[str, str]:
+    """该车次在售席别的余票（键名见 SEAT_CLASSES），不售的席别不出现"""
+    return {key: row[index] for key, index in _SEAT_FIELDS if row[index]}
+
+
+def has_seats(num: str) -> bool:
+    """余票值是否表示有票：'有' 或大于 0 的数字；'无'、'*'、'--'、空均为无票"""
+    return num == "有" or (num.isdigit() and int(num) > 0)
+
+
+def clock_minutes(value: str) -> Optional[int]:
+    """HH:MM（小时可超过 24，如历时 26:30）转为分钟数，格式不对返回 None"""
+    hours, sep, minutes = value.partition(":")
+    if not sep or not hours.isdigit() or not minutes.isdigit():
+        return None
+    return int(hours) * 60 + int(minutes)
+
+
+def arrive_offset(row: TicketRow) -> int:
+    """到达时刻相对出发当天零点的分钟数，由出发时间加历时得出，次日到达时大于 1440"""
+    start = clock_minutes(row.start_time)
+    duration = clock_minutes(row.duration)
+    if start is not None and duration is not None:
+        return start + duration
+    arrive = clock_minutes(row.arrive_time)
+    return arrive if arrive is not None else _UNKNOWN_MINUTES
+
+
+def _duration_minutes(row: TicketRow) -> int:
+    duration = clock_minutes(row.duration)
+    return duration if duration is not None else _UNKNOWN_MINUTES
+
+
+_SORT_KEYS = {
+    "start_time": attrgetter("start_time"),
+    "arrive_time": arrive_offset,
+    "duration": _duration_minutes,
+}
+
+
+class TicketFilter(NamedTuple):
+    """余票行的筛选、排序与截断条件，空值表示不限
+
+    train_types: 车次首字母（G/D/K…），任一匹配即保留
+    depart_after/depart_before、arrive_after/arrive_before: HH:MM，含端点；
+        到达时间按出发当天的时刻比较，次日到达的车次晚于当天任何时刻
+    seat_classes: 席别键名（见 SEAT_CLASSES），任一席别有票即保留
+    sort_by: SORT_FIELDS 之一，升序且保持12306原顺序为次序
+    limit: 筛选排序后最多保留的车次数
+    """
+    train_types: Tuple[str, ...] = ()
+    depart_after: Optional[str] = None
+    depart_before: Optional[str] = None
+    arrive_after: Optional[str] = None
+    arrive_before: Optional[str] = None
+    seat_classes: Tuple[str, ...] = ()
+    sort_by: Optional[str] = None
+    limit: Optional[int] = None
+
+    def apply(self, rows: List[TicketRow]) -> List[TicketRow]:
+        """在渲染前对解码后的余票行筛选、排序并截断"""
+        if self.train_types:
+            prefixes = self.train_types
+            rows = [row for row in rows if row.train_code.startswith(prefixes)]
+        if self.depart_after:
+            rows = [row for row in rows if row.start_time >= self.depart_after]
+        if self.depart_before:
+            rows = [row for row in rows if row.start_time <= self.depart_before]
+        if self.arrive_after:
+            earliest = clock_minutes(self.arrive_after)
+            rows = [row for row in rows if _UNKNOWN_MINUTES > arrive_offset(row) >= earliest]
+        if self.arrive_before:
+            latest = clock_minutes(self.arrive_before)
+            rows = [row for row in rows if arrive_offset(row) <= latest]
+        if self.seat_classes:
+            indexes = [_SEAT_INDEX[key] for key in self.seat_classes]
+            rows = [row for row in rows if any(has_seats(row[index]) for index in indexes)]
+        if self.sort_by:
+            rows = sorted(rows, key=_SORT_KEYS[self.sort_by])
+        if self.limit:
+            rows = rows[:self.limit]
+        return rows
@@ -1,126 +1,400 @@
 """车票查询服务"""
 
+import asyncio
 import logging
 import urllib.parse
-from typing import List, Optional
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
 from datetime import datetime
 
+import httpx
+from pydantic import TypeAdapter
+
 from ..models.ticket import Ticket, TicketQuery, TicketSearchResult
-from .http_client import HttpClient
+from ..utils.config import get_settings
+from .cache import TTLCache
+from .cache_backend import CacheBackend
+from .http_client import HttpClient, UpstreamError
+from .session_pool import SessionPool, is_blocked_response
+from .singleflight import SingleFlight
 from .station_service import StationService
+from .ticket_rows import TicketRow, decode_rows
+from .timetable_cache import TimetableCache
+from .train_resolver import TrainNoResolver
 
 logger = logging.getLogger(__name__)
 
+LEFT_TICKET_URL = "https://kyfw.12306.cn/otn/leftTicket/queryG"
+LEFT_TICKET_HEADERS = {
+    "Referer": "https://kyfw.12306.cn/otn/leftTicket/init",
+    "Host": "kyfw.12306.cn",
+    "Accept": "application/json, text/javascript, */*; q=0.01"
+}
+ROUTE_URL = "https://kyfw.12306.cn/otn/czxx/queryByTrainNo"
+TRANSFER_URL = "https://kyfw.12306.cn/otn/leftTicket/queryG"
+TRANSFER_PAGE_SIZE = 10
+# 余票记录转 Ticket 列表的批量校验器
+_TICKET_LIST = TypeAdapter(List[Ticket])
+XHR_HEADERS = {
+    "Referer": "https://kyfw.12306.cn/otn/leftTicket/init",
+    "Accept": "application/json, text/javascript, */*; q=0.01",
+    "Accept-Language": "zh-CN,zh;q=0.9",
+    "Host": "kyfw.12306.cn",
+    "X-Requested-With": "XMLHttpRequest",
+    "Origin": "https://kyfw.12306.cn"
+}
+
 
 class TicketService:
     """车票查询服务"""
     
-    def __init__(self):
-        self.http_client = HttpClient()
-        self.station_service = StationService()
+    def __init__(self, http_client: Optional[HttpClient] = None,
+                 station_service: Optional[StationService] = None,
+                 session_pool: Optional[SessionPool] = None,
+                 train_resolver: Optional[TrainNoResolver] = None,
+                 timetable_cache: Optional[TimetableCache] = None,
+                 cache_backend: Optional[CacheBackend] = None):
+        # 默认注入进程共享的连接池客户端与车站服务，由服务启动/关闭时统一管理生命周期
+        settings = get_settings()
+        self.http_client = http_client or HttpClient()
+        self.station_service = station_service or StationService()
+        self.session_pool = session_pool or SessionPool(self.http_client)
+        # queryG 原始 result 数组缓存，key 为 (from, to, date, purpose)；
+        # 传入 cache_backend 时余票、车次解析、经停站三个缓存都以它为共享第二层
+        self.left_ticket_cache = TTLCache(
+            ttl=settings.ticket_cache_ttl,
+            max_entries=settings.ticket_cache_max_entries,
+            max_bytes=settings.ticket_cache_max_bytes,
+            stale_ttl=settings.ticket_cache_stale_ttl,
+            name="leftTicket",
+            backend=cache_backend
+        )
+        self.cache_swr = settings.ticket_cache_swr
+        # 每次解析 queryG 结果时顺带记录车次号 -> 列车编号
+        self.train_resolver = train_resolver or TrainNoResolver(backend=cache_backend)
+        # 经停站按 (train_no, depart_date) 缓存到当天结束，可选落盘
+        self.timetable_cache = timetable_cache or TimetableCache(backend=cache_backend)
+        # 并发的相同上游请求合并为一次
+        self.inflight = SingleFlight(name="upstream")
+        self.transfer_page_concurrency = max(1, settings.transfer_page_concurrency)
+        self.batch_concurrency = max(1, settings.batch_query_concurrency)
         
-    async def query_tickets(self, query: TicketQuery) -> TicketSearchResult:
-        """查询车票"""
-        try:
-            # 获取车站代码
-            from_code = await self.station_service.get_station_code(query.from_station)
-            to_code = await self.station_service.get_station_code(query.to_station)
-            
-            if not from_code or not to_code:
-                logger.error(f"无法找到车站代码: {query.from_station} -> {query.to_station}")
-                return TicketSearchResult(
-                    tickets=[],
-                    query_info=query,
-                    total=0
-                )
-                
-            # 构建查询URL - 使用硬编码的queryG地址
-            url = "https://kyfw.12306.cn/otn/leftTicket/queryG"
+    async def fetch_left_ticket_rows(self, from_code: str, to_code: str, train_date: str,
+                                     purpose_codes: str = "ADULT") -> List[str]:
+        """获取 leftTicket/queryG 的原始 result 数组（带TTL缓存）
+
+        参数须为三字码；请求失败时抛出 UpstreamError，失败结果不会被缓存。
+        """
+        key = (from_code, to_code, train_date, purpose_codes)
+        
+        async def fetch() -> List[str]:
             params = {
-                'leftTicketDTO.train_date': query.train_date,
-                'leftTicketDTO.from_station': from_code,
-                'leftTicketDTO.to_station': to_code,
-                'purpose_codes': query.purpose_codes
+                "leftTicketDTO.train_date": train_date,
+                "leftTicketDTO.from_station": from_code,
+                "leftTicketDTO.to_station": to_code,
+                "purpose_codes": purpose_codes
             }
-            
-            async with self.http_client:
-                response = await self.http_client.get(url, params=params)
-                data = response.json()
-                
-                if not data.get('status'):
-                    logger.error(f"12306返回错误: {data.get('messages', '未知错误')}")
-                    return TicketSearchResult(
-                        tickets=[],
-                        query_info=query,
-                        total=0
+            resp = await self.session_pool.get(
+                LEFT_TICKET_URL, headers=LEFT_TICKET_HEADERS, params=params, timeout=8,
+                raise_for_status=False, endpoint="queryG"
+            )
+            logger.info(f"12306 queryG status: {resp.status_code}, url: {resp.url}")
+            if resp.status_code != 200:
+                logger.error(f"12306接口返回异常: {resp.status_code}, body: {resp.text}")
+                raise UpstreamError(f"12306接口返回异常: {resp.status_code}\n{resp.text}")
+            try:
+                payload = resp.json()
+                rows = payload.get("data", {}).get("result", [])
+            except Exception as e:
+                logger.error(f"❌ 12306响应解析失败: {repr(e)}，原始内容: {resp.text}")
+                raise UpstreamError(f"12306响应解析失败: {repr(e)}\n原始内容: {resp.text}")
+            if payload.get("status") is False:
+                raise UpstreamError(f"12306返回错误: {payload.get('messages', '未知错误')}")
+            await self.train_resolver.record_rows(rows, train_date, from_code, to_code)
+            return rows
+        
+        return await self.left_ticket_cache.get_or_fetch(
+            key, lambda: self.inflight.do(("queryG",) + key, fetch),
+            stale_while_revalidate=self.cache_swr
+        )
+        
+    async def resolve_train_no(self, train_code: str, from_code: str, to_code: str,
+                               train_date: str) -> Optional[str]:
+        """
+        车次号转列车编号：优先查解析缓存，未命中时获取该区间余票数据（同样走余票缓存）。
+        找不到该车次时返回 None；上游请求失败时抛出 UpstreamError。
+        """
+        train_no = await self.train_resolver.lookup(train_code, train_date, from_code, to_code)
+        if train_no is not None:
+            return train_no
+        rows = await self.fetch_left_ticket_rows(from_code, to_code, train_date)
+        # 余票缓存命中时解析缓存可能已被淘汰，这里补录一次
+        await self.train_resolver.record_rows(rows, train_date, from_code, to_code)
+        return await self.train_resolver.lookup(train_code, train_date, from_code, to_code)
+
+    async def fetch_left_ticket_rows_batch(self, queries: Sequence[Tuple[str, str, str]],
+                                           purpose_codes: str = "ADULT",
+                                           concurrency: Optional[int] = None,
+                                           on_result: Optional[Callable[[int, Dict[str, Any]], Awaitable[None]]] = None
+                                           ) -> List[Dict[str, Any]]:
+        """
+        批量获取多组 (出发三字码, 到达三字码, 日期) 的余票原始数据。
+
+        各组查询并发执行（同时最多 concurrency 个上游请求），共享连接池、预热会话与缓存。
+        返回与 queries 顺序一致的结果列表，每项含 rows（成功时）或 error（失败原因），
+        单组失败不影响其他组。每组完成时（按完成顺序）调用 on_result(组序号, 结果)。
+        """
+        semaphore = asyncio.Semaphore(max(1, concurrency or self.batch_concurrency))
+
+        async def run(index: int, from_code: str, to_code: str, train_date: str) -> Dict[str, Any]:
+            result: Dict[str, Any] = {
+                "from_code": from_code, "to_code": to_code, "train_date": train_date,
+                "rows": None, "error": None
+            }
+            async with semaphore:
+                try:
+                    result["rows"] = await self.fetch_left_ticket_rows(from_code, to_code, train_date, purpose_codes)
+                except UpstreamError as e:
+                    result["error"] = str(e)
+                except httpx.HTTPError as e:
+                    logger.error(f"批量查询 {from_code}->{to_code} {train_date} 请求失败: {repr(e)}")
+                    result["error"] = f"请求12306失败: {repr(e)}"
+            if on_result:
+                await on_result(index, result)
+            return result
+
+        return list(await asyncio.gather(*(run(i, *q) for i, q in enumerate(queries))))
+
+    async def fetch_route_stations(self, train_no: str, from_code: str, to_code: str,
+                                   depart_date: str) -> Dict[str, Any]:
+        """获取 czxx/queryByTrainNo 的原始JSON（经停站，带时刻表缓存）
+
+        train_no 为官方列车编号；请求失败或被拦截时抛出 UpstreamError。
+        经停站与查询区间无关，缓存只按 (train_no, depart_date) 区分。
+        """
+        params = {
+            "train_no": train_no,
+            "from_station_telecode": from_code,
+            "to_station_telecode": to_code,
+            "depart_date": depart_date
+        }
+        
+        async def fetch() -> Dict[str, Any]:
+            resp = await self.session_pool.get(
+                ROUTE_URL, headers=XHR_HEADERS, params=params, timeout=8,
+                raise_for_status=False, endpoint="queryByTrainNo"
+            )
+            logger.info(f"12306 route query status: {resp.status_code}, url: {resp.url}")
+            # 检查HTTP状态码
+            if resp.status_code != 200:
+                logger.error(f"12306接口返回异常状态码: {resp.status_code}, body: {resp.text}")
+                raise UpstreamError(f"12306接口返回异常: {resp.status_code}")
+            # 检查是否被重定向到错误页面
+            if is_blocked_response(resp):
+                raise UpstreamError("12306反爬虫拦截，请稍后重试或更换网络环境。")
+            try:
+                json_data = resp.json()
+                logger.info(f"12306 response keys: {list(json_data.keys()) if json_data else 'None'}")
+            except Exception as e:
+                logger.error(f"12306响应解析失败: {str(e)}, body: {resp.text}")
+                raise UpstreamError(f"12306响应解析失败: {str(e)}")
+            return json_data
+        
+        key = ("queryByTrainNo", train_no, from_code, to_code, depart_date)
+        return await self.timetable_cache.get_or_fetch(
+            train_no, depart_date, lambda: self.inflight.do(key, fetch)
+        )
+
+    async def warm_timetables(self, limit: Optional[int] = None,
+                              concurrency: Optional[int] = None) -> Dict[str, Any]:
+        """
+        预取最近余票查询中出现过的车次的经停站，写入时刻表缓存。
+        已缓存的车次跳过；单个车次失败只计数，不中断预热。
+        """
+        settings = get_settings()
+        limit = limit if limit is not None else settings.timetable_warm_limit
+        trains = [
+            t for t in self.train_resolver.recent_trains(limit)
+            if not self.timetable_cache.contains(t["train_no"], t["train_date"])
+        ]
+        semaphore = asyncio.Semaphore(max(1, concurrency or self.batch_concurrency))
+        summary = {"candidates": len(trains), "fetched": 0, "failed": 0}
+
+        async def warm(train: Dict[str, str]):
+            async with semaphore:
+                try:
+                    await self.fetch_route_stations(
+                        train["train_no"], train["from_code"], train["to_code"], train["train_date"]
                     )
-                    
-                # 解析车票数据
-                tickets = self._parse_tickets(data.get('data', {}).get('result', []))
-                
-                return TicketSearchResult(
-                    tickets=tickets,
-                    query_info=query,
-                    total=len(tickets)
-                )
-                
-        except Exception as e:
-            logger.error(f"查询车票失败: {e}")
-            return TicketSearchResult(
-                tickets=[],
-                query_info=query,
-                total=0
+                    summary["fetched"] += 1
+                except (UpstreamError, httpx.HTTPError) as e:
+                    summary["failed"] += 1
+                    logger.warning(f"预热经停站失败 {train['train_code']} {train['train_date']}: {e}")
+
+        await asyncio.gather(*(warm(t) for t in trains))
+        logger.info(f"经停站预热完成: {summary}")
+        return summary
+        
+    async def fetch_transfer_page(self, from_code: str, to_code: str, train_date: str,
+                                  middle_station: str = "", is_show_wz: str = "N",
+                                  purpose_codes: str = "00", result_index: int = 0) -> List[Dict[str, Any]]:
+        """获取一页中转方案（middleList），请求失败或被拦截时抛出 UpstreamError"""
+        params = {
+            "train_date": train_date,
+            "from_station_telecode": from_code,
+            "to_station_telecode": to_code,
+            "middle_station": middle_station,
+            "result_index": str(result_index),
+            "can_query": "Y",
+            "isShowWZ": is_show_wz,
+            "purpose_codes": purpose_codes,
+            "channel": "E"
+        }
+        
+        async def fetch() -> List[Dict[str, Any]]:
+            resp = await self.session_pool.get(
+                TRANSFER_URL, headers=XHR_HEADERS, params=params, timeout=8,
+                raise_for_status=False, endpoint="transfer"
             )
+            # 检查反爬虫
+            if resp.status_code == 302 or is_blocked_response(resp):
+                raise UpstreamError("12306反爬虫拦截（302跳转），请稍后重试或更换网络环境。")
+            # 失败页不能当作空页，否则会被误判为最后一页
+            if resp.status_code != 200:
+                logger.error(f"12306中转接口返回异常: {resp.status_code}, body: {resp.text}")
+                raise UpstreamError(f"12306中转接口返回异常: {resp.status_code}")
+            try:
+                payload = resp.json()
+                plans = (payload.get("data") or {}).get("middleList", [])
+            except Exception as e:
+                logger.error(f"❌ 12306中转响应解析失败: {repr(e)}，原始内容: {resp.text}")
+                raise UpstreamError("12306反爬拦截或数据异常，请稍后重试")
+            if payload.get("status") is False:
+                raise UpstreamError(f"12306返回错误: {payload.get('messages', '未知错误')}")
+            return plans
+        
+        key = ("transfer",) + tuple(params.values())
+        # 分页预取被取消（已到最后一页）且无其他等待者时一并取消上游请求，不再消耗中转接口配额
+        return await self.inflight.do(key, fetch, cancel_abandoned=True)
+
+    async def fetch_transfer_plans(self, from_code: str, to_code: str, train_date: str,
+                                   middle_station: str = "", is_show_wz: str = "N",
+                                   purpose_codes: str = "00", max_plans: Optional[int] = None,
+                                   concurrency: Optional[int] = None,
+                                   on_page: Optional[Callable[[List[Dict[str, Any]]], Awaitable[None]]] = None
+                                   ) -> List[Dict[str, Any]]:
+        """
+        分页获取全部中转方案。
+
+        同时预取后续 concurrency 页（result_index 依次加 page_size），按页序合并结果；
+        遇到不足一页（或空页）即为最后一页，取消其后的预取请求：尚在排队或未返回的上游请求随之取消
+        （另有调用方在等待同一页时保留），已发出的请求仍计入限速。
+        设置 max_plans 时凑够方案数即提前停止。最后一页之前的任一页失败时抛出 UpstreamError。
+        每合并一页（已按 max_plans 截断）调用一次 on_page(该页方案)。
+        """
+        page_size = TRANSFER_PAGE_SIZE
+        window = max(1, concurrency or self.transfer_page_concurrency)
+        if max_plans is not None:
+            # 不为凑不到的方案数多发请求
+            window = min(window, max(1, -(-max_plans // page_size)))
+
+        def launch(result_index: int) -> asyncio.Task:
+            return asyncio.ensure_future(self.fetch_transfer_page(
+                from_code, to_code, train_date, middle_station,
+                is_show_wz, purpose_codes, result_index
+            ))
+
+        pages: Dict[int, asyncio.Task] = {}
+        next_index = 0
+        plans: List[Dict[str, Any]] = []
+        try:
+            for _ in range(window):
+                pages[next_index] = launch(next_index)
+                next_index += page_size
+            current = 0
+            while True:
+                page = await pages.pop(current)
+                last_page = len(page) < page_size
+                if max_plans is not None:
+                    page = page[:max_plans - len(plans)]
+                plans.extend(page)
+                if on_page and page:
+                    await on_page(page)
+                if last_page:
+                    break
+                if max_plans is not None and len(plans) >= max_plans:
+                    break
+                current += page_size
+                # 保持窗口内始终有 window 个页面在途
+                pages[next_index] = launch(next_index)
+                next_index += page_size
+        finally:
+            for task in pages.values():
+                task.cancel()
+        return plans
+        
+    async def query_ticket_rows(self, query: TicketQuery) -> List[TicketRow]:
+        """
+        查询车票（轻量路径）：返回解码后的余票记录，不构造 pydantic 模型。
+        车站无法识别时返回空列表；上游请求失败时抛出 UpstreamError。
+        """
+        from_code = await self.station_service.get_station_code(query.from_station)
+        to_code = await self.station_service.get_station_code(query.to_station)
+        if not from_code or not to_code:
+            logger.error(f"无法找到车站代码: {query.from_station} -> {query.to_station}")
+            return []
+        rows = await self.fetch_left_ticket_rows(
+            from_code, to_code, query.train_date, query.purpose_codes
+        )
+        return decode_rows(rows)
+
+    async def query_tickets(self, query: TicketQuery) -> TicketSearchResult:
+        """
+        查询车票（对外模型）：在轻量记录之上构造 pydantic 结果。
+        上游请求失败（含熔断、排队超时）时抛出 UpstreamError，不再当作无车次返回。
+        """
+        rows = await self.query_ticket_rows(query)
+        tickets = self._to_tickets(rows)
+        # 车票已在 _to_tickets 中整批校验过，这里不再逐个重新校验
+        return TicketSearchResult.model_construct(
+            tickets=tickets,
+            query_info=query,
+            total=len(tickets)
+        )
             
     def _parse_tickets(self, ticket_data: List[str]) -> List[Ticket]:
         """解析车票数据"""
-        tickets = []
-        
-        for ticket_str in ticket_data:
-            try:
-                # 12306返回的数据格式是用|分隔的字符串
-                parts = ticket_str.split('|')
-                
-                if len(parts) < 35:  # 确保有足够的字段
-                    continue
-                    
-                ticket = Ticket(
-                    train_no=parts[3],  # 车次
-                    from_station_name=parts[6],  # 出发站
-                    to_station_name=parts[7],  # 到达站
-                    start_time=parts[8],  # 出发时间
-                    arrive_time=parts[9],  # 到达时间
-                    duration=parts[10],  # 历时
-                    can_web_buy=parts[11],  # 是否可购买
-
-                    # 票价信息（暂为None，后续可补充真实票价）
-                    business_seat_price=None,
-                    first_class_price=None,
-                    second_class_price=None,
-                    soft_sleeper_price=None,
-                    hard_sleeper_price=None,
-                    soft_seat_price=None,
-                    hard_seat_price=None,
-                    no_seat_price=None,
-
-                    # 余票信息 - 根据12306实际字段位置调整
-                    business_seat_num=parts[32] if parts[32] != '' else None,  # 商务座余票
-                    first_class_num=parts[31] if parts[31] != '' else None,   # 一等座余票
-                    second_class_num=parts[30] if parts[30] != '' else None,  # 二等座余票
-                    soft_sleeper_num=parts[23] if parts[23] != '' else None,  # 软卧余票
-                    hard_sleeper_num=parts[28] if parts[28] != '' else None,  # 硬卧余票
-                    soft_seat_num=parts[24] if parts[24] != '' else None,     # 软座余票
-                    hard_seat_num=parts[29] if parts[29] != '' else None,     # 硬座余票
-                    no_seat_num=parts[26] if parts[26] != '' else None,       # 无座余票
-                )
-                
-                tickets.append(ticket)
-                
-            except (IndexError, ValueError) as e:
-                logger.warning(f"解析车票数据失败: {e}")
-                continue
-                
-        return tickets
+        return self._to_tickets(decode_rows(ticket_data))
+
+    @staticmethod
+    def _to_tickets(rows: List[TicketRow]) -> List[Ticket]:
+        """
+        余票记录转 Ticket 模型：整批交给 TypeAdapter 一次校验，不逐行调用模型构造函数；
+        票价暂无数据，沿用模型默认值 None。
+
+        这里有意保留校验而不用 Ticket.model_construct：整批校验在 pydantic-core 内一次完成，
+        实测（scripts/bench_ticket_models.py）比逐行 model_construct 更快，同时还能挡住上游字段异常。
+        """
+        return _TICKET_LIST.validate_python([
+            {
+                "train_no": row.train_code,  # 车次
+                "from_station_name": row.from_telecode,  # 出发站
+                "to_station_name": row.to_telecode,  # 到达站
+                "start_time": row.start_time,  # 出发时间
+                "arrive_time": row.arrive_time,  # 到达时间
+                "duration": row.duration,  # 历时
+                "can_web_buy": row.can_web_buy,  # 是否可购买
+                # 余票信息（空字符串表示该席别不售）
+                "business_seat_num": row.business_seat_num or None,  # 商务座余票
+                "first_class_num": row.first_class_num or None,   # 一等座余票
+                "second_class_num": row.second_class_num or None,  # 二等座余票
+                "soft_sleeper_num": row.soft_sleeper_num or None,  # 软卧余票
+                "hard_sleeper_num": row.hard_sleeper_num or None,  # 硬卧余票
+                "soft_seat_num": row.soft_seat_num or None,     # 软座余票
+                "hard_seat_num": row.hard_seat_num or None,     # 硬座余票
+                "no_seat_num": row.no_seat_num or None,       # 无座余票
+            }
+            for row in rows
+        ])
         
     async def get_ticket_price(self, train_no: str, from_station: str, 
                               to_station: str, train_date: str) -> dict:
@@ -141,9 +415,8 @@ class TicketService:
                 'train_date': train_date
             }
             
-            async with self.http_client:
-                response = await self.http_client.get(url, params=params)
-                return response.json()
+            response = await self.session_pool.get(url, params=params)
+            return response.json()
                 
         except Exception as e:
             logger.error(f"获取票价失败: {e}")
@@ -0,0 +1,60 @@
+"""列车经停站（时刻表）缓存"""
+
+import logging
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from mcp_12306.utils.config import get_settings
+from mcp_12306.utils.date_utils import seconds_until_midnight
+from .cache import TTLCache
+from .cache_backend import CacheBackend
+
+logger = logging.getLogger(__name__)
+
+
+def has_stops(json_data: Any) -> bool:
+    """queryByTrainNo 响应中是否含经停站（空结果不缓存）"""
+    if not isinstance(json_data, dict):
+        return False
+    data = json_data.get("data")
+    if not isinstance(data, dict):
+        return False
+    return bool(data.get("data") or data.get("middleList") or data.get("fullList") or data.get("route"))
+
+
+class TimetableCache:
+    """经停站缓存，key 为 (train_no, depart_date)
+
+    同一天内经停站几乎不变：条目在 ttl 与北京时间当天零点两者中较早者过期。
+    传入共享缓存后端时，内存未命中先查后端（重启后或其他 worker 已取到的数据），
+    均未命中才请求上游，结果同时写入两层。
+    """
+
+    def __init__(self, ttl: Optional[float] = None, max_entries: Optional[int] = None,
+                 backend: Optional[CacheBackend] = None):
+        settings = get_settings()
+        self.ttl = ttl if ttl is not None else settings.timetable_cache_ttl
+        self.cache = TTLCache(
+            ttl=self.ttl,
+            max_entries=max_entries if max_entries is not None else settings.timetable_cache_max_entries,
+            name="timetable",
+            backend=backend
+        )
+
+    def entry_ttl(self) -> float:
+        """本次写入条目的有效期：不跨过当天零点"""
+        return max(1.0, min(self.ttl, seconds_until_midnight()))
+
+    async def get_or_fetch(self, train_no: str, depart_date: str,
+                           fetch: Callable[[], Awaitable[Dict[str, Any]]]) -> Dict[str, Any]:
+        """读取缓存，未命中时调用 fetch；仅缓存含经停站的结果"""
+        return await self.cache.get_or_fetch(
+            (train_no, depart_date), fetch, stale_while_revalidate=False,
+            ttl=self.entry_ttl(), cacheable=has_stops
+        )
+
+    def contains(self, train_no: str, depart_date: str) -> bool:
+        """内存层是否已有该车次（不计入命中统计）"""
+        return self.cache.peek((train_no, depart_date)) is not None
+
+    def stats(self) -> Dict[str, Any]:
+        return self.cache.stats()
@@ -0,0 +1,77 @@
+"""车次号 -> 列车编号（train_no）解析缓存"""
+
+import logging
+from typing import Any, Dict, Iterable, List, Optional
+
+from mcp_12306.utils.config import get_settings
+from .cache import TTLCache
+from .cache_backend import CacheBackend
+from .ticket_rows import decode_rows
+
+logger = logging.getLogger(__name__)
+
+
+def train_codes_of(rows: Iterable[str]) -> List[str]:
+    """余票原始数据中出现的全部车次号（用于提示）"""
+    return [row.train_code for row in decode_rows(rows)]
+
+
+class TrainNoResolver:
+    """车次号到列车编号的解析缓存
+
+    key 为 (车次号, 日期, 出发三字码, 到达三字码)。每次解析 queryG 余票数据时
+    都会把其中的车次写入缓存（同时记录查询用的站码与该车次实际的上下车站码），
+    之后的经停站查询可直接命中，无需再请求上游。
+    """
+
+    def __init__(self, ttl: Optional[float] = None, max_entries: Optional[int] = None,
+                 backend: Optional[CacheBackend] = None):
+        settings = get_settings()
+        self.cache = TTLCache(
+            ttl=ttl if ttl is not None else settings.train_no_cache_ttl,
+            max_entries=max_entries if max_entries is not None else settings.train_no_cache_max_entries,
+            name="trainNo",
+            backend=backend
+        )
+
+    @staticmethod
+    def _key(train_code: str, train_date: str, from_code: str, to_code: str) -> tuple:
+        return train_code.strip().upper(), train_date, from_code, to_code
+
+    async def record_rows(self, rows: Iterable[str], train_date: str, from_code: str, to_code: str) -> int:
+        """从 queryG 原始数据中记录车次号与列车编号的对应关系，返回记录的车次数"""
+        entries = []
+        count = 0
+        for row in decode_rows(rows):
+            train_no = row.train_no.strip()
+            train_code = row.train_code.strip()
+            if not train_no or not train_code:
+                continue
+            entries.append((self._key(train_code, train_date, from_code, to_code), train_no))
+            if (row.from_telecode, row.to_telecode) != (from_code, to_code):
+                entries.append((self._key(train_code, train_date, row.from_telecode, row.to_telecode), train_no))
+            count += 1
+        # 一次批量写入，共享后端只产生一次事务
+        await self.cache.aset_many(entries)
+        return count
+
+    async def lookup(self, train_code: str, train_date: str, from_code: str, to_code: str) -> Optional[str]:
+        """查缓存（含共享后端），未命中返回 None"""
+        return await self.cache.aget(self._key(train_code, train_date, from_code, to_code))
+
+    def recent_trains(self, limit: int) -> List[Dict[str, str]]:
+        """最近记录过的车次（按 train_no + 日期去重，新的在前），供经停站预热使用"""
+        seen = set()
+        trains = []
+        for (train_code, train_date, from_code, to_code), train_no in reversed(self.cache.items()):
+            if (train_no, train_date) in seen:
+                continue
+            seen.add((train_no, train_date))
+            trains.append({"train_code": train_code, "train_no": train_no, "train_date": train_date,
+                           "from_code": from_code, "to_code": to_code})
+            if len(trains) >= limit:
+                break
+        return trains
+
+    def stats(self) -> Dict[str, Any]:
+        return self.cache.stats()
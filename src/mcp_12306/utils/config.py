@@ -19,6 +19,62 @@ class Settings(BaseSettings):
         description="用户代理字符串"
     )
     request_timeout: int = Field(default=30, description="请求超时时间（秒）")
+    upstream_base_url: str = Field(default="", description="替换12306地址（如本地模拟服务 http://127.0.0.1:9306），为空时请求官方地址")
+    http2_enabled: bool = Field(default=True, description="上游连接是否启用HTTP/2")
+    http_max_connections: int = Field(default=100, description="上游连接池最大连接数")
+    http_max_keepalive_connections: int = Field(default=20, description="上游连接池最大空闲keep-alive连接数")
+    http_keepalive_expiry: float = Field(default=30.0, description="空闲连接保活时间（秒）")
+    session_pool_size: int = Field(default=2, description="预热cookie会话数量")
+    session_ttl: float = Field(default=600.0, description="预热会话有效期（秒）")
+    session_refresh_margin: float = Field(default=60.0, description="会话过期前提前刷新的时间（秒）")
+    upstream_rate_limit_enabled: bool = Field(default=True, description="是否按接口限制上游请求速率与并发")
+    upstream_queryg_rate: float = Field(default=5.0, description="queryG 余票接口每秒请求数上限")
+    upstream_queryg_burst: int = Field(default=10, description="queryG 余票接口允许的突发请求数")
+    upstream_queryg_max_in_flight: int = Field(default=8, description="queryG 余票接口最大在途请求数")
+    upstream_transfer_rate: float = Field(default=2.0, description="中转查询接口每秒请求数上限")
+    upstream_transfer_burst: int = Field(default=4, description="中转查询接口允许的突发请求数")
+    upstream_transfer_max_in_flight: int = Field(default=4, description="中转查询接口最大在途请求数")
+    upstream_route_rate: float = Field(default=5.0, description="queryByTrainNo 经停站接口每秒请求数上限")
+    upstream_route_burst: int = Field(default=10, description="queryByTrainNo 经停站接口允许的突发请求数")
+    upstream_route_max_in_flight: int = Field(default=8, description="queryByTrainNo 经停站接口最大在途请求数")
+    upstream_queue_timeout: float = Field(default=10.0, description="等待上游请求配额的最长时间（秒），超时返回繁忙")
+    upstream_min_rate: float = Field(default=0.2, description="收到拦截响应后自动降速的下限（每秒请求数）")
+    upstream_backoff_factor: float = Field(default=0.5, description="收到拦截响应时速率乘以该系数")
+    upstream_recovery_step: float = Field(default=0.05, description="每个正常响应恢复的速率（每秒请求数）")
+    upstream_retry_attempts: int = Field(default=2, description="上游请求失败（拦截、5xx、连接异常）后的最多重试次数")
+    upstream_retry_base_delay: float = Field(default=0.2, description="重试退避的起始等待时间（秒）")
+    upstream_retry_max_delay: float = Field(default=2.0, description="重试退避的最长等待时间（秒）")
+    upstream_breaker_threshold: int = Field(default=5, description="连续失败多少次后熔断该接口")
+    upstream_breaker_reset_timeout: float = Field(default=30.0, description="熔断持续时间（秒），之后放行探测请求")
+    upstream_hedge_enabled: bool = Field(default=False, description="是否启用对冲请求：首个请求迟迟未返回时用另一个会话再发一次")
+    upstream_hedge_endpoints: str = Field(default="queryG", description="启用对冲的接口，逗号分隔")
+    upstream_hedge_percentile: float = Field(default=95.0, description="首个请求超过近期耗时的该百分位仍未返回时对冲")
+    upstream_hedge_delay: float = Field(default=1.0, description="耗时样本不足时发出对冲请求前等待的时间（秒）")
+    upstream_hedge_min_delay: float = Field(default=0.05, description="发出对冲请求前的最短等待时间（秒）")
+    upstream_hedge_max_ratio: float = Field(default=0.1, description="对冲请求占请求总数的上限比例")
+    mcp_session_store: str = Field(default="memory", description="MCP会话存储：memory（进程内）或 sqlite（同一台机器上的多worker共享，不跨主机）")
+    mcp_session_store_path: str = Field(default="data/cache.sqlite3", description="sqlite 会话存储的数据库文件路径")
+    mcp_session_ttl: float = Field(default=3600.0, description="MCP会话闲置过期时间（秒）")
+    mcp_session_max: int = Field(default=10000, description="MCP会话数上限，超过时淘汰最久未使用的会话")
+    mcp_session_sweep_interval: float = Field(default=60.0, description="过期MCP会话清理间隔（秒），0 表示不启动后台清理")
+    mcp_stream_tool_results: bool = Field(default=False, description="客户端接受 text/event-stream 时，批量余票与中转查询是否总以 SSE 流式返回；请求带 progressToken 时总是流式返回")
+    cache_backend: str = Field(default="memory", description="缓存后端：memory（进程内）或 sqlite（多worker共享）")
+    cache_backend_path: str = Field(default="data/cache.sqlite3", description="sqlite 缓存后端的数据库文件路径")
+    ticket_cache_ttl: float = Field(default=30.0, description="余票查询结果缓存时间（秒）")
+    ticket_cache_stale_ttl: float = Field(default=60.0, description="余票缓存过期后仍可先返回旧值的时间（秒）")
+    ticket_cache_swr: bool = Field(default=True, description="余票缓存是否启用 stale-while-revalidate")
+    ticket_cache_max_entries: int = Field(default=512, description="余票缓存最大条目数")
+    ticket_cache_max_bytes: int = Field(default=32 * 1024 * 1024, description="余票缓存内存上限（字节）")
+    train_no_cache_ttl: float = Field(default=6 * 3600.0, description="车次号到列车编号解析结果缓存时间（秒）")
+    train_no_cache_max_entries: int = Field(default=20000, description="车次号解析缓存最大条目数")
+    timetable_cache_ttl: float = Field(default=24 * 3600.0, description="经停站缓存时间上限（秒），同时不超过当天零点")
+    timetable_cache_max_entries: int = Field(default=4096, description="经停站内存缓存最大条目数")
+    timetable_warm_limit: int = Field(default=200, description="经停站预热时最多预取的车次数")
+    transfer_page_concurrency: int = Field(default=4, description="中转查询同时预取的分页数")
+    batch_query_concurrency: int = Field(default=4, description="批量余票查询的最大并发上游请求数")
+    batch_query_max_queries: int = Field(default=20, description="批量余票查询单次最多的查询组数")
+    station_reload_interval: float = Field(default=60.0, description="车站数据文件变化检查间隔（秒），0 表示不自动重载")
+    admin_token: str = Field(default="", description="管理接口令牌（请求头 X-Admin-Token），为空时不校验")
     log_level: str = Field(default="INFO", description="日志级别")
 
     model_config = SettingsConfigDict(
@@ -44,4 +44,13 @@ def get_tomorrow() -> str:
     """获取明天的日期"""
     from datetime import timedelta
     tomorrow = datetime.now() + timedelta(days=1)
-    return tomorrow.strftime("%Y-%m-%d")
\ No newline at end of file
+    return tomorrow.strftime("%Y-%m-%d")
+
+def seconds_until_midnight(timezone: str = "Asia/Shanghai") -> float:
+    """距离指定时区下一个零点的秒数"""
+    import pytz
+    from datetime import timedelta
+    tz = pytz.timezone(timezone)
+    now = datetime.now(tz)
+    midnight = tz.localize(datetime.combine(now.date() + timedelta(days=1), datetime.min.time()))
+    return (midnight - now).total_seconds()
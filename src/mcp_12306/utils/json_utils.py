@@ -0,0 +1,32 @@
+"""JSON 序列化工具
+
+安装了 orjson（可选依赖：pip install "mcp-12306[fast]"）时使用 orjson，否则退回标准库 json。
+两者输出一致：UTF-8、不转义中文、无多余空格。
+"""
+
+import json
+from typing import Any
+
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - 未安装可选依赖
+    orjson = None
+
+
+def dumps_bytes(obj: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def dumps(obj: Any) -> str:
+    return dumps_bytes(obj).decode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    """用 dumps_bytes 序列化的 JSONResponse，用于较大的工具调用结果"""
+
+    def render(self, content: Any) -> bytes:
+        return dumps_bytes(content)
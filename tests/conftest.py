@@ -0,0 +1,29 @@
+from pathlib import Path
+
+import pytest
+
+from fake_upstream import FakeUpstream
+
+STATION_JS = Path(__file__).resolve().parents[1] / "src" / "mcp_12306" / "resources" / "station_name.js"
+
+
+@pytest.fixture(scope="session")
+def fake_upstream():
+    fake = FakeUpstream()
+    try:
+        if not fake.wait_ready():
+            pytest.skip("模拟12306服务未能启动")
+        yield fake
+    finally:
+        fake.stop()
+
+
+@pytest.fixture(scope="session")
+def stations():
+    """为 server 的工具函数加载真实车站表（不读写快照）"""
+    from mcp_12306 import server
+    from mcp_12306.services.station_service import build_station_table
+
+    table = build_station_table(str(STATION_JS), use_snapshot=False)
+    server.station_service.set_stations(table.stations, table.source_digest)
+    return server.station_service
@@ -0,0 +1,79 @@
+"""测试用模拟12306：启动 scripts/fake_12306.py 子进程，并按 /_fake/config 场景构造上游服务"""
+
+import socket
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Optional
+
+import httpx
+
+from mcp_12306.services.http_client import HttpClient
+from mcp_12306.services.rate_limiter import UpstreamGovernor
+from mcp_12306.services.session_pool import SessionPool
+from mcp_12306.services.ticket_service import TicketService
+
+FAKE_SCRIPT = Path(__file__).resolve().parents[1] / "scripts" / "fake_12306.py"
+NO_FAULTS = dict(latency=0, slow_every=0, fail_first=0, block_first=0, block_every=0, error_every=0,
+                 transfer_plans=23)
+
+
+class FakeUpstream:
+    """模拟12306子进程；configure() 先清零请求序号再写入故障配置（未给出的项恢复为无故障）"""
+
+    def __init__(self):
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            port = sock.getsockname()[1]
+        self.base_url = f"http://127.0.0.1:{port}"
+        self.process = subprocess.Popen(
+            [sys.executable, str(FAKE_SCRIPT), "--port", str(port)],
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+
+    def wait_ready(self, timeout: float = 15) -> bool:
+        deadline = time.monotonic() + timeout
+        while self.process.poll() is None and time.monotonic() < deadline:
+            try:
+                httpx.get(f"{self.base_url}/_fake/stats", timeout=1)
+                return True
+            except httpx.HTTPError:
+                time.sleep(0.1)
+        return False
+
+    def stop(self):
+        self.process.terminate()
+        self.process.wait(timeout=10)
+
+    def configure(self, **faults):
+        httpx.post(f"{self.base_url}/_fake/reset")
+        httpx.post(f"{self.base_url}/_fake/config", json={**NO_FAULTS, **faults}).raise_for_status()
+
+    def stats(self) -> dict:
+        return httpx.get(f"{self.base_url}/_fake/stats").json()
+
+
+def make_pool(base_url: str, size: int = 2, governor: Optional[UpstreamGovernor] = None) -> SessionPool:
+    """指向模拟服务的会话池；默认关闭限流，重试退避缩短到毫秒级"""
+    client = HttpClient()
+    client.base_url = base_url
+    pool = SessionPool(client, size=size, governor=governor or UpstreamGovernor(enabled=False))
+    pool.retry_base_delay = 0.01
+    pool.retry_max_delay = 0.02
+    return pool
+
+
+def make_ticket_service(pool: SessionPool, station_service=None) -> TicketService:
+    """共用会话池的车票服务（不带共享缓存后端）"""
+    return TicketService(http_client=pool.http_client, session_pool=pool, station_service=station_service)
+
+
+async def with_pool(pool: SessionPool, scenario):
+    """预热会话池后执行 scenario(pool)，结束时停止会话池并关闭连接"""
+    await pool.start()
+    try:
+        return await scenario(pool)
+    finally:
+        await pool.stop()
+        await pool.http_client.close_session()
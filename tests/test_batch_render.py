@@ -0,0 +1,15 @@
+"""批量余票查询的 markdown 分组"""
+
+import asyncio
+
+from mcp_12306 import server
+
+
+def test_error_groups_are_separated_by_a_blank_line():
+    args = {"train_dates": ["2025-13-01", "bad"], "from_station": "北京", "to_station": "上海"}
+    text = asyncio.run(server.query_tickets_batch_validated(args))["content"][0]["text"]
+    sections = text.split("---\n\n")
+    assert len(sections) == 2
+    # --- 紧跟在文字行下会被渲染为 setext 标题，分隔线前必须是空行
+    assert all(section.endswith("\n\n") for section in sections)
+    assert "❌ 日期格式错误" in sections[0]
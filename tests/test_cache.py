@@ -0,0 +1,92 @@
+"""TTLCache 与共享后端"""
+
+import asyncio
+
+import pytest
+
+from mcp_12306.services import cache as cache_module
+from mcp_12306.services.cache import TTLCache
+from mcp_12306.services.cache_backend import CacheBackend, SqliteBackend
+
+
+class CountingBackend(SqliteBackend):
+    """记录租约相关调用次数的 sqlite 后端"""
+
+    def __init__(self, path):
+        super().__init__(path)
+        self.calls = {"acquire_lease": 0, "lease_held": 0, "get": 0}
+
+    async def acquire_lease(self, namespace, key, ttl):
+        self.calls["acquire_lease"] += 1
+        return await super().acquire_lease(namespace, key, ttl)
+
+    async def lease_held(self, namespace, key):
+        self.calls["lease_held"] += 1
+        return await super().lease_held(namespace, key)
+
+    async def get(self, namespace, key):
+        self.calls["get"] += 1
+        return await super().get(namespace, key)
+
+
+def test_concurrent_misses_share_one_load(tmp_path):
+    async def scenario():
+        backend = CountingBackend(str(tmp_path / "cache.sqlite3"))
+        cache = TTLCache(ttl=30, name="tickets", backend=backend)
+        fetches = []
+
+        async def fetch():
+            fetches.append(1)
+            await asyncio.sleep(0.05)
+            return ["row"]
+
+        results = await asyncio.gather(*(cache.get_or_fetch("k", fetch) for _ in range(10)))
+        backend.close()
+        return results, fetches, backend.calls
+
+    results, fetches, calls = asyncio.run(scenario())
+    assert results == [["row"]] * 10
+    assert len(fetches) == 1
+    assert calls["acquire_lease"] == 1
+
+
+def test_waiters_on_foreign_lease_poll_once_per_process(tmp_path, monkeypatch):
+    monkeypatch.setattr(cache_module, "LEASE_POLL_INTERVAL", 0.01)
+    path = str(tmp_path / "cache.sqlite3")
+
+    async def scenario():
+        # 另一个 worker 持有租约并在 0.1s 后写入结果
+        other = SqliteBackend(path)
+        assert await other.acquire_lease("tickets", "k", 10)
+        backend = CountingBackend(path)
+        cache = TTLCache(ttl=30, name="tickets", backend=backend)
+
+        async def fetch():
+            raise AssertionError("租约被其他 worker 持有时不应回源")
+
+        async def other_worker():
+            await asyncio.sleep(0.1)
+            await other.set("tickets", "k", ["row"], 30)
+            await other.release_lease("tickets", "k")
+
+        results, _ = await asyncio.gather(
+            asyncio.gather(*(cache.get_or_fetch("k", fetch) for _ in range(10))), other_worker()
+        )
+        other.close()
+        backend.close()
+        return results, backend.calls
+
+    results, calls = asyncio.run(scenario())
+    assert results == [["row"]] * 10
+    assert calls["acquire_lease"] == 1
+    # 只有一个协程轮询：约 0.1s / 0.01s 次，而不是 10 倍
+    assert calls["lease_held"] < 30
+
+
+def test_backend_interface_requires_get_and_set_many():
+    class PartialBackend(CacheBackend):
+        async def get(self, namespace, key):
+            return None
+
+    with pytest.raises(TypeError):
+        PartialBackend()
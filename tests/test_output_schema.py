@@ -0,0 +1,109 @@
+"""车票类工具 outputSchema 与 format=json 结构化结果一致"""
+
+import asyncio
+
+import pytest
+
+from fake_upstream import make_pool, make_ticket_service, with_pool
+from mcp_12306 import server
+from mcp_12306.services.ticket_rows import decode_rows
+
+from test_ticket_rows import make_row
+
+JSON_TYPES = {"string": str, "integer": int, "boolean": bool, "null": type(None), "object": dict, "array": list}
+
+
+def violations(value, schema, path="$"):
+    """按 outputSchema 用到的关键字（type/properties/required/additionalProperties/items）检查取值"""
+    types = schema.get("type", [])
+    types = [types] if isinstance(types, str) else types
+    if types and not any(isinstance(value, JSON_TYPES[t]) and not (t == "integer" and isinstance(value, bool))
+                         for t in types):
+        return [f"{path}: 期望 {types}，实际 {type(value).__name__}"]
+    problems = []
+    if isinstance(value, dict):
+        properties = schema.get("properties", {})
+        problems += [f"{path}: 缺少 {key}" for key in schema.get("required", []) if key not in value]
+        for key, item in value.items():
+            if key in properties:
+                problems += violations(item, properties[key], f"{path}.{key}")
+            elif schema.get("additionalProperties") is False:
+                problems.append(f"{path}: 多出 {key}")
+    if isinstance(value, list) and "items" in schema:
+        for i, item in enumerate(value):
+            problems += violations(item, schema["items"], f"{path}[{i}]")
+    return problems
+
+
+def output_schema(name):
+    return next(tool["outputSchema"] for tool in server.MCP_TOOLS if tool["name"] == name)
+
+
+def test_ticket_records_match_schema():
+    rows = decode_rows([make_row("G1", "09:00", "13:28", "04:28"), make_row("Z1", "22:00", "06:10", "08:10")])
+    records = asyncio.run(server.ticket_records(rows))
+    payload = {"from_station": "北京", "to_station": "上海", "train_date": "2030-01-01",
+               "total": len(records), "unfiltered_total": len(records), "trains": records}
+    assert records[0]["seats"] == {"second_class": "有"}
+    assert violations(payload, output_schema("query-tickets")) == []
+
+
+def test_batch_structured_result_matches_schema():
+    args = {"train_dates": ["2025-13-01"], "from_station": "北京", "to_station": "上海", "format": "json"}
+    result = asyncio.run(server.query_tickets_batch_validated(args))
+    assert result["structuredContent"]["groups"][0]["error"]
+    assert violations(result["structuredContent"], output_schema("query-tickets-batch")) == []
+
+
+def test_transfer_records_match_schema():
+    segment = {"station_train_code": "G1", "from_station_name": "北京南", "to_station_name": "南京南",
+               "start_time": "09:00", "arrive_time": "12:00", "lishi": "03:00", "ze_num": "有", "wz_num": "--"}
+    plan = {"middle_station_name": "南京南", "wait_time": "30分钟", "all_lishi": "05:00",
+            "fullList": [segment, {**segment, "station_train_code": "D5", "from_station_name": "南京南"}]}
+    records = server.transfer_records([plan])
+    payload = {"from_station": "北京", "to_station": "上海", "train_date": "2030-01-01",
+               "total": len(records), "plans": records}
+    assert violations(payload, output_schema("query-transfer")) == []
+    assert violations({**payload, "total": "1"}, output_schema("query-transfer")) == ["$.total: 期望 ['integer']，实际 str"]
+
+
+def call_tool(fake_upstream, monkeypatch, name, arguments):
+    """经 execute_tool_call 调用工具，车票服务指向模拟12306"""
+    pool = make_pool(fake_upstream.base_url)
+    monkeypatch.setattr(server, "ticket_service", make_ticket_service(pool))
+    response = asyncio.run(with_pool(pool, lambda _: server.execute_tool_call(1, name, arguments)))
+    return response["result"]
+
+
+@pytest.mark.parametrize("name, arguments", [
+    ("query-tickets", {"from_station": "北京", "to_station": "上海", "train_date": "2030-02-01"}),
+    ("query-tickets", {"from_station": "北京", "to_station": "上海", "train_date": "2030-02-01", "train_types": ["X"]}),
+    ("query-tickets-batch", {"train_dates": ["2030-02-02", "2030-13-01"], "from_station": "北京", "to_station": "上海"}),
+    ("query-transfer", {"from_station": "北京", "to_station": "上海", "train_date": "2030-02-03", "max_plans": 5}),
+])
+def test_markdown_results_also_carry_structured_content(fake_upstream, stations, monkeypatch, name, arguments):
+    fake_upstream.configure()
+    result = call_tool(fake_upstream, monkeypatch, name, arguments)
+    assert result["isError"] is False
+    assert not result["content"][0]["text"].startswith("{")
+    assert violations(result["structuredContent"], output_schema(name)) == []
+
+
+@pytest.mark.parametrize("name, arguments", [
+    ("query-tickets", {"from_station": "北京", "to_station": "上海", "train_date": "2030-02-04", "sort_by": "depart"}),
+    ("query-tickets", {"from_station": "北京", "to_station": "上海", "train_date": "2030-02-04", "depart_after": "25:00"}),
+    ("query-tickets-batch", {"train_dates": []}),
+    ("query-transfer", {"from_station": "北京", "to_station": "上海", "train_date": "2030-02-04", "max_plans": 0}),
+])
+def test_validation_failures_are_errors(fake_upstream, stations, monkeypatch, name, arguments):
+    result = call_tool(fake_upstream, monkeypatch, name, arguments)
+    assert result["isError"] is True
+    assert "structuredContent" not in result
+    assert result["content"][0]["text"].startswith("❌")
+
+
+def test_upstream_failure_is_an_error(fake_upstream, stations, monkeypatch):
+    fake_upstream.configure(error_every=1)
+    result = call_tool(fake_upstream, monkeypatch, "query-tickets",
+                       {"from_station": "北京", "to_station": "上海", "train_date": "2030-02-05", "format": "json"})
+    assert result["isError"] is True and "structuredContent" not in result
@@ -0,0 +1,150 @@
+"""上游限流：FIFO 排队、排队超时、AIMD 降速与恢复、排队统计"""
+
+import asyncio
+
+import httpx
+import pytest
+
+from fake_upstream import make_pool, with_pool
+from mcp_12306.services import rate_limiter
+from mcp_12306.services.rate_limiter import EndpointLimiter, RateLimitExceeded, UpstreamGovernor
+
+
+def make_limiter(rate=1000.0, burst=100, max_in_flight=1, queue_timeout=5.0,
+                 min_rate=1.0, backoff_factor=0.5, recovery_step=1.0) -> EndpointLimiter:
+    return EndpointLimiter("test", rate, burst, max_in_flight, queue_timeout=queue_timeout,
+                           min_rate=min_rate, backoff_factor=backoff_factor, recovery_step=recovery_step)
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_waiters_are_served_in_arrival_order():
+    limiter = make_limiter(max_in_flight=1)
+    served = []
+
+    async def request(i):
+        async with limiter.acquire():
+            served.append(i)
+            await asyncio.sleep(0.005)
+
+    async def scenario():
+        tasks = []
+        for i in range(5):
+            tasks.append(asyncio.ensure_future(request(i)))
+            await asyncio.sleep(0)
+        await asyncio.gather(*tasks)
+
+    run(scenario())
+    assert served == [0, 1, 2, 3, 4]
+    snapshot = limiter.snapshot()
+    assert snapshot["max_queue_depth"] == 5 and snapshot["queue_depth"] == 0 and snapshot["in_flight"] == 0
+    assert snapshot["acquired"] == 5
+    # 后到的请求等前面的请求释放名额，平均等待时间大于 0
+    assert snapshot["max_wait_ms"] >= 10 and snapshot["avg_wait_ms"] > 0
+
+
+def test_queue_deadline_raises_rate_limit_exceeded():
+    limiter = make_limiter(max_in_flight=1, queue_timeout=0.05)
+
+    async def hold():
+        async with limiter.acquire():
+            await asyncio.sleep(0.3)
+
+    async def scenario():
+        holder = asyncio.ensure_future(hold())
+        await asyncio.sleep(0)
+        with pytest.raises(RateLimitExceeded):
+            async with limiter.acquire():
+                pass
+        await holder
+
+    run(scenario())
+    assert limiter.stats["rejected"] == 1 and limiter.queued == 0
+
+
+def test_token_bucket_spaces_requests_beyond_burst():
+    limiter = make_limiter(rate=20.0, burst=1, max_in_flight=10)
+
+    async def scenario():
+        for _ in range(3):
+            async with limiter.acquire():
+                pass
+
+    run(scenario())
+    # 令牌用完后按 20 req/s 放行，第 2、3 个请求各等约 50ms
+    assert limiter.stats["max_wait_ms"] >= 30
+
+
+def test_blocked_response_halves_rate_once_per_cooldown_then_recovers(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(rate_limiter.time, "monotonic", lambda: now[0])
+    limiter = make_limiter(rate=10.0, burst=5, max_in_flight=5, min_rate=1.0, backoff_factor=0.5,
+                           recovery_step=1.0)
+
+    async def request(blocked=False):
+        async with limiter.acquire() as permit:
+            permit.blocked = blocked
+
+    async def scenario():
+        await request(blocked=True)
+        after_first = limiter.rate
+        # 冷却期内的连续拦截只计数，不再降速
+        await request(blocked=True)
+        after_second = limiter.rate
+        now[0] += 10
+        rates = []
+        for _ in range(8):
+            limiter.tokens = limiter.burst
+            await request()
+            rates.append(limiter.rate)
+        return after_first, after_second, rates
+
+    after_first, after_second, rates = run(scenario())
+    assert after_first == 5.0 and after_second == 5.0
+    assert limiter.stats["blocked"] == 2 and limiter.stats["backoffs"] == 1
+    # 每个正常完成的请求加回 recovery_step，直到配置的上限
+    assert rates == [6.0, 7.0, 8.0, 9.0, 10.0, 10.0, 10.0, 10.0]
+
+
+def test_rate_never_drops_below_min_rate(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(rate_limiter.time, "monotonic", lambda: now[0])
+    limiter = make_limiter(rate=4.0, burst=10, max_in_flight=5, min_rate=1.0, backoff_factor=0.5)
+
+    async def scenario():
+        for _ in range(5):
+            async with limiter.acquire() as permit:
+                permit.blocked = True
+            now[0] += 2
+
+    run(scenario())
+    assert limiter.rate == 1.0 and limiter.stats["backoffs"] == 5
+
+
+def test_fake_upstream_blocks_slow_down_the_endpoint(fake_upstream):
+    governor = UpstreamGovernor(enabled=True)
+    limiter = governor.limiters["queryG"] = make_limiter(rate=50.0, burst=20, max_in_flight=2, min_rate=1.0)
+    pool = make_pool(fake_upstream.base_url, governor=governor)
+    pool.retry_attempts = 0
+    params = {"leftTicketDTO.train_date": "2030-05-01", "leftTicketDTO.from_station": "BJP",
+              "leftTicketDTO.to_station": "SHH", "purpose_codes": "ADULT"}
+
+    async def scenario(pool):
+        statuses = []
+        for _ in range(4):
+            try:
+                response = await pool.get("https://kyfw.12306.cn/otn/leftTicket/queryG", params=params,
+                                          endpoint="queryG", raise_for_status=False)
+                statuses.append(response.status_code)
+            except httpx.HTTPError:
+                statuses.append("error")
+        return statuses, governor.snapshot()["queryG"]
+
+    # 每第 2 个请求被 302 拦截
+    fake_upstream.configure(block_every=2)
+    statuses, snapshot = asyncio.run(with_pool(pool, scenario))
+    assert fake_upstream.stats()["outcomes"]["queryG:blocked"] == 2
+    assert limiter.stats["blocked"] == 2 and limiter.stats["backoffs"] >= 1
+    assert snapshot["rate"] < 50.0 and snapshot["acquired"] == 4
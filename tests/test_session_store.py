@@ -0,0 +1,182 @@
+"""MCP 会话存储：过期、touch、淘汰、后台清理与多实例共享"""
+
+import asyncio
+
+import pytest
+
+from mcp_12306.services import session_store as store_module
+from mcp_12306.services.session_store import (
+    MemorySessionStore, SessionJanitor, SessionStore, SqliteSessionStore,
+)
+
+
+class FakeClock:
+    """替换会话存储模块里的 time，monotonic 与墙钟共用一个可手动推进的时间"""
+
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def monotonic(self):
+        return self.now
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(store_module, "time", fake)
+    return fake
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def make_store(request, tmp_path):
+    stores = []
+
+    def make(ttl=100.0, max_sessions=10, path=None):
+        if request.param == "memory":
+            store = MemorySessionStore(ttl, max_sessions)
+        else:
+            store = SqliteSessionStore(str(path or tmp_path / "sessions.sqlite3"), ttl, max_sessions)
+        stores.append(store)
+        return store
+
+    yield make
+    for store in stores:
+        store.close()
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_store_interface_is_abstract():
+    with pytest.raises(TypeError):
+        SessionStore(60)
+
+
+def test_idle_session_expires_and_is_swept(clock, make_store):
+    store = make_store(ttl=100)
+
+    async def scenario():
+        await store.create("a", {"client": "x"})
+        await store.create("b", {"client": "y"})
+        clock.now += 60
+        assert await store.get("b") == {"client": "y"}
+        clock.now += 60
+        # a 闲置 120s 已过期，b 在 60s 时被使用过
+        return await store.get("a"), await store.count(), await store.sweep(), await store.count()
+
+    missing, active, _, remaining = run(scenario())
+    assert missing is None
+    assert active == 1 and remaining == 1
+    # 进程内存储在 get 时即清理过期会话，sqlite 由 sweep 清理，两者都只计一次
+    assert store.stats["expired"] == 1
+
+
+def test_get_touches_session(clock, make_store):
+    store = make_store(ttl=100)
+
+    async def scenario():
+        await store.create("a", {})
+        for _ in range(5):
+            clock.now += 80
+            assert await store.get("a") is not None
+        assert await store.update("a", protocol="2025-03-26")
+        clock.now += 101
+        return await store.get("a")
+
+    assert run(scenario()) is None
+
+
+def test_update_and_delete(clock, make_store):
+    store = make_store()
+
+    async def scenario():
+        await store.create("a", {"client": "x"})
+        assert await store.update("a", initialized=True)
+        assert not await store.update("missing", initialized=True)
+        info = await store.get("a")
+        assert await store.delete("a") and not await store.delete("a")
+        return info
+
+    assert run(scenario()) == {"client": "x", "initialized": True}
+
+
+def test_least_recently_used_session_is_evicted(clock, make_store):
+    store = make_store(max_sessions=2)
+
+    async def scenario():
+        await store.create("a", {})
+        clock.now += 30
+        await store.create("b", {})
+        clock.now += 30
+        await store.get("a")
+        clock.now += 1
+        await store.create("c", {})
+        return [await store.get(sid) is not None for sid in ("a", "b", "c")]
+
+    assert run(scenario()) == [True, False, True]
+    assert store.stats["evicted"] == 1
+
+
+def test_sqlite_sessions_are_shared_between_instances(clock, tmp_path):
+    path = str(tmp_path / "shared.sqlite3")
+    worker_a = SqliteSessionStore(path, ttl=100)
+    worker_b = SqliteSessionStore(path, ttl=100)
+
+    async def scenario():
+        await worker_a.create("s1", {"client": "x"})
+        seen_by_b = await worker_b.get("s1")
+        await worker_b.update("s1", initialized=True)
+        updated_in_a = await worker_a.get("s1")
+        # b 刷新了最后使用时间，a 看到的会话同样未过期
+        clock.now += 90
+        await worker_b.get("s1")
+        clock.now += 90
+        alive_in_a = await worker_a.get("s1")
+        await worker_a.delete("s1")
+        return seen_by_b, updated_in_a, alive_in_a, await worker_b.get("s1")
+
+    try:
+        seen_by_b, updated_in_a, alive_in_a, deleted = run(scenario())
+    finally:
+        worker_a.close()
+        worker_b.close()
+    assert seen_by_b == {"client": "x"}
+    assert updated_in_a == {"client": "x", "initialized": True}
+    assert alive_in_a is not None
+    assert deleted is None
+
+
+def test_janitor_sweeps_periodically_and_stops(clock):
+    store = MemorySessionStore(ttl=10)
+    janitor = SessionJanitor(store, interval=0.01)
+
+    async def scenario():
+        await store.create("a", {})
+        await store.create("b", {})
+        clock.now += 11
+        await janitor.start()
+        for _ in range(100):
+            if store.stats["expired"] == 2:
+                break
+            await asyncio.sleep(0.01)
+        task = janitor._task
+        await janitor.stop()
+        return task
+
+    task = run(scenario())
+    assert store.stats["expired"] == 2 and len(store._sessions) == 0
+    assert task.cancelled() and janitor._task is None
+
+
+def test_janitor_disabled_with_zero_interval():
+    janitor = SessionJanitor(MemorySessionStore(ttl=10), interval=0)
+
+    async def scenario():
+        await janitor.start()
+        return janitor._task
+
+    assert run(scenario()) is None
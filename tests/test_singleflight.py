@@ -0,0 +1,89 @@
+"""并发请求合并"""
+
+import asyncio
+
+from mcp_12306.services.singleflight import SingleFlight
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_concurrent_calls_share_one_flight():
+    async def scenario():
+        flight = SingleFlight()
+        calls = []
+
+        async def fetch():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return "ok"
+
+        results = await asyncio.gather(*(flight.do("k", fetch) for _ in range(5)))
+        return results, calls, flight.stats()
+
+    results, calls, stats = run(scenario())
+    assert results == ["ok"] * 5
+    assert len(calls) == 1
+    assert stats["leaders"] == 1 and stats["shared"] == 4 and stats["in_flight"] == 0
+
+
+def test_cancelled_caller_keeps_flight_by_default():
+    async def scenario():
+        flight = SingleFlight()
+        finished = asyncio.Event()
+
+        async def fetch():
+            await asyncio.sleep(0.02)
+            finished.set()
+
+        caller = asyncio.ensure_future(flight.do("k", fetch))
+        await asyncio.sleep(0)
+        caller.cancel()
+        await asyncio.wait_for(finished.wait(), 1)
+        return flight.stats()
+
+    assert run(scenario())["abandoned"] == 0
+
+
+def test_last_waiter_cancel_abandons_flight():
+    async def scenario():
+        flight = SingleFlight()
+        started = asyncio.Event()
+        upstream_cancelled = asyncio.Event()
+
+        async def fetch():
+            started.set()
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                upstream_cancelled.set()
+                raise
+
+        caller = asyncio.ensure_future(flight.do("k", fetch, cancel_abandoned=True))
+        await started.wait()
+        caller.cancel()
+        await asyncio.wait_for(upstream_cancelled.wait(), 1)
+        await asyncio.sleep(0)
+        return flight.stats()
+
+    stats = run(scenario())
+    assert stats["abandoned"] == 1 and stats["in_flight"] == 0
+
+
+def test_flight_survives_while_other_waiters_remain():
+    async def scenario():
+        flight = SingleFlight()
+
+        async def fetch():
+            await asyncio.sleep(0.02)
+            return "ok"
+
+        first = asyncio.ensure_future(flight.do("k", fetch, cancel_abandoned=True))
+        second = asyncio.ensure_future(flight.do("k", fetch, cancel_abandoned=True))
+        await asyncio.sleep(0)
+        first.cancel()
+        return await second, flight.stats()
+
+    result, stats = run(scenario())
+    assert result == "ok" and stats["abandoned"] == 0
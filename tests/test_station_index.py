@@ -0,0 +1,35 @@
+"""车站模糊搜索索引"""
+
+from mcp_12306.services.station_index import StationSearchIndex
+from mcp_12306.services.station_service import Station
+
+STATIONS = [
+    Station("北京北", "VAP", "beijingbei", "bjb", "1", "北京"),
+    Station("北京南", "VNP", "beijingnan", "bjn", "2", "北京"),
+    Station("南京", "NJH", "nanjing", "nj", "3", "南京"),
+    Station("北京", "BJP", "beijing", "bj", "4", "北京"),
+    Station("北京西", "BXP", "beijingxi", "bjx", "5", "北京"),
+]
+
+
+def names(hits):
+    return [station.name for station, _ in hits]
+
+
+def test_exact_match_comes_first():
+    hits = StationSearchIndex(STATIONS).search("北京", limit=3)
+    assert names(hits)[0] == "北京" and hits[0][1] == 1.0
+
+
+def test_fuzzy_matches_ranked_by_score_before_limit():
+    # 前缀匹配的“南京”比中间匹配的“北京南”得分高，即使加载顺序靠后也要排在前面
+    hits = StationSearchIndex(STATIONS).search("南", limit=1)
+    assert names(hits) == ["南京"]
+    scores = [score for _, score in StationSearchIndex(STATIONS).search("jing", limit=10)]
+    assert scores == sorted(scores, reverse=True)
+
+
+def test_equal_scores_keep_load_order():
+    hits = StationSearchIndex(STATIONS).search("京北", limit=10)
+    assert names(hits) == ["北京北"]
+    assert names(StationSearchIndex(STATIONS).search("bj", limit=10))[1:] == ["北京北", "北京南", "北京西"]
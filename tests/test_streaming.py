@@ -0,0 +1,69 @@
+"""tools/call 流式返回：progressToken + Accept: text/event-stream 时的 SSE 事件顺序"""
+
+import asyncio
+import json
+
+import httpx
+
+from fake_upstream import make_pool, make_ticket_service, with_pool
+from mcp_12306 import server
+
+TRANSFER_CALL = {
+    "jsonrpc": "2.0", "id": 7, "method": "tools/call",
+    "params": {
+        "name": "query-transfer",
+        "arguments": {"from_station": "北京", "to_station": "上海", "train_date": "2030-04-01", "format": "json"},
+    },
+}
+
+
+def post_mcp(fake_upstream, monkeypatch, body, headers):
+    pool = make_pool(fake_upstream.base_url)
+    monkeypatch.setattr(server, "ticket_service", make_ticket_service(pool))
+
+    async def scenario(_):
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://mcp.test") as client:
+            init = await client.post("/mcp", json={"jsonrpc": "2.0", "id": 1, "method": "initialize", "params": {}})
+            session = {"Mcp-Session-Id": init.headers["mcp-session-id"]}
+            return await client.post("/mcp", json=body, headers={**headers, **session})
+
+    return asyncio.run(with_pool(pool, scenario))
+
+
+def sse_messages(text):
+    return [json.loads(line[len("data: "):]) for line in text.splitlines() if line.startswith("data: ")]
+
+
+def test_transfer_streams_progress_partials_then_response(fake_upstream, stations, monkeypatch):
+    fake_upstream.configure(transfer_plans=23)
+    body = {**TRANSFER_CALL, "params": {**TRANSFER_CALL["params"], "_meta": {"progressToken": "tok-1"}}}
+    response = post_mcp(fake_upstream, monkeypatch, body,
+                        {"Accept": "application/json, text/event-stream"})
+    assert response.headers["content-type"].startswith("text/event-stream")
+
+    messages = sse_messages(response.text)
+    kinds = [message.get("method", "response") for message in messages]
+    assert kinds == ["notifications/progress", "notifications/message"] * 3 + ["response"]
+
+    progress = [m["params"] for m in messages if m.get("method") == "notifications/progress"]
+    assert [p["progress"] for p in progress] == [1, 2, 3]
+    assert all(p["progressToken"] == "tok-1" for p in progress)
+
+    partials = [m["params"]["data"] for m in messages if m.get("method") == "notifications/message"]
+    assert all(p["type"] == "partial_result" for p in partials)
+    assert [len(p["structuredContent"]["plans"]) for p in partials] == [10, 10, 3]
+
+    final = messages[-1]
+    assert final["id"] == 7 and final["result"]["isError"] is False
+    plans = final["result"]["structuredContent"]["plans"]
+    # 最终结果与各部分结果按页序拼接一致
+    assert plans == [plan for p in partials for plan in p["structuredContent"]["plans"]]
+
+
+def test_without_progress_token_returns_plain_json(fake_upstream, stations, monkeypatch):
+    fake_upstream.configure(transfer_plans=5)
+    response = post_mcp(fake_upstream, monkeypatch, TRANSFER_CALL,
+                        {"Accept": "application/json, text/event-stream"})
+    assert response.headers["content-type"].startswith("application/json")
+    assert response.json()["result"]["structuredContent"]["total"] == 5
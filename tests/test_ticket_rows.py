@@ -0,0 +1,66 @@
+"""余票行解码与筛选"""
+
+from mcp_12306.services.ticket_rows import TicketFilter, arrive_offset, decode_rows
+
+
+def make_row(code, start, arrive, duration, second_class="有"):
+    parts = [""] * 40
+    parts[2] = f"24000{code}00"
+    parts[3] = code
+    parts[6:8] = ["BJP", "SHH"]
+    parts[8:12] = [start, arrive, duration, "Y"]
+    parts[30] = second_class
+    return "|".join(parts)
+
+
+ROWS = decode_rows([
+    make_row("Z1", "22:00", "06:10", "08:10"),  # 次日到达
+    make_row("G1", "09:00", "13:28", "04:28"),
+    make_row("G3", "14:00", "18:00", "04:00", second_class="无"),
+    make_row("K9", "06:00", "20:00", "14:00"),
+])
+
+
+def codes(rows):
+    return [row.train_code for row in rows]
+
+
+def test_decode_skips_short_rows():
+    assert codes(decode_rows(["a|b|c", make_row("G1", "09:00", "13:28", "04:28")])) == ["G1"]
+
+
+def test_arrive_offset_crosses_midnight():
+    overnight = ROWS[0]
+    assert arrive_offset(overnight) == (22 * 60) + (8 * 60 + 10)
+    assert arrive_offset(ROWS[1]) == 13 * 60 + 28
+
+
+def test_arrive_before_excludes_next_day_arrival():
+    assert codes(TicketFilter(arrive_before="08:00").apply(ROWS)) == []
+    assert codes(TicketFilter(arrive_before="20:00").apply(ROWS)) == ["G1", "G3", "K9"]
+
+
+def test_arrive_after_keeps_next_day_arrival():
+    assert codes(TicketFilter(arrive_after="19:00").apply(ROWS)) == ["Z1", "K9"]
+
+
+def test_sort_by_arrive_time_puts_overnight_last():
+    assert codes(TicketFilter(sort_by="arrive_time").apply(ROWS)) == ["G1", "G3", "K9", "Z1"]
+
+
+def test_sort_by_duration_and_limit():
+    assert codes(TicketFilter(sort_by="duration", limit=2).apply(ROWS)) == ["G3", "G1"]
+
+
+def test_train_types_depart_window_and_seats():
+    flt = TicketFilter(train_types=("G", "Z"), depart_after="08:00", seat_classes=("second_class",))
+    assert codes(flt.apply(ROWS)) == ["Z1", "G1"]
+
+
+def test_to_tickets_validates_rows():
+    from mcp_12306.services.ticket_service import TicketService
+
+    tickets = TicketService._to_tickets(ROWS[:2])
+    assert [t.train_no for t in tickets] == ["Z1", "G1"]
+    assert tickets[0].second_class_num == "有" and tickets[0].business_seat_num is None
+    assert tickets[1].second_class_price is None and tickets[1].can_web_buy == "Y"
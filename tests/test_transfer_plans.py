@@ -0,0 +1,95 @@
+"""中转方案分页：对 scripts/fake_12306.py 的 transfer_plans 与故障注入"""
+
+import asyncio
+
+import pytest
+
+from fake_upstream import make_pool, make_ticket_service, with_pool
+from mcp_12306.services.http_client import UpstreamError
+from mcp_12306.services.rate_limiter import EndpointLimiter, UpstreamGovernor
+
+
+def serial_governor() -> UpstreamGovernor:
+    """中转接口同时只放行一个请求，其余预取页在限流队列中排队"""
+    governor = UpstreamGovernor(enabled=True)
+    governor.limiters["transfer"] = EndpointLimiter(
+        "transfer", rate=1000, burst=100, max_in_flight=1, queue_timeout=5,
+        min_rate=1, backoff_factor=0.5, recovery_step=1
+    )
+    return governor
+
+
+def fetch_plans(fake_upstream, retry_attempts=None, governor=None, **kwargs):
+    """在模拟12306上执行 fetch_transfer_plans，返回 (方案, 每次 on_page 的方案数, 车票服务)"""
+    pool = make_pool(fake_upstream.base_url, governor=governor)
+    if retry_attempts is not None:
+        pool.retry_attempts = retry_attempts
+    service = make_ticket_service(pool)
+    page_sizes = []
+
+    async def on_page(page):
+        page_sizes.append(len(page))
+
+    async def scenario(_):
+        plans = await service.fetch_transfer_plans("BJP", "SHH", "2030-03-01", on_page=on_page, **kwargs)
+        return plans, page_sizes, service
+
+    return asyncio.run(with_pool(pool, scenario))
+
+
+def middle_stations(plans):
+    return [plan["middle_station_name"] for plan in plans]
+
+
+def test_pages_merge_in_order_when_responses_arrive_out_of_order(fake_upstream):
+    # 每第 2 个请求慢 0.3s，后面的页先返回，合并结果仍按页序
+    fake_upstream.configure(transfer_plans=23, slow_every=2, slow_latency=0.3)
+    plans, page_sizes, _ = fetch_plans(fake_upstream, concurrency=3)
+    assert middle_stations(plans) == [f"中转站{i}" for i in range(23)]
+    assert page_sizes == [10, 10, 3]
+
+
+@pytest.mark.parametrize("total, calls", [(23, 3), (20, 3), (7, 1)])
+def test_short_or_empty_page_is_the_last_page(fake_upstream, total, calls):
+    fake_upstream.configure(transfer_plans=total)
+    plans, _, _ = fetch_plans(fake_upstream, concurrency=1)
+    assert len(plans) == total
+    assert fake_upstream.stats()["calls"]["transfer"] == calls
+
+
+def test_trailing_prefetches_are_cancelled_before_reaching_upstream(fake_upstream):
+    # 第一页就不足一页，排在限流队列里的 3 个预取页随之取消，不再发往上游
+    fake_upstream.configure(transfer_plans=5)
+    plans, _, service = fetch_plans(fake_upstream, governor=serial_governor(), concurrency=4)
+    assert len(plans) == 5
+    assert fake_upstream.stats()["calls"]["transfer"] == 1
+    assert service.inflight.stats()["abandoned"] == 3
+
+
+def test_max_plans_caps_window_and_truncates(fake_upstream):
+    fake_upstream.configure(transfer_plans=100)
+    plans, page_sizes, _ = fetch_plans(fake_upstream, max_plans=5, concurrency=4)
+    # 5 个方案一页即可凑够，只发一次请求
+    assert middle_stations(plans) == [f"中转站{i}" for i in range(5)] and page_sizes == [5]
+    assert fake_upstream.stats()["calls"]["transfer"] == 1
+
+    fake_upstream.configure(transfer_plans=100)
+    governor = serial_governor()
+    plans, page_sizes, _ = fetch_plans(fake_upstream, governor=governor, max_plans=15, concurrency=4)
+    assert len(plans) == 15 and page_sizes == [10, 5]
+    # 窗口按 max_plans 收窄为 2 页，排队的预取页从未超过 2 个
+    assert governor.limiters["transfer"].stats["max_queue_depth"] <= 2
+
+
+def test_failed_first_page_raises_instead_of_empty_result(fake_upstream):
+    fake_upstream.configure(error_every=1)
+    with pytest.raises(UpstreamError):
+        fetch_plans(fake_upstream)
+
+
+def test_failed_middle_page_is_not_read_as_last_page(fake_upstream):
+    # 第 2 页（第 2 次请求）返回 502 且不重试：应报错，而不是只返回第 1 页的 10 个方案
+    fake_upstream.configure(error_every=2)
+    with pytest.raises(UpstreamError):
+        fetch_plans(fake_upstream, retry_attempts=0, concurrency=1)
+    assert fake_upstream.stats()["outcomes"]["transfer:error"] == 1
@@ -0,0 +1,118 @@
+"""上游重试、熔断、拦截作废与对冲：对 scripts/fake_12306.py 注入故障"""
+
+import asyncio
+import time
+
+import httpx
+import pytest
+
+from fake_upstream import make_pool, make_ticket_service, with_pool
+from mcp_12306 import server
+from mcp_12306.models.ticket import TicketQuery
+from mcp_12306.services.http_client import UpstreamError
+from mcp_12306.services.resilience import CircuitOpenError
+from mcp_12306.services.session_pool import SessionPool
+
+QUERY_URL = "https://kyfw.12306.cn/otn/leftTicket/queryG"
+
+
+async def query(pool: SessionPool, train_date: str, **kwargs) -> httpx.Response:
+    params = {"leftTicketDTO.train_date": train_date, "leftTicketDTO.from_station": "BJP",
+              "leftTicketDTO.to_station": "SHH", "purpose_codes": "ADULT"}
+    return await pool.get(QUERY_URL, params=params, endpoint="queryG", **kwargs)
+
+
+def test_retries_5xx_until_success(fake_upstream):
+    async def scenario(pool):
+        fake_upstream.configure(fail_first=2)
+        response = await query(pool, "2030-01-01")
+        return response.status_code, pool.stats["retries"]
+
+    status, retries = asyncio.run(with_pool(make_pool(fake_upstream.base_url), scenario))
+    assert status == 200
+    assert retries == 2
+    assert fake_upstream.stats()["outcomes"] == {"queryG:error": 2, "queryG:ok": 1}
+
+
+def test_breaker_opens_and_fails_fast(fake_upstream):
+    async def scenario(pool):
+        pool.retry_attempts = 0
+        pool.breaker_threshold = 3
+        fake_upstream.configure(error_every=1)
+        statuses = [(await query(pool, "2030-01-02", raise_for_status=False)).status_code for _ in range(3)]
+        with pytest.raises(CircuitOpenError):
+            await query(pool, "2030-01-02")
+        return statuses, pool.breaker("queryG").snapshot()
+
+    statuses, breaker = asyncio.run(with_pool(make_pool(fake_upstream.base_url), scenario))
+    assert statuses == [502, 502, 502]
+    assert breaker["state"] == "open" and breaker["rejected"] == 1
+    # 熔断后的请求没有发到上游
+    assert fake_upstream.stats()["calls"]["queryG"] == 3
+
+
+def test_blocked_session_is_invalidated_and_replaced(fake_upstream):
+    async def scenario(pool):
+        fake_upstream.configure(block_first=1)
+        blocked_ids = {session.id for session in pool.sessions}
+        response = await query(pool, "2030-01-03")
+        await pool._fill_task
+        return response.status_code, pool.stats, blocked_ids, [s for s in pool.sessions if s.valid]
+
+    status, stats, original_ids, sessions = asyncio.run(with_pool(make_pool(fake_upstream.base_url), scenario))
+    assert status == 200
+    assert stats["invalidated"] == 1 and stats["retries"] == 1
+    # 作废的会话已由后台任务补回，池仍满员
+    assert len(sessions) == 2
+    assert len({s.id for s in sessions} - original_ids) == 1
+    assert fake_upstream.stats()["calls"]["init"] == 1
+
+
+def test_hedge_wins_over_slow_primary(fake_upstream):
+    async def scenario(pool):
+        pool.hedge_enabled = True
+        policy = pool.hedge_policies["queryG"]
+        policy.fallback_delay = 0.05
+        policy.min_delay = 0.01
+        # 第 2 个请求（首发）变慢 2s，对冲请求（第 3 个）正常返回
+        fake_upstream.configure(slow_every=2, slow_latency=2.0)
+        await query(pool, "2030-01-04")
+        started = time.monotonic()
+        response = await query(pool, "2030-01-05")
+        return response.status_code, time.monotonic() - started, policy.stats
+
+    status, elapsed, stats = asyncio.run(with_pool(make_pool(fake_upstream.base_url), scenario))
+    assert status == 200
+    assert elapsed < 1.0
+    assert stats["fired"] == 1 and stats["won"] == 1
+
+
+def test_query_tickets_raises_upstream_errors(fake_upstream, stations):
+    pool = make_pool(fake_upstream.base_url)
+    pool.retry_attempts = 0
+    service = make_ticket_service(pool, stations)
+
+    async def scenario(_):
+        await service.query_tickets(TicketQuery(from_station="北京", to_station="上海", train_date="2030-01-06"))
+
+    fake_upstream.configure(error_every=1)
+    with pytest.raises(UpstreamError):
+        asyncio.run(with_pool(pool, scenario))
+
+
+def test_train_no_tool_reports_open_breaker(fake_upstream, stations, monkeypatch):
+    pool = make_pool(fake_upstream.base_url)
+    pool.retry_attempts = 0
+    pool.breaker_threshold = 1
+    monkeypatch.setattr(server, "ticket_service", make_ticket_service(pool))
+    arguments = {"train_code": "G1", "from_station": "BJP", "to_station": "SHH", "train_date": "2030-01-07"}
+
+    async def scenario(_):
+        first = await server.execute_tool_call(1, "get-train-no-by-train-code", arguments)
+        second = await server.execute_tool_call(2, "get-train-no-by-train-code", arguments)
+        return first["result"], second["result"]
+
+    fake_upstream.configure(error_every=1)
+    first, second = asyncio.run(with_pool(pool, scenario))
+    assert first["isError"] and "502" in first["content"][0]["text"]
+    assert second["isError"] and "熔断中" in second["content"][0]["text"]